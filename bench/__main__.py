@@ -0,0 +1,174 @@
+# bench/__main__.py
+#
+# Offline latency benchmark for the voice pipeline:
+#
+#     python -m bench [scenario.json] [--repeat N] [--update-baseline]
+#
+# Runs the real pipeline (main.run_voice_agent: AudioProcessor, ReactAgent,
+# tools, TTS and playback) against a virtual audio device and local mock
+# services, then reports p50/p95/p99 latency per stage from the traces and
+# exits with status 1 if it is slower than the scenario's baseline.
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from rich.console import Console
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from bench.mock_services import MockServices
+from bench.scenario import Scenario
+
+console = Console()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Offline latency benchmark of the voice pipeline.")
+    parser.add_argument(
+        "scenario", nargs="?", default=os.path.join(BENCH_DIR, "scenarios", "file_tasks.json"),
+        help="scenario file (default: bench/scenarios/file_tasks.json)",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="play the scenario's turns this many times")
+    parser.add_argument("--speed", type=float, default=1.0, help="run the virtual microphone and speaker this many times faster than real time")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the mock services' jitter and failures")
+    parser.add_argument("--baseline", help="baseline file (default: bench/baselines/<scenario>.json)")
+    parser.add_argument("--update-baseline", action="store_true", help="save this run as the new baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown over the baseline, as a fraction (default: 0.2)")
+    parser.add_argument("--slack-ms", type=float, default=25.0, help="allowed slowdown in milliseconds on top of the tolerance")
+    parser.add_argument("--turn-timeout", type=float, default=60.0, help="give up if no turn finishes for this many seconds")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    return parser.parse_args()
+
+
+def prepare_environment(scenario: Scenario, services: MockServices) -> str:
+    """
+    Points the app at a throwaway home and cache directory and at the mock
+    services. Must run before core.config is imported.
+    """
+    workdir = tempfile.mkdtemp(prefix="voicer-bench-")
+    home = os.path.join(workdir, "home")
+    os.makedirs(home)
+    scenario.write_files(home)
+    os.environ["HOME"] = home
+    os.environ["VOICER_CACHE_DIR"] = os.path.join(workdir, "cache")
+    os.environ["TRANSCRIPTION_BACKEND"] = "huggingface"
+    for key in ("ELEVEN_API_KEY", "HUGGINGFACE_API_KEY", "OPENROUTER_API_KEY"):
+        # The mocks ignore the keys; real ones must never reach them.
+        os.environ[key] = "bench"
+    for service, url in services.urls().items():
+        os.environ[f"VOICER_{service.upper()}_URL"] = url
+    os.chdir(home)
+    return workdir
+
+
+def apply_config(overrides: dict):
+    """Applies the scenario's config overrides before the pipeline modules import them."""
+    import core.config as config
+
+    for key, value in overrides.items():
+        if not hasattr(config, key):
+            raise SystemExit(f"Unknown config setting in scenario: {key}")
+        setattr(config, key, value)
+    return config
+
+
+async def run_pipeline(run_voice_agent, microphone, tracer, turns: int, turn_timeout: float, session_id: str):
+    """Runs the voice agent until every scripted turn has been answered."""
+    task = asyncio.create_task(run_voice_agent(session_id=session_id))
+    finished, last_progress = 0, time.monotonic()
+    try:
+        while not (microphone.done and tracer.finished_turns >= turns):
+            if task.done():
+                task.result()
+                raise RuntimeError("The voice agent stopped before the scenario finished.")
+            if tracer.finished_turns != finished:
+                finished, last_progress = tracer.finished_turns, time.monotonic()
+            elif time.monotonic() - last_progress > turn_timeout:
+                raise TimeoutError(f"No turn finished within {turn_timeout:.0f} s (after {finished} of {turns} turns).")
+            await asyncio.sleep(0.1)
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def main():
+    args = parse_args()
+    scenario = Scenario(args.scenario)
+    # Resolved now, as the run changes into its own working directory.
+    baseline_path = os.path.abspath(args.baseline or os.path.join(BENCH_DIR, "baselines", f"{scenario.name}.json"))
+    output_path = os.path.abspath(args.output) if args.output else None
+    scenario.turns *= max(1, args.repeat)
+    services = MockServices(scenario, seed=args.seed)
+    services.start()
+    workdir = prepare_environment(scenario, services)
+    config = apply_config(scenario.config)
+
+    from bench import virtual_audio
+    from bench.report import collect, compare, load_traces, render, summarize
+    from core.tracing import get_tracer
+
+    tracer = get_tracer()
+    microphone = virtual_audio.VirtualMicrophone(
+        scenario, config.DEFAULT_SAMPLE_RATE, ready=lambda index: tracer.finished_turns >= index, seed=args.seed,
+    )
+    virtual_audio.install(microphone, speed=args.speed)
+    import main as app
+
+    console.print(f"[bold]Benchmark '{scenario.name}': {len(scenario.turns)} turns, working directory {workdir}[/bold]")
+    started = time.monotonic()
+    try:
+        asyncio.run(run_pipeline(
+            app.run_voice_agent, microphone, tracer, len(scenario.turns), args.turn_timeout, f"bench-{scenario.name}",
+        ))
+    except (RuntimeError, TimeoutError) as e:
+        console.print(f"[bold red]Benchmark failed: {e}[/bold red]")
+        sys.exit(2)
+    finally:
+        services.stop()
+    elapsed = time.monotonic() - started
+
+    turns, spans = load_traces(config.TRACE_PATH)
+    summary = summarize(collect(turns, spans))
+    baseline = None
+    if not args.update_baseline and os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    console.print(render(summary, baseline, title=f"{scenario.name}: {len(turns)} turns in {elapsed:.1f} s"))
+    stats = services.stats()
+    console.print("Mock requests: " + ", ".join(f"{service} {s['requests']} ({s['failures']} failed)" for service, s in stats.items()))
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump({"scenario": scenario.name, "turns": len(turns), "metrics": summary, "requests": stats}, f, indent=2)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump({name: {key: row[key] for key in ("p50", "p95", "p99")} for name, row in summary.items()}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        console.print(f"Saved the baseline to {baseline_path}.")
+        return
+    if baseline is None:
+        console.print("No baseline to compare with; run with --update-baseline to save one.")
+        return
+    regressions = compare(summary, baseline, args.tolerance, args.slack_ms)
+    for name, key, expected, current in regressions:
+        console.print(f"[bold red]Regression: {name} {key} {current:.0f} ms (baseline {expected:.0f} ms)[/bold red]")
+    if regressions:
+        sys.exit(1)
+    console.print("[bold green]No regressions against the baseline.[/bold green]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+# bench/mock_services.py
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+
+class ServiceProfile:
+    """
+    How a mock service behaves, read from the scenario's "services" section.
+    - `latency_ms` ± `jitter_ms`: time to the response (or its first byte).
+    - `failure_rate`: share of requests answered with a 503, which the
+      clients retry like a real outage.
+    - Service-specific options, e.g. `token_interval_ms` for OpenRouter.
+    """
+    def __init__(self, latency_ms: float = 100, jitter_ms: float = 0, failure_rate: float = 0.0, seed: int = 0, **options):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.failure_rate = failure_rate
+        self.options = options
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        with self._lock:
+            return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def fails(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def option(self, name: str, default):
+        return self.options.get(name, default)
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    """Shared plumbing: keep-alive, request bodies, injected latency and failures."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        # Connection pre-warming.
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self.do_HEAD()
+
+    def do_POST(self):
+        body = self._read_body()
+        server = self.server
+        server.count("requests")
+        time.sleep(server.profile.delay())
+        if server.profile.fails():
+            server.count("failures")
+            self._send_json({"error": "Injected failure"}, status=503)
+            return
+        self.respond(body)
+
+    def respond(self, body: bytes):
+        raise NotImplementedError
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(body)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _send_json(self, payload: dict, status: int = 200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, chunks, content_type: str, interval: float):
+        """Sends `chunks` with chunked transfer encoding, `interval` seconds apart."""
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, chunk in enumerate(chunks):
+            if i and interval:
+                time.sleep(interval)
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class _MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, scenario, profile: ServiceProfile):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.scenario = scenario
+        self.profile = profile
+        self.stats = {"requests": 0, "failures": 0}
+        self._stats_lock = threading.Lock()
+
+    def count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+# --- Hugging Face ---
+
+class _HuggingFaceHandler(_MockHandler):
+    """Whisper transcription: answers with the transcript of the turn being spoken."""
+    def respond(self, body: bytes):
+        # Transcription takes longer for longer audio (16-bit mono WAV; a
+        # compressed upload is timed as if it were 16 kHz WAV).
+        is_wav = body[:4] == b"RIFF" and len(body) > 44
+        sample_rate = int.from_bytes(body[24:28], "little") if is_wav else 16000
+        audio_seconds = max(0, len(body) - 44) / 2 / max(sample_rate, 1)
+        time.sleep(self.server.profile.option("per_audio_second_ms", 0) / 1000 * audio_seconds)
+        scenario = self.server.scenario
+        self._send_json({"text": scenario.turn(scenario.current).transcript})
+
+
+# --- OpenRouter ---
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class _OpenRouterHandler(_MockHandler):
+    """
+    OpenAI-compatible chat completions, replayed from the scenario's LLM script.
+    The scripted turn is found by the last user message; the step within it
+    is the number of assistant messages since then.
+    """
+    def respond(self, body: bytes):
+        request = json.loads(body)
+        message = self._scripted_message(request)
+        usage = {
+            "prompt_tokens": _estimate_tokens(json.dumps(request.get("messages", []))),
+            "completion_tokens": _estimate_tokens(json.dumps(message)),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": request.get("model", "mock")}
+        if not request.get("stream"):
+            self._send_json({
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+            return
+        interval = self.server.profile.option("token_interval_ms", 15) / 1000
+        events = [
+            {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            for delta in self._deltas(message)
+        ]
+        events.append({**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]})
+        if (request.get("stream_options") or {}).get("include_usage"):
+            events.append({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        chunks = [f"data: {json.dumps(event)}\n\n".encode() for event in events]
+        chunks.append(b"data: [DONE]\n\n")
+        self._send_stream(chunks, "text/event-stream", interval)
+
+    def _scripted_message(self, request: dict) -> dict:
+        messages = request.get("messages", [])
+        user_index = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=None)
+        turn = None
+        if user_index is not None:
+            content = messages[user_index].get("content")
+            if isinstance(content, list):
+                content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+            turn = self.server.scenario.find_turn(content or "")
+        if turn is None:
+            if not request.get("tools"):
+                # Not an agent step, e.g. the memory summarizing older turns.
+                return {"role": "assistant", "content": "The user asked about their files and got answers."}
+            scenario = self.server.scenario
+            turn = scenario.turn(scenario.current)
+        step = sum(1 for m in messages[user_index + 1:] if m.get("role") == "assistant") if user_index is not None else 0
+        scripted = turn.llm[min(step, len(turn.llm) - 1)]
+        message = {"role": "assistant", "content": scripted.get("content")}
+        if scripted.get("tool_calls"):
+            message["tool_calls"] = [
+                {
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": json.dumps(call.get("args", {}))},
+                }
+                for call in scripted["tool_calls"]
+            ]
+        return message
+
+    def _deltas(self, message: dict):
+        yield {"role": "assistant", "content": ""}
+        # Stream the reply a word at a time, roughly like tokens.
+        for word in re.findall(r"\S+\s*", message.get("content") or ""):
+            yield {"content": word}
+        for index, call in enumerate(message.get("tool_calls") or []):
+            yield {"tool_calls": [{"index": index, "id": call["id"], "type": "function", "function": {"name": call["function"]["name"], "arguments": ""}}]}
+            yield {"tool_calls": [{"index": index, "function": {"arguments": call["function"]["arguments"]}}]}
+
+
+# --- ElevenLabs ---
+
+class _ElevenLabsHandler(_MockHandler):
+    """
+    Text to speech: 16-bit PCM as long as the text would take to say, sent in
+    chunks faster than real time like the streaming endpoint.
+    """
+    def respond(self, body: bytes):
+        text = json.loads(body).get("text", "")
+        output_format = parse_qs(urlparse(self.path).query).get("output_format", ["pcm_22050"])[0]
+        codec, _, rate = output_format.partition("_")
+        sample_rate = int(rate) if codec == "pcm" and rate.isdigit() else 22050
+        profile = self.server.profile
+        seconds = max(0.3, len(text) * profile.option("seconds_per_character", 0.06))
+        t = np.arange(int(seconds * sample_rate)) / sample_rate
+        pcm = (0.1 * np.sin(2 * np.pi * 180 * t) * 32767).astype(np.int16).tobytes()
+        chunk_bytes = int(sample_rate * profile.option("chunk_ms", 100) / 1000) * 2
+        chunks = [pcm[i:i + chunk_bytes] for i in range(0, len(pcm), chunk_bytes)]
+        self._send_stream(chunks, "audio/pcm", profile.option("chunk_interval_ms", 20) / 1000)
+
+
+class MockServices:
+    """
+    Local stand-ins for Hugging Face, OpenRouter and ElevenLabs, each on its
+    own port. `urls()` gives the base URLs to put in VOICER_*_URL.
+    """
+    _handlers = {
+        "huggingface": (_HuggingFaceHandler, ""),
+        "openrouter": (_OpenRouterHandler, "/api/v1"),
+        "elevenlabs": (_ElevenLabsHandler, ""),
+    }
+
+    def __init__(self, scenario, seed: int = 0):
+        self.servers = {}
+        for offset, (service, (handler, _)) in enumerate(self._handlers.items()):
+            profile = ServiceProfile(seed=seed + offset, **scenario.services.get(service, {}))
+            self.servers[service] = _MockServer(handler, scenario, profile)
+
+    def start(self):
+        for server in self.servers.values():
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def urls(self) -> dict:
+        return {service: server.url + self._handlers[service][1] for service, server in self.servers.items()}
+
+    def stats(self) -> dict:
+        return {service: dict(server.stats) for service, server in self.servers.items()}
+
+    def stop(self):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,97 @@
+# bench/report.py
+
+import json
+
+from rich.table import Table
+
+from core.tracing import SUMMARY_STAGES, percentile
+
+PERCENTILES = (50, 95, 99)
+# Percentiles compared against the baseline; p99 of a short run is too noisy to gate on.
+CHECKED_PERCENTILES = ("p50", "p95")
+
+
+def load_traces(path: str) -> tuple[list, list]:
+    """The turn and span records of a traces.jsonl file."""
+    turns, spans = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            (turns if record["type"] == "turn" else spans).append(record)
+    return turns, spans
+
+
+def collect(turns: list, spans: list) -> dict:
+    """
+    Latency samples in milliseconds per metric:
+    - each stage's total per turn (e.g. all LLM calls of a turn), as in the
+      session report;
+    - a few per-call metrics: "stt.request", "llm.ttft" and "tts.ttfb";
+    - end to end: "response" (end of the utterance to the first reply audio)
+      and "turn" (the whole turn).
+    """
+    samples = {}
+    for turn in turns:
+        for name, stage in turn["stages"].items():
+            samples.setdefault(name, []).append(stage["ms"])
+        if turn.get("response_ms") is not None:
+            samples.setdefault("response", []).append(turn["response_ms"])
+        samples.setdefault("turn", []).append(turn["duration_ms"])
+    turn_ids = {turn["turn_id"] for turn in turns}
+    for span in spans:
+        if span["turn_id"] not in turn_ids:
+            continue
+        attributes = span.get("attributes") or {}
+        if span["name"] == "llm" and attributes.get("ttft_ms") is not None:
+            samples.setdefault("llm.ttft", []).append(attributes["ttft_ms"])
+        if span["name"] == "tts" and attributes.get("ttfb_ms") is not None:
+            samples.setdefault("tts.ttfb", []).append(attributes["ttfb_ms"])
+    return samples
+
+
+def summarize(samples: dict) -> dict:
+    return {
+        name: {"count": len(values), **{f"p{q}": round(percentile(values, q), 1) for q in PERCENTILES}}
+        for name, values in samples.items() if values
+    }
+
+
+def _order(name: str):
+    """Pipeline stages first, then their sub-metrics, then end to end."""
+    stage = name.split(".")[0]
+    if name in ("response", "turn"):
+        return (2, name)
+    return (0, SUMMARY_STAGES.index(stage), name) if stage in SUMMARY_STAGES else (1, name)
+
+
+def compare(summary: dict, baseline: dict, tolerance: float, slack_ms: float) -> list:
+    """
+    Metrics slower than the baseline by more than `tolerance` (a fraction)
+    plus `slack_ms`, as (metric, percentile, baseline ms, current ms).
+    """
+    regressions = []
+    for name, expected in baseline.items():
+        current = summary.get(name)
+        if current is None:
+            continue
+        for key in CHECKED_PERCENTILES:
+            if key in expected and current[key] > expected[key] * (1 + tolerance) + slack_ms:
+                regressions.append((name, key, expected[key], current[key]))
+    return regressions
+
+
+def render(summary: dict, baseline: dict | None = None, title: str = "Benchmark") -> Table:
+    table = Table(title=title)
+    table.add_column("Metric")
+    table.add_column("n", justify="right")
+    for q in PERCENTILES:
+        table.add_column(f"p{q} (ms)", justify="right")
+    if baseline:
+        table.add_column("baseline p95", justify="right")
+    for name in sorted(summary, key=_order):
+        row = summary[name]
+        cells = [name, str(row["count"]), *(f"{row[f'p{q}']:.0f}" for q in PERCENTILES)]
+        if baseline:
+            cells.append(f"{baseline[name]['p95']:.0f}" if name in baseline and "p95" in baseline[name] else "")
+        table.add_row(*cells)
+    return table
@@ -0,0 +1,117 @@
+# bench/scenario.py
+
+import json
+import os
+import threading
+import wave
+
+import numpy as np
+from scipy.signal import resample_poly
+
+# Rough speaking rate used to size synthesized utterances.
+_SECONDS_PER_CHARACTER = 0.065
+
+
+class ScenarioTurn:
+    """
+    One scripted user turn.
+    - `transcript`: what the user says; the mock Hugging Face service returns it.
+    - `audio`: a WAV fixture (relative to the scenario file). Without one, a
+      speech-like signal of a matching length is synthesized.
+    - `llm`: the model's replies, in order: {"content": ...} or
+      {"tool_calls": [{"name": ..., "args": {...}}]}.
+    """
+    def __init__(self, spec: dict, base_dir: str):
+        self.transcript = spec["transcript"]
+        self.audio = os.path.join(base_dir, spec["audio"]) if spec.get("audio") else None
+        self.llm = spec.get("llm") or [{"content": "Done."}]
+
+
+class Scenario:
+    """
+    A scripted session: workspace files, user turns, service latencies and
+    config overrides. The virtual microphone moves `current` forward as it
+    plays each turn, which tells the mock services what to answer.
+    """
+    def __init__(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            spec = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(path))
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.description = spec.get("description", "")
+        self.config = spec.get("config", {})
+        self.services = spec.get("services", {})
+        self.files = spec.get("files", {})
+        self.pause_seconds = spec.get("pause_seconds", 1.0)
+        self.turns = [ScenarioTurn(turn, base_dir) for turn in spec["turns"]]
+        self._current = 0
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> int:
+        with self._lock:
+            return self._current
+
+    @current.setter
+    def current(self, index: int):
+        with self._lock:
+            self._current = index
+
+    def turn(self, index: int) -> ScenarioTurn:
+        return self.turns[index % len(self.turns)]
+
+    def find_turn(self, text: str) -> ScenarioTurn | None:
+        """The turn whose transcript is `text`, e.g. the user message of an LLM request."""
+        text = text.strip()
+        for turn in self.turns:
+            if turn.transcript == text:
+                return turn
+        return None
+
+    def write_files(self, root: str):
+        for relative, content in self.files.items():
+            path = os.path.join(root, relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+
+
+# --- Fixtures ---
+
+def synthesize_speech(text: str, sample_rate: int, seed: int = 0) -> np.ndarray:
+    """
+    A deterministic, voice-like int16 signal as long as `text` would take to
+    say: a wandering pitch with a few harmonics, modulated at syllable rate.
+    It passes the energy VAD like speech; its content doesn't matter because
+    the mock transcription service answers from the script.
+    """
+    rng = np.random.default_rng(seed)
+    seconds = max(0.8, len(text) * _SECONDS_PER_CHARACTER)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140 + 25 * np.sin(2 * np.pi * 0.7 * t + rng.uniform(0, np.pi))
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 5))
+    syllables = 0.55 + 0.45 * np.sin(2 * np.pi * 4.0 * t + rng.uniform(0, np.pi))
+    ramp = np.minimum(1.0, np.minimum(t, seconds - t) / 0.05)
+    signal = 0.25 * voice * syllables * ramp + rng.normal(0, 0.003, t.size)
+    return (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+
+
+def read_wav(path: str, sample_rate: int) -> np.ndarray:
+    """Reads a 16-bit PCM WAV fixture as mono int16 at `sample_rate`."""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV fixtures are supported.")
+        channels, rate = f.getnchannels(), f.getframerate()
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    audio = samples.reshape(-1, channels).astype(np.float32).mean(axis=1)
+    if rate != sample_rate:
+        divisor = np.gcd(rate, sample_rate)
+        audio = resample_poly(audio, sample_rate // divisor, rate // divisor)
+    return np.clip(audio, -32768, 32767).astype(np.int16)
+
+
+def load_utterance(turn: ScenarioTurn, sample_rate: int, seed: int) -> np.ndarray:
+    if turn.audio is not None:
+        return read_wav(turn.audio, sample_rate)
+    return synthesize_speech(turn.transcript, sample_rate, seed)
@@ -0,0 +1,181 @@
+# bench/virtual_audio.py
+
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+
+from .scenario import load_utterance
+
+
+class CallbackAbort(Exception):
+    pass
+
+
+class CallbackStop(Exception):
+    pass
+
+
+class VirtualMicrophone:
+    """
+    What the virtual input device hears: quiet background noise, with the
+    scenario's utterances spoken one at a time.
+    - Utterance i starts once `ready(i)` is true (the previous turn has been
+      answered) and the scenario's pause has passed, like a user waiting for
+      the reply before speaking again.
+    - Time only passes while an input stream is open, as audio captured with
+      no stream open would be lost on a real device.
+    """
+    def __init__(self, scenario, sample_rate: int, ready, noise_db: float = -65.0, seed: int = 0):
+        self.scenario = scenario
+        self.sample_rate = sample_rate
+        self.ready = ready
+        self.utterances = [load_utterance(turn, sample_rate, seed + i) for i, turn in enumerate(scenario.turns)]
+        self.index = 0
+        self._noise = np.random.default_rng(seed)
+        self._noise_level = 32768 * 10 ** (noise_db / 20)
+        self._pause = None
+        self._position = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        with self._lock:
+            return self.index >= len(self.utterances)
+
+    def read(self, frames: int) -> np.ndarray:
+        """The next `frames` samples, shaped (frames, 1) like a mono int16 input block."""
+        block = np.clip(self._noise.normal(0, self._noise_level, frames), -32768, 32767).astype(np.int16)
+        with self._lock:
+            filled = 0
+            while filled < frames and self.index < len(self.utterances):
+                if self._position is None:
+                    if self._pause is None:
+                        if not self.ready(self.index):
+                            break
+                        self._pause = int(self.scenario.pause_seconds * self.sample_rate)
+                    skip = min(self._pause, frames - filled)
+                    self._pause -= skip
+                    filled += skip
+                    if self._pause:
+                        break
+                    self._position = 0
+                    self.scenario.current = self.index
+                utterance = self.utterances[self.index]
+                count = min(len(utterance) - self._position, frames - filled)
+                block[filled:filled + count] = utterance[self._position:self._position + count]
+                self._position += count
+                filled += count
+                if self._position == len(utterance):
+                    self.index += 1
+                    self._position = None
+                    self._pause = None
+        return block.reshape(-1, 1)
+
+
+class _Device:
+    """The microphone and clock shared by the virtual streams."""
+    microphone = None
+    speed = 1.0
+    played_seconds = 0.0
+
+
+class InputStream:
+    """Delivers blocks from the virtual microphone to the callback, paced in (scaled) real time."""
+    def __init__(self, samplerate, channels=1, dtype="int16", device=None, blocksize=1024, callback=None, **kwargs):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.callback = callback
+        self.active = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.active = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        period = self.blocksize / self.samplerate / _Device.speed
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            block = _Device.microphone.read(self.blocksize)
+            try:
+                self.callback(block, self.blocksize, None, None)
+            except (CallbackAbort, CallbackStop):
+                break
+            deadline += period
+            self._stop.wait(max(0.0, deadline - time.monotonic()))
+        self.active = False
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.active = False
+
+    abort = stop
+
+    def close(self):
+        self.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RawOutputStream:
+    """A speaker that takes as long to play each write as the audio lasts (scaled by the speed)."""
+    def __init__(self, samplerate, channels=1, dtype="int16", device=None, latency=None, **kwargs):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.active = False
+
+    def start(self):
+        self.active = True
+
+    def write(self, data):
+        seconds = len(data) / 2 / self.channels / self.samplerate
+        _Device.played_seconds += seconds
+        time.sleep(seconds / _Device.speed)
+
+    def stop(self):
+        self.active = False
+
+    abort = stop
+
+    def close(self):
+        self.active = False
+
+
+def query_devices(device=None, kind=None):
+    """The virtual microphone records at the pipeline's rate, so capture needs no resampling."""
+    return {"name": "Virtual microphone", "default_samplerate": float(_Device.microphone.sample_rate), "max_input_channels": 1}
+
+
+def install(microphone: VirtualMicrophone, speed: float = 1.0):
+    """
+    Registers a stand-in `sounddevice` module backed by `microphone`. Must run
+    before core.audio or core.playback are imported.
+    """
+    _Device.microphone = microphone
+    _Device.speed = speed
+    module = types.ModuleType("sounddevice")
+    module.InputStream = InputStream
+    module.RawOutputStream = RawOutputStream
+    module.CallbackAbort = CallbackAbort
+    module.CallbackStop = CallbackStop
+    module.query_devices = query_devices
+    sys.modules["sounddevice"] = module
+    return module
+
+
+def played_seconds() -> float:
+    """Seconds of audio written to the virtual speaker so far."""
+    return _Device.played_seconds
@@ -1,67 +1,289 @@
 # core/agent.py
 
+import asyncio
 import os
+import threading
+import uuid
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.agents import AgentExecutor, create_react_agent
-from langchain_core.prompts import ChatPromptTemplate
-from langchain import hub
+from rich.console import Console
+
+from .streaming import SentenceChunker
+from .response_cache import ResponseCache
+from .prefetch import get_prefetcher
+from .tracing import get_tracer
+from .connections import get_client, get_async_client
+from .prompts import AGENT_SYSTEM_PROMPT
+from .config import SERVICE_URLS, HTTP_MAX_RETRIES, OPENROUTER_MODEL, AGENT_MAX_ITERATIONS, AGENT_CHECKPOINT_PATH, RESPONSE_CACHE_ENABLED, PREFETCH_ENABLED, FILE_INDEX_ENABLED, TRACE_ENABLED, CLI_THEME
+
+console = Console(theme=CLI_THEME)
 
-# Import your custom file-handling tools
-from .tools import WriteFileTool, ReadFileTool, ListDirectoryTool, DeleteFileTool, CreateDirectoryTool
 
 # --- AGENT INITIALIZATION ---
 class ReactAgent:
     """
     The "Brain" of the application. It uses a language model via OpenRouter
     to process user requests and decide which tools to use.
+    The agent runs as a LangGraph graph (see core/utils.py) with native tool
+    calling, so each model turn can request several tool calls at once.
+    Conversations are checkpointed to SQLite by thread_id and kept within a
+    token budget (see core/memory.py). Repeated read-only commands are
+    answered from a response cache without calling the model, and the files
+    a command names are read ahead while the model thinks (core/prefetch.py).
+    The LLM client and graph (and the LangChain imports they need) are built
+    on first use, or ahead of time with `warm_up()`.
     """
     def __init__(self):
         # --- THIS IS THE FIX ---
         # Load the .env file to get the OpenRouter API key
         load_dotenv()
-        openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
+        self._openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
 
-        if not openrouter_api_key:
+        if not self._openrouter_api_key:
             raise ValueError("OPENROUTER_API_KEY not found in .env file. Please check your configuration.")
-
-        # Initialize the Chat Client to use OpenRouter
-        # We point it to the OpenRouter URL and provide your key.
-        # We'll use a fast and capable model like Claude 3 Haiku.
-        self.llm = ChatOpenAI(
-            model="deepseek/deepseek-r1-0528:free",
-            api_key=openrouter_api_key,
-            base_url="https://openrouter.ai/api/v1",
-            temperature=0,
-            streaming=True,
-        )
         # --- END OF FIX ---
 
-        # Define the tools the agent can use
-        self.tools = [WriteFileTool(), ReadFileTool()]
-        
-        # Get the ReAct agent prompt from LangChain Hub
-        prompt = hub.pull("hwchase17/react")
-        
-        # Create the agent by binding the tools to the LLM
-        agent = create_react_agent(self.llm, self.tools, prompt)
-        
-        # Create the agent executor, which runs the agent's thought process
-        self.agent_executor = AgentExecutor(
-            agent=agent, 
-            tools=self.tools, 
-            verbose=True, # Set to True to see the agent's thoughts
-            handle_parsing_errors=True, # Helps prevent crashes on weird outputs
-            max_iterations=10 # Prevents infinite loops
-        )
+        self._llm = None
+        self._graph = None
+        self._callbacks = []
+        self._build_lock = threading.Lock()
+        self.response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+        self.prefetcher = get_prefetcher() if PREFETCH_ENABLED else None
+
+    @property
+    def llm(self):
+        self._build()
+        return self._llm
+
+    @property
+    def graph(self):
+        self._build()
+        return self._graph
+
+    def warm_up(self):
+        """Builds the LLM client and agent graph ahead of the first request."""
+        self._build()
+
+    async def awarm_up(self):
+        """
+        Async version of `warm_up`, run off the event loop. A wait for the
+        build (or for a `warm_up` still running) is traced as "agent.warm_up",
+        so startup cost can be told apart from the agent's own latency.
+        """
+        if self._graph is not None:
+            return
+        with get_tracer().span("agent.warm_up"):
+            await asyncio.to_thread(self.warm_up)
+
+    def _build(self):
+        with self._build_lock:
+            if self._graph is not None:
+                return
+
+            # Deferred: LangChain takes a noticeable part of a second to import.
+            from langchain_openai import ChatOpenAI
+
+            # Import your custom file-handling tools
+            from .tools import (
+                WriteFileTool, ReadFileTool, ListDirectoryTool, DeleteFileTool, CreateDirectoryTool,
+                BatchFileOperationsTool, SearchFilesTool, ListFilesTool,
+            )
+            from .file_index import get_file_index
+            from .utils import create_react_agent, TracingCallbackHandler
+            from .memory import ConversationMemory
+            from .checkpoint import ThreadedSqliteSaver
+
+            # Initialize the Chat Client to use OpenRouter
+            # We point it to the OpenRouter URL and provide your key.
+            self._llm = ChatOpenAI(
+                model=OPENROUTER_MODEL,
+                api_key=self._openrouter_api_key,
+                base_url=SERVICE_URLS["openrouter"],
+                temperature=0,
+                streaming=True,
+                # Report token usage on streamed replies too, for tracing.
+                stream_usage=True,
+                # Reuse the pooled, kept-alive connections instead of per-client transports.
+                http_client=get_client("openrouter"),
+                http_async_client=get_async_client("openrouter"),
+                max_retries=HTTP_MAX_RETRIES,
+            )
+
+            # Define the tools the agent can use
+            self.tools = [
+                WriteFileTool(), ReadFileTool(), ListDirectoryTool(), DeleteFileTool(), CreateDirectoryTool(),
+                BatchFileOperationsTool(),
+            ]
+            if FILE_INDEX_ENABLED:
+                self.tools += [SearchFilesTool(), ListFilesTool()]
+                # Start indexing in the background so the first search finds something.
+                get_file_index()
+
+            # The checkpointer keeps each conversation's messages, keyed by thread_id,
+            # across restarts; the memory node bounds how much of it is sent to the model.
+            self._graph = create_react_agent(
+                self._llm,
+                self.tools,
+                ThreadedSqliteSaver.open(AGENT_CHECKPOINT_PATH),
+                system_prompt=AGENT_SYSTEM_PROMPT,
+                memory=ConversationMemory(self._llm),
+            )
+            self._callbacks = [TracingCallbackHandler()] if TRACE_ENABLED else []
+
+    def _run_config(self, thread_id: str) -> dict:
+        self._build()  # The tracing callbacks are created with the graph.
+        return {
+            "configurable": {"thread_id": thread_id},
+            # Every iteration is one model call plus one tool call.
+            "recursion_limit": 2 * AGENT_MAX_ITERATIONS + 1,
+            # Model and tool calls become spans of the current voice turn.
+            "callbacks": self._callbacks,
+        }
+
+    def _prefetch(self, user_message):
+        """Starts reading the files the command names while the model works out what to do."""
+        if self.prefetcher is not None and isinstance(user_message.content, str):
+            self.prefetcher.observe(user_message.content)
+
+    # --- Response cache ---
+    def _cache_lookup(self, user_message):
+        if self.response_cache is None or not isinstance(user_message.content, str):
+            return None
+        return self.response_cache.lookup(user_message.content)
+
+    def _replay_calls(self, entry):
+        """Gives a cached turn's tool calls fresh ids, ready to run again."""
+        calls = [
+            {"name": call["name"], "args": call["args"], "id": f"call_{uuid.uuid4().hex[:24]}", "type": "tool_call"}
+            for call in entry.tool_calls
+        ]
+        for call in calls:
+            console.print(f"[system]Replaying {call['name']}({call['args']})[/system]")
+        return calls
+
+    def _replayed_turn(self, user_message, entry, calls, results):
+        """The messages the model would have added for a replayed turn, ending with the cached reply."""
+        from langchain_core.messages import AIMessage
+
+        return [user_message, AIMessage(content="", tool_calls=calls), *results, AIMessage(content=entry.reply)]
+
+    def _replay(self, user_message, entry):
+        """Runs a cached turn's read-only tool calls again."""
+        tools = {tool.name: tool for tool in self.tools}
+        calls = self._replay_calls(entry)
+        results = [tools[call["name"]].invoke(call, {"callbacks": self._callbacks}) for call in calls]
+        return self._replayed_turn(user_message, entry, calls, results)
+
+    async def _areplay(self, user_message, entry):
+        tools = {tool.name: tool for tool in self.tools}
+        calls = self._replay_calls(entry)
+        results = await asyncio.gather(*(tools[call["name"]].ainvoke(call, {"callbacks": self._callbacks}) for call in calls))
+        return self._replayed_turn(user_message, entry, calls, results)
+
+    def _record_turn(self, user_message, messages):
+        """Offers the turn that just finished to the response cache."""
+        if self.response_cache is None or not isinstance(user_message.content, str):
+            return
+        start = max(i for i, message in enumerate(messages) if message.type == "human")
+        turn = messages[start + 1:]
+        calls = [call for message in turn if message.type == "ai" for call in message.tool_calls]
+        reply = turn[-1].content if turn else ""
+        if isinstance(reply, str):
+            self.response_cache.record(user_message.content, calls, reply)
 
     def get_agent_response(self, user_message, thread_id: str):
         """
         Invokes the agent to get a response for the user's message.
-        (Note: thread_id is included for future stateful conversation)
+        Returns the agent's final AIMessage.
         """
-        response = self.agent_executor.invoke({
-            "input": user_message.content,
-        })
-        return response
+        config = self._run_config(thread_id)
+        self._prefetch(user_message)
+        entry = self._cache_lookup(user_message)
+        if entry is not None:
+            messages = self._replay(user_message, entry)
+            # Keep the conversation history as if the model had run the turn.
+            self.graph.update_state(config, {"messages": messages}, as_node="memory")
+            console.print("[system]Answered from the response cache.[/system]")
+            return messages[-1]
+
+        state = self.graph.invoke({"messages": [user_message]}, config)
+        self._record_turn(user_message, state["messages"])
+        return state["messages"][-1]
+
+    async def aget_agent_response(self, user_message, thread_id: str):
+        """
+        Async version of `get_agent_response`. Tool calls requested in the
+        same model turn run concurrently on the shared tool pool.
+        """
+        await self.awarm_up()
+        config = self._run_config(thread_id)
+        self._prefetch(user_message)
+        entry = self._cache_lookup(user_message)
+        if entry is not None:
+            messages = await self._areplay(user_message, entry)
+            await self.graph.aupdate_state(config, {"messages": messages}, as_node="memory")
+            console.print("[system]Answered from the response cache.[/system]")
+            return messages[-1]
+
+        state = await self.graph.ainvoke({"messages": [user_message]}, config)
+        self._record_turn(user_message, state["messages"])
+        return state["messages"][-1]
+
+    async def stream_agent_response(self, user_message, thread_id: str):
+        """
+        Runs the agent and yields its reply as speakable segments while the
+        reply is still being generated.
+        """
+        # Building the graph imports LangChain; keep that off the event loop.
+        await self.awarm_up()
+        chunker = SentenceChunker()
+        streamed_any = False
+        config = self._run_config(thread_id)
+
+        self._prefetch(user_message)
+        entry = self._cache_lookup(user_message)
+        if entry is not None:
+            messages = await self._areplay(user_message, entry)
+            await self.graph.aupdate_state(config, {"messages": messages}, as_node="memory")
+            console.print("[system]Answered from the response cache.[/system]")
+            for segment in chunker.feed(entry.reply) + chunker.flush():
+                yield segment
+            return
+
+        async for mode, payload in self.graph.astream(
+            {"messages": [user_message]}, config, stream_mode=["messages", "updates"]
+        ):
+            if mode == "updates":
+                messages = (payload.get("agent") or {}).get("messages", [])
+                # Show tool calls in the terminal so the agent's actions stay visible.
+                for message in messages:
+                    for call in getattr(message, "tool_calls", None) or []:
+                        console.print(f"[system]Calling {call['name']}({call['args']})[/system]")
+                if messages and not getattr(messages[-1], "tool_calls", None):
+                    # The final answer: speak its last sentence now rather than
+                    # after the memory node, which may summarize the history.
+                    for segment in chunker.flush():
+                        streamed_any = True
+                        yield segment
+                continue
+            chunk, metadata = payload
+            # Only text the model addresses to the user; tool-call arguments
+            # stream through the same channel.
+            if metadata.get("langgraph_node") != "agent" or not isinstance(chunk.content, str):
+                continue
+            for segment in chunker.feed(chunk.content):
+                streamed_any = True
+                yield segment
 
+        state = await self.graph.aget_state(config)
+        self._record_turn(user_message, state.values["messages"])
+        remaining = chunker.flush()
+        if streamed_any or remaining:
+            for segment in remaining:
+                yield segment
+            return
+        # Nothing was streamed (e.g. the provider doesn't stream), so speak
+        # the final message from the checkpointed state.
+        final_message = state.values["messages"][-1]
+        if isinstance(final_message.content, str):
+            for segment in chunker.feed(final_message.content) + chunker.flush():
+                yield segment
@@ -1,94 +1,241 @@
 # core/audio.py
 
 import os
-import io
 import threading
-import requests
-import numpy as np
+import time
 import sounddevice as sd
-from scipy.io.wavfile import write
 from langchain_core.messages import HumanMessage
 from rich.console import Console
-from elevenlabs import play
 
 # Import the necessary settings and clients from our updated config
+from .vad import Endpointer, create_vad
+from .bargein import BargeIn, EchoGatedVAD, EchoReference
+from .ringbuffer import RecordedAudio, RingBufferPool
+from .transcription import IncrementalTranscriber, get_transcriber
+from .playback import PcmPlayer
+from .synthesis import SpeechSynthesizer, StreamedClip
+from .prefetch import get_prefetcher
+from .preprocess import AudioPreprocessor
+from .tracing import get_tracer
 from .config import (
-    elevenlabs_client,
-    huggingface_api_key,
-    HF_TRANSCRIPTION_URL,
     MICROPHONE_DEVICE_ID,
     DEFAULT_SAMPLE_RATE,
-    DEFAULT_VOICE_ID,
-    DEFAULT_MODEL_ID,
+    CAPTURE_SAMPLE_RATE,
+    CAPTURE_CHANNELS,
+    RECORDING_MODE,
+    MAX_RECORDING_SECONDS,
+    CAPTURE_BLOCK_SIZE,
+    PIPELINE_QUEUE_SIZE,
+    STREAMING_TRANSCRIPTION,
+    TTS_STREAMING,
+    TTS_CACHE_PREWARM_PHRASES,
+    BARGE_IN_ENABLED,
+    BARGE_IN_MIN_SPEECH_MS,
+    PREFETCH_ENABLED,
     CLI_THEME
 )
 
 console = Console(theme=CLI_THEME)
 
+
+def _native_rate(device, fallback: int) -> int:
+    """The input device's default sample rate, which it is sure to support."""
+    try:
+        return int(sd.query_devices(device, "input")["default_samplerate"])
+    except Exception as e:
+        console.print(f"[warning]Could not read the microphone's sample rate ({e}); recording at {fallback} Hz.[/warning]")
+        return fallback
+
 class AudioProcessor:
     """
     Handles all voice input and output.
-    - Records audio from a specific microphone.
-    - Transcribes audio using the Hugging Face API.
+    - Records audio from a specific microphone at its native rate, ending
+      each utterance automatically with voice activity detection (or on
+      Enter). Blocks are downmixed, resampled to `sample_rate` and freed of
+      DC offset as they arrive (see core/preprocess.py).
+    - Transcribes audio with the configured backend (Hugging Face API or a
+      local Whisper model).
     - Speaks text responses using the ElevenLabs API.
+    - Keeps listening while a reply plays: when the user talks over it
+      (barge-in), playback and the download of the reply stop at once, and
+      the user's utterance is captured and transcribed as usual. Only
+      available in "vad" mode; clips played with elevenlabs.play (TTS
+      streaming off) can't be cut short, but the rest of the reply is dropped.
     """
-    def __init__(self, sample_rate: int = DEFAULT_SAMPLE_RATE):
+    def __init__(
+        self,
+        sample_rate: int = DEFAULT_SAMPLE_RATE,
+        recording_mode: str = RECORDING_MODE,
+        vad=None,
+        streaming_transcription: bool = STREAMING_TRANSCRIPTION,
+        transcriber=None,
+        tts_streaming: bool = TTS_STREAMING,
+        barge_in: bool = BARGE_IN_ENABLED,
+    ):
+        if recording_mode not in ("vad", "manual"):
+            raise ValueError(f"Unknown recording mode '{recording_mode}'. Use 'vad' or 'manual'.")
         self.sample_rate = sample_rate
-        self._recording = False
-        self._frames = []
+        self.capture_rate = CAPTURE_SAMPLE_RATE or _native_rate(MICROPHONE_DEVICE_ID, sample_rate)
+        self._preprocessor = AudioPreprocessor(self.capture_rate, sample_rate, CAPTURE_CHANNELS)
+        self.recording_mode = recording_mode
+        self.streaming_transcription = streaming_transcription
+        self.tts_streaming = tts_streaming
+        self.barge_in = BargeIn() if barge_in and recording_mode == "vad" else None
+        # What was played recently, so the speaker's echo isn't mistaken for the user.
+        echo_reference = EchoReference() if self.barge_in is not None else None
+        self._player = PcmPlayer(reference=echo_reference)
+        self._playing_clip = None
+        self._interrupted = False
+        self.synthesizer = SpeechSynthesizer(tts_streaming)
+        self.tts_cache = self.synthesizer.cache
+        self.transcriber = transcriber or get_transcriber()
+        threading.Thread(target=self._warm_up_transcriber, daemon=True).start()
+        # Partial transcripts start reading the files they mention.
+        self.prefetcher = get_prefetcher() if PREFETCH_ENABLED else None
+        # Any VoiceActivityDetector can be passed in to replace the configured one.
+        vad = vad or create_vad(sample_rate)
+        if echo_reference is not None:
+            vad = EchoGatedVAD(vad, echo_reference)
+        self._endpointer = Endpointer(vad)
+        # Capture writes into preallocated ring buffers. One extra buffer per
+        # pipeline slot lets the next utterance be recorded while earlier ones
+        # are still queued for (or being) transcribed.
+        self._pool = RingBufferPool(PIPELINE_QUEUE_SIZE + 2, int(MAX_RECORDING_SECONDS * sample_rate))
+        self._buffer = None
+        self._utterance_done = threading.Event()
+        self._callback_error = None
+
+    def _warm_up_transcriber(self):
+        try:
+            self.transcriber.warm_up()
+        except Exception as e:
+            console.print(f"[warning]Could not warm up the {self.transcriber.name} transcriber: {e}[/warning]")
+
+    def _transcribe_segments(self, segments, final: bool = True) -> str:
+        return self.transcriber.transcribe(segments, self.sample_rate, final)
+
+    def _audio_callback(self, indata, frames, time, status):
+        """Called by PortAudio for every captured block; runs on the audio thread."""
+        try:
+            if status:
+                console.print(f"[warning]Recording status warning: {status}[/warning]")
+            samples = self._preprocessor.process(indata)
+            self._buffer.write(samples)
+            if self.recording_mode == "vad" and self._endpointer.process(samples):
+                self._utterance_done.set()
+            if (
+                self.barge_in is not None
+                and not self._interrupted
+                and self._endpointer.speech_seconds * 1000 >= BARGE_IN_MIN_SPEECH_MS
+            ):
+                self._interrupt_playback()
+        except Exception as e:
+            self._callback_error = e
+            self._utterance_done.set()
+            raise sd.CallbackAbort
+
+    def _interrupt_playback(self):
+        """Stops the reply that is playing because the user started talking over it."""
+        if self.barge_in.interrupt():
+            self._interrupted = True
+            clip = self._playing_clip
+            if clip is not None:
+                clip.cancel()
+
+    def capture_audio(self):
+        """
+        Records a single utterance from the microphone.
+        Returns a RecordedAudio, or None if nothing was recorded. The caller
+        must eventually pass it to `transcribe` (or call `release()` on it).
+        """
+        buffer = self._pool.acquire()
+        self._buffer = buffer
+        self._endpointer.reset()
+        self._preprocessor.reset()
+        self._utterance_done.clear()
+        self._callback_error = None
+        self._interrupted = False
+
+        if self.recording_mode == "vad":
+            console.print("[recording]Listening... Start speaking whenever you're ready.[/recording]")
+            origin = lambda: self._endpointer.start
+        else:
+            console.print("[recording]Start speaking... Press Enter when you're done.[/recording]")
+            origin = lambda: buffer.oldest
+
+        incremental = None
+        if self.streaming_transcription:
+            # Ship overlapping windows to the transcription backend while the
+            # user is still talking.
+            incremental = IncrementalTranscriber(
+                self._transcribe_segments, buffer, self.sample_rate, origin,
+                on_partial=self.prefetcher.observe if self.prefetcher is not None else None,
+            )
 
-    def _record_thread(self):
-        """A separate thread to capture audio from the specified microphone."""
         try:
             # Use the specific microphone device ID and sample rate from config
-            with sd.InputStream(samplerate=self.sample_rate, channels=1, dtype='int16', device=MICROPHONE_DEVICE_ID) as stream:
-                while self._recording:
-                    audio_chunk, _ = stream.read(1024)
-                    self._frames.append(audio_chunk)
+            with sd.InputStream(
+                samplerate=self.capture_rate, channels=CAPTURE_CHANNELS, dtype='int16', device=MICROPHONE_DEVICE_ID,
+                blocksize=CAPTURE_BLOCK_SIZE, callback=self._audio_callback,
+            ) as stream:
+                if self.recording_mode == "vad":
+                    while not self._utterance_done.wait(0.5) and stream.active:
+                        pass
+                else:
+                    input() # Wait for the user to press Enter
+            if self._callback_error:
+                raise self._callback_error
         except Exception as e:
             console.print(f"[error]Microphone recording error: {e}[/error]")
-            self._recording = False
+            self._discard(buffer, incremental)
+            return None
 
-    def record_audio(self) -> HumanMessage:
-        """Records audio and transcribes it using the Hugging Face API."""
-        self._frames = []
-        self._recording = True
-        
-        console.print("[recording]Start speaking... Press Enter when you're done.[/recording]")
-        
-        thread = threading.Thread(target=self._record_thread)
-        thread.start()
-        
-        input() # Wait for the user to press Enter
-        self._recording = False
-        thread.join()
+        if self.recording_mode == "vad":
+            span = self._endpointer.span()
+            if span is None:
+                console.print("[warning]No speech was detected.[/warning]")
+                self._discard(buffer, incremental)
+                return None
+        else:
+            span = (buffer.oldest, buffer.total_written)
+            if buffer.total_written == 0:
+                console.print("[warning]No audio was recorded.[/warning]")
+                self._discard(buffer, incremental)
+                return None
+            if buffer.oldest > 0:
+                console.print(f"[warning]Recording exceeded {MAX_RECORDING_SECONDS} seconds; only the last part was kept.[/warning]")
 
-        if not self._frames:
-            console.print("[warning]No audio was recorded.[/warning]")
-            return HumanMessage(content="")
+        recording = RecordedAudio(self._pool, buffer, *span, self.sample_rate)
+        # The utterance started this long before the stream was closed.
+        end = time.perf_counter()
+        get_tracer().record(
+            "capture", end - (buffer.total_written - span[0]) / self.sample_rate, end,
+            mode=self.recording_mode, audio_seconds=round(recording.duration, 2),
+        )
+        if incremental is not None:
+            incremental.close_capture(*span)
+            recording.incremental = incremental
+        return recording
+
+    def _discard(self, buffer, incremental):
+        """Returns a buffer to the pool after a capture that produced no utterance."""
+        if incremental is not None:
+            incremental.close_capture(0, 0)
+            incremental.finish()
+        self._pool.release(buffer)
 
-        console.print("[transcribing]Recording stopped. Transcribing with Hugging Face...[/transcribing]")
+    def transcribe(self, recording: RecordedAudio) -> HumanMessage:
+        """Transcribes a captured utterance with the configured backend."""
+        console.print(f"[transcribing]Recording stopped. Transcribing with {self.transcriber.name}...[/transcribing]")
         
-        # --- START OF HUGGING FACE TRANSCRIPTION LOGIC ---
+        # --- START OF TRANSCRIPTION LOGIC ---
         try:
-            audio_array = np.concatenate(self._frames, axis=0)
-            audio_bytes = io.BytesIO()
-            write(audio_bytes, self.sample_rate, audio_array)
-            audio_bytes.seek(0)
-
-            headers = {
-               "Authorization": f"Bearer {huggingface_api_key}",
-               "Content-Type": "audio/wav"
-            }
-            
-            response = requests.post(HF_TRANSCRIPTION_URL, headers=headers, data=audio_bytes.read(), timeout=45)
-
-            if response.status_code != 200:
-                console.print(f"[error]Hugging Face API Error {response.status_code}: {response.text}[/error]")
-                return HumanMessage(content="")
-
-            result = response.json()
-            transcribed_text = result.get('text', '').strip()
+            with get_tracer().span("stt", backend=self.transcriber.name, incremental=recording.incremental is not None):
+                if recording.incremental is not None:
+                    # Most windows are already done; only the tail is left.
+                    transcribed_text = recording.incremental.finish()
+                else:
+                    transcribed_text = self._transcribe_segments(recording.buffer.segments(recording.start, recording.stop))
 
             if transcribed_text:
                 console.print(f"[user_input]You said: {transcribed_text}[/user_input]")
@@ -100,20 +247,73 @@ class AudioProcessor:
         except Exception as e:
             console.print(f"[error]An error occurred during transcription: {e}[/error]")
             return HumanMessage(content="")
-        # --- END OF HUGGING FACE TRANSCRIPTION LOGIC ---
+        finally:
+            recording.release()
+        # --- END OF TRANSCRIPTION LOGIC ---
 
-    def speak_response(self, text: str):
-        """Uses the working ElevenLabs client to speak the response."""
+    def record_audio(self) -> HumanMessage:
+        """Records audio and transcribes it with the configured backend."""
+        recording = self.capture_audio()
+        if recording is None:
+            return HumanMessage(content="")
+        return self.transcribe(recording)
+
+    def synthesize(self, text: str):
+        """
+        Converts a text response into audio with ElevenLabs.
+        Returns a StreamedClip whose PCM downloads in the background when TTS
+        streaming is enabled, otherwise the encoded audio bytes. Returns None
+        if synthesis failed.
+        """
         cleaned_text = text.replace("**", "")
         console.print(f"[agent_response]Agent: {cleaned_text}[/agent_response]")
         try:
-            audio_stream = elevenlabs_client.text_to_speech.convert(
-                voice_id=DEFAULT_VOICE_ID,
-                model_id=DEFAULT_MODEL_ID,
-                text=cleaned_text
-            )
-            if audio_stream:
-                play(audio_stream)
+            return self.synthesizer.synthesize(cleaned_text)
+        except Exception as e:
+            console.print(f"[error]Failed to synthesize audio with ElevenLabs: {e}[/error]")
+            return None
+
+    def prewarm_tts_cache(self, phrases=TTS_CACHE_PREWARM_PHRASES):
+        """Synthesizes frequently spoken phrases ahead of time so they play from the cache."""
+        self.synthesizer.prewarm(phrases)
+
+    def play_audio(self, audio, generation: int | None = None):
+        """
+        Plays audio previously produced by `synthesize`. With barge-in on,
+        playback stops as soon as the reply of `generation` (by default the
+        current one) is interrupted.
+        """
+        interrupted = None
+        if self.barge_in is not None:
+            if generation is None:
+                generation = self.barge_in.generation
+            interrupted = lambda: self.barge_in.is_stale(generation)
+            self.barge_in.playback_started()
+        try:
+            with get_tracer().span("playback", streamed=isinstance(audio, StreamedClip)) as span:
+                if isinstance(audio, StreamedClip):
+                    self._playing_clip = audio
+                    if not self._player.play(audio, audio.sample_rate, interrupted):
+                        span.attributes["interrupted"] = True
+                        audio.cancel()
+                        console.print("[system]Reply interrupted. Listening...[/system]")
+                else:
+                    from elevenlabs import play
+                    play(audio)
         except Exception as e:
             console.print(f"[error]Failed to play audio from ElevenLabs: {e}[/error]")
+        finally:
+            self._playing_clip = None
+            if self.barge_in is not None:
+                self.barge_in.playback_finished()
+
+    def discard(self, audio):
+        """Drops synthesized audio that will not be played, stopping its download."""
+        if isinstance(audio, StreamedClip):
+            audio.cancel()
 
+    def speak_response(self, text: str):
+        """Uses the working ElevenLabs client to speak the response."""
+        audio = self.synthesize(text)
+        if audio:
+            self.play_audio(audio)
@@ -0,0 +1,130 @@
+# core/bargein.py
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from .vad import VoiceActivityDetector
+from .config import (
+    BARGE_IN_ECHO_WINDOW_MS,
+    BARGE_IN_ECHO_MARGIN_DB,
+    BARGE_IN_INITIAL_ECHO_GAIN_DB,
+)
+
+
+def level_db(samples: np.ndarray) -> float:
+    """RMS level of int16 samples in dBFS."""
+    if samples.size == 0:
+        return -200.0
+    values = samples.astype(np.float32) / 32768.0
+    return float(20.0 * np.log10(max(np.sqrt(np.mean(values * values)), 1e-10)))
+
+
+class EchoReference:
+    """
+    Remembers how loud the audio sent to the speaker was, and when.
+    The player records every block it writes; the capture side asks for the
+    loudest level played within the echo window, which bounds how loud the
+    speaker's echo in the microphone can be right now.
+    """
+    def __init__(self, window_ms: int = BARGE_IN_ECHO_WINDOW_MS):
+        self.window = window_ms / 1000
+        self._levels = deque()
+        self._lock = threading.Lock()
+
+    def add(self, pcm: bytes):
+        """Records a block of 16-bit PCM that was just written to the output stream."""
+        level = level_db(np.frombuffer(pcm, dtype=np.int16))
+        now = time.monotonic()
+        with self._lock:
+            self._levels.append((now, level))
+            while self._levels and self._levels[0][0] < now - self.window:
+                self._levels.popleft()
+
+    def level(self):
+        """The loudest level played within the echo window, or None if nothing was played."""
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            levels = [level for played, level in self._levels if played >= cutoff]
+        return max(levels) if levels else None
+
+
+class EchoGatedVAD(VoiceActivityDetector):
+    """
+    Wraps another detector so the assistant's own voice doesn't count as speech.
+    - While audio is playing, a frame is only speech if it is also clearly
+      louder than the expected echo (the played level plus the estimated
+      speaker-to-microphone gain).
+    - The echo gain starts pessimistic and follows the frames that are
+      echo-only: it rises quickly and decays slowly, like a peak meter.
+    - When nothing has been played recently, frames pass straight through.
+    """
+    def __init__(
+        self,
+        vad: VoiceActivityDetector,
+        reference: EchoReference,
+        margin_db: float = BARGE_IN_ECHO_MARGIN_DB,
+        initial_gain_db: float = BARGE_IN_INITIAL_ECHO_GAIN_DB,
+    ):
+        self.sample_rate = vad.sample_rate
+        self.frame_size = vad.frame_size
+        self.vad = vad
+        self.reference = reference
+        self.margin_db = margin_db
+        self.echo_gain_db = initial_gain_db
+
+    def is_speech(self, frames: np.ndarray) -> np.ndarray:
+        speech = self.vad.is_speech(frames)
+        played = self.reference.level()
+        if played is None:
+            return speech
+        for i, frame in enumerate(frames):
+            excess = level_db(frame) - played
+            if excess > self.echo_gain_db + self.margin_db:
+                continue  # Louder than any echo could be: the user is talking.
+            speech[i] = False
+            rate = 0.5 if excess > self.echo_gain_db else 0.02
+            self.echo_gain_db += rate * (excess - self.echo_gain_db)
+        return speech
+
+
+class BargeIn:
+    """
+    Coordinates interrupting a reply when the user starts talking over it.
+    - `generation` is bumped on every interruption. Pipeline stages tag their
+      output with the generation it was produced in and drop anything older.
+    - A reply counts as playing from the first block written until the echo
+      window after the last one, which bridges the gaps between sentences.
+    """
+    def __init__(self, window_ms: int = BARGE_IN_ECHO_WINDOW_MS):
+        self.window = window_ms / 1000
+        self.generation = 0
+        self._playing = 0
+        self._finished_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def playback_started(self):
+        with self._lock:
+            self._playing += 1
+
+    def playback_finished(self):
+        with self._lock:
+            self._playing -= 1
+            self._finished_at = time.monotonic()
+
+    def is_playing(self) -> bool:
+        with self._lock:
+            return self._playing > 0 or time.monotonic() - self._finished_at < self.window
+
+    def is_stale(self, generation: int) -> bool:
+        return generation != self.generation
+
+    def interrupt(self) -> bool:
+        """Interrupts the reply being played. Returns False if nothing was playing."""
+        if not self.is_playing():
+            return False
+        with self._lock:
+            self.generation += 1
+        return True
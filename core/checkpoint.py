@@ -0,0 +1,37 @@
+# core/checkpoint.py
+
+import asyncio
+import os
+import sqlite3
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+
+class ThreadedSqliteSaver(SqliteSaver):
+    """
+    Stores conversation checkpoints in a local SQLite file, keyed by thread_id.
+    SqliteSaver itself only implements the synchronous API; the async methods
+    here run their synchronous counterparts in a worker thread, so the same
+    saver serves both `invoke` and `astream`. Access to the connection is
+    serialized by the saver's own lock.
+    """
+    @classmethod
+    def open(cls, path: str) -> "ThreadedSqliteSaver":
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return cls(sqlite3.connect(path, check_same_thread=False))
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        checkpoints = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
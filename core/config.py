@@ -3,35 +3,264 @@
 import os
 from dotenv import load_dotenv
 from rich.theme import Theme
-from elevenlabs.client import ElevenLabs
 
 # Load all environment variables from .env file
 load_dotenv()
 
+# Local caches (synthesized audio, prompts, indexes) live here.
+CACHE_DIR = os.path.expanduser(os.getenv("VOICER_CACHE_DIR", "~/.cache/voicer"))
+
 # --- API Keys ---
 # Note: The OpenRouter key will be used directly in agent.py
 eleven_api_key = os.getenv("ELEVEN_API_KEY")
 huggingface_api_key = os.getenv("HUGGINGFACE_API_KEY")
 
 # --- Client Initialization ---
-# Initialize the ElevenLabs client for text-to-speech
+# The ElevenLabs client for text-to-speech is created in core/connections.py
+# so it shares the pooled HTTP connection layer.
 if not eleven_api_key:
     raise ValueError("ELEVEN_API_KEY not found in .env file.")
-elevenlabs_client = ElevenLabs(api_key=eleven_api_key)
+
+# --- Connection Settings ---
+# Base URLs of the remote services, also used to pre-warm connections. Each
+# can be overridden from the environment, e.g. to point at the local stand-ins
+# of the benchmark harness (see bench/).
+SERVICE_URLS = {
+    "huggingface": os.getenv("VOICER_HUGGINGFACE_URL", "https://api-inference.huggingface.co"),
+    "openrouter": os.getenv("VOICER_OPENROUTER_URL", "https://openrouter.ai/api/v1"),
+    "elevenlabs": os.getenv("VOICER_ELEVENLABS_URL", "https://api.elevenlabs.io"),
+}
+# Pooled connections per service, kept alive between turns.
+HTTP_MAX_CONNECTIONS = 8
+HTTP_KEEPALIVE_SECONDS = 300
+# Retries for connection errors, rate limits and 5xx responses, with
+# exponential backoff and full jitter.
+HTTP_MAX_RETRIES = 2
+HTTP_BACKOFF_SECONDS = 0.5
+HTTP_BACKOFF_MAX_SECONDS = 8.0
+# Per-service timeouts in seconds. "read" bounds the wait for each chunk of
+# the response, so long streamed replies are not cut off.
+HTTP_TIMEOUTS = {
+    "huggingface": {"connect": 5.0, "read": 30.0, "write": 10.0, "pool": 5.0},
+    "openrouter": {"connect": 5.0, "read": 60.0, "write": 10.0, "pool": 5.0},
+    "elevenlabs": {"connect": 5.0, "read": 15.0, "write": 10.0, "pool": 5.0},
+}
+
+# --- Agent Settings ---
+# The agent relies on native tool calling, so the model must support tools on OpenRouter.
+OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "deepseek/deepseek-r1-0528:free")
+# Maximum model turns per request (prevents infinite tool loops).
+AGENT_MAX_ITERATIONS = 10
+
+# --- Conversation Memory ---
+# Conversations are stored here by thread_id, so a session can be resumed
+# with `python main.py --session <id>`.
+AGENT_CHECKPOINT_PATH = os.path.join(CACHE_DIR, "conversations.sqlite")
+# Approximate token budget for the stored history. Beyond it the oldest turns
+# are folded into a running summary, keeping about AGENT_HISTORY_KEEP_TOKENS
+# of the most recent turns verbatim.
+AGENT_HISTORY_TOKEN_BUDGET = 4000
+AGENT_HISTORY_KEEP_TOKENS = 1500
+# Tool outputs (e.g. file contents) longer than this are replaced by a short
+# reference once the agent has replied using them.
+AGENT_TOOL_OUTPUT_MAX_CHARS = 2000
+
+# --- Tool Execution ---
+# Tools run on a shared pool of worker threads, so a slow disk never blocks
+# the event loop and parallel tool calls run at the same time.
+TOOL_MAX_WORKERS = 8
+# Seconds a tool call may take before the agent is told it timed out, with
+# per-tool overrides.
+TOOL_TIMEOUT_SECONDS = 15
+TOOL_TIMEOUTS = {
+    "write_file": 30,
+    "batch_file_operations": 60,
+}
+
+# --- File Tool Settings ---
+# The file tools only touch paths inside these folders (after following
+# symlinks): the home folder and the folder Voicer was started from. Set to
+# None to allow any path.
+FILE_SANDBOX_ROOTS = ["~", "."]
+# read_file output is capped at about this many tokens (~4 characters each);
+# longer results are truncated with a note on the file's size and length.
+READ_FILE_MAX_TOKENS = 2000
+# Files up to this size get an exact line count in that note; beyond it the
+# count is estimated so the whole file isn't scanned.
+READ_FILE_COUNT_LINES_MAX_BYTES = 64 * 1024 * 1024
+# Regex searches return at most this many matching lines, each shortened to
+# READ_FILE_MATCH_LINE_CHARS.
+READ_FILE_MAX_MATCHES = 50
+READ_FILE_MATCH_LINE_CHARS = 200
+
+# Limits for the batch_file_operations tool: operations per call, and how
+# many independent operations run at once.
+FILE_BATCH_MAX_OPERATIONS = 50
+FILE_BATCH_MAX_WORKERS = 8
+
+# --- File Index ---
+# A searchable catalog of the files under FILE_INDEX_ROOTS, used by the
+# search_files and list_files tools. It is built in the background and kept
+# current with file-system notifications when watchdog is installed
+# (`pip install watchdog`), or by rescanning every FILE_INDEX_RESCAN_SECONDS.
+FILE_INDEX_ENABLED = True
+FILE_INDEX_PATH = os.path.join(CACHE_DIR, "file_index.sqlite")
+FILE_INDEX_ROOTS = ["~"]
+# Directory names that are never indexed; hidden files and folders are
+# skipped unless FILE_INDEX_INCLUDE_HIDDEN is set.
+FILE_INDEX_EXCLUDE = ("node_modules", "__pycache__", "venv", "site-packages")
+FILE_INDEX_INCLUDE_HIDDEN = False
+FILE_INDEX_RESCAN_SECONDS = 600
+# Change notifications arriving within this window are applied together.
+FILE_INDEX_DEBOUNCE_SECONDS = 0.5
+# Results per page returned by the search and list tools.
+FILE_INDEX_PAGE_SIZE = 20
+
+# --- Speculative Prefetch ---
+# While the user is still talking and the agent is thinking, the working and
+# home folders and the files and folders named in the transcript are listed
+# and read ahead, so the read_file and list_directory calls that follow are
+# answered from memory. An entry is only used while the path's modification
+# time and size are unchanged.
+PREFETCH_ENABLED = True
+PREFETCH_CACHE_MAX_BYTES = 16 * 1024 * 1024
+# Larger files are left to read_file, which memory-maps only the part it needs.
+PREFETCH_MAX_FILE_BYTES = 1024 * 1024
+# Paths prefetched per transcript, and reads running at once.
+PREFETCH_MAX_TARGETS = 8
+PREFETCH_MAX_WORKERS = 2
+
+# --- Response Cache ---
+# Repeated read-only commands ("read notes.txt") are answered from a cache,
+# without calling the model, while the files they read are unchanged.
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_MAX_ENTRIES = 128
+# Minimum character-trigram cosine similarity for a near-duplicate command.
+# Near-duplicates must also use the same meaningful words; only articles,
+# fillers and paraphrases ("show" for "read") may differ.
+RESPONSE_CACHE_SIMILARITY = 0.85
+# Only turns that use nothing but these tools are cached.
+RESPONSE_CACHE_TOOLS = ("read_file", "list_directory")
 
 # --- Transcription Settings ---
+# "huggingface" uses the hosted Inference API; "local" runs Whisper in-process
+# with faster-whisper (no network hop, works offline).
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "huggingface")
 # The working Hugging Face model URL from our successful test
-if not huggingface_api_key:
+if TRANSCRIPTION_BACKEND == "huggingface" and not huggingface_api_key:
     raise ValueError("HUGGINGFACE_API_KEY not found in .env file.")
-HF_TRANSCRIPTION_URL = "https://api-inference.huggingface.co/models/openai/whisper-large-v3-turbo"
+HF_TRANSCRIPTION_URL = SERVICE_URLS["huggingface"] + "/models/openai/whisper-large-v3-turbo"
+# Transcribe overlapping windows while the user is still speaking, so only the
+# last few seconds remain to be transcribed when the utterance ends.
+STREAMING_TRANSCRIPTION = True
+STT_WINDOW_SECONDS = 5.0
+# Audio shared by consecutive windows, used to stitch their transcripts.
+STT_OVERLAP_SECONDS = 1.0
+# Local Whisper engine (TRANSCRIPTION_BACKEND = "local")
+LOCAL_WHISPER_MODEL = "small.en"
+LOCAL_WHISPER_DEVICE = "cpu"
+# int8 quantization roughly halves memory and speeds up CPU inference.
+LOCAL_WHISPER_COMPUTE_TYPE = "int8"
+LOCAL_WHISPER_CPU_THREADS = 4
+LOCAL_WHISPER_BEAM_SIZE = 1
+LOCAL_WHISPER_LANGUAGE = "en"
+# All transcription requests of the process go through one scheduler, which
+# serves final segments (the user is waiting) before partial windows.
+STT_SCHEDULER_ENABLED = True
+# The local engine transcribes requests that arrive within this window in one
+# batched call, up to STT_BATCH_MAX_SIZE clips, grouped by length.
+STT_BATCH_WINDOW_MS = 30
+STT_BATCH_MAX_SIZE = 8
+STT_BATCH_BUCKET_SECONDS = 5.0
+# Hugging Face requests in flight at once; the rest wait their turn, which
+# keeps bursts under the hosted endpoint's rate limits.
+STT_HTTP_CONCURRENCY = 4
+# Before upload, utterances are scaled so speech sits at about this RMS
+# level, boosting quiet microphones by at most AUDIO_MAX_GAIN_DB. None
+# disables it.
+AUDIO_TARGET_DBFS = -20.0
+AUDIO_MAX_GAIN_DB = 20.0
+# Format of Hugging Face uploads: "wav", or with `pip install soundfile`
+# "flac" (lossless, about half the size) or "opus" (lossy, a tenth or less),
+# which upload faster on slow links.
+STT_UPLOAD_CODEC = "wav"
 
 # --- Audio Settings ---
 # Device ID for your microphone (found with our test script)
 MICROPHONE_DEVICE_ID = 1 
-# Sample rate must be 16000 Hz for Whisper models
+# Rate the pipeline works at (VAD, capture buffers, transcription); Whisper
+# models expect 16000 Hz.
 DEFAULT_SAMPLE_RATE = 16000 
+# Rate and channels the microphone is opened with. None uses the device's
+# native rate, since many only support 44.1 or 48 kHz; the audio is then
+# downmixed to mono and resampled to DEFAULT_SAMPLE_RATE in software.
+CAPTURE_SAMPLE_RATE = None
+CAPTURE_CHANNELS = 1
+# Cutoff of the high-pass filter that removes a microphone's DC offset.
+# None disables it.
+AUDIO_DC_CUTOFF_HZ = 20.0
+# How an utterance ends: "vad" stops automatically when the speaker pauses,
+# "manual" records until Enter is pressed.
+RECORDING_MODE = "vad"
+# Capacity of each preallocated capture buffer. Longer manual recordings keep
+# only their most recent part.
+MAX_RECORDING_SECONDS = 120
+# Frames delivered to the capture callback per block.
+CAPTURE_BLOCK_SIZE = 1024
 DEFAULT_VOICE_ID = "pNInz6obpgDQGcFmaJgB" # Default: Adam voice
 DEFAULT_MODEL_ID = "eleven_turbo_v2_5"
+# Stream raw PCM from ElevenLabs straight into the sound card instead of
+# downloading a complete MP3 and handing it to an external player.
+TTS_STREAMING = True
+TTS_OUTPUT_FORMAT = "pcm_22050"
+# Format requested when TTS streaming is off (played with elevenlabs.play).
+TTS_ENCODED_FORMAT = "mp3_44100_128"
+# Output device for streamed playback (None uses the system default).
+SPEAKER_DEVICE_ID = None
+# Audio buffered before playback starts, to absorb network jitter.
+PLAYBACK_JITTER_MS = 150
+# Streamed audio is written to the sound card in slices this long; an
+# interrupted reply stops within one slice.
+PLAYBACK_SLICE_MS = 20
+
+# --- Barge-in ---
+# Keep listening while a reply plays and stop it as soon as the user talks
+# over it ("vad" recording mode only).
+BARGE_IN_ENABLED = True
+# Speech needed before a reply is interrupted, so a cough doesn't cut it off.
+BARGE_IN_MIN_SPEECH_MS = 200
+# How far back the echo of played audio is expected to reach the microphone.
+BARGE_IN_ECHO_WINDOW_MS = 300
+# During playback, speech must be this much louder than the expected echo.
+BARGE_IN_ECHO_MARGIN_DB = 6.0
+# Starting estimate of the speaker-to-microphone gain; it adapts to the room
+# as soon as a reply plays.
+BARGE_IN_INITIAL_ECHO_GAIN_DB = 0.0
+
+# --- TTS Cache ---
+# Replies like "Successfully wrote to notes.txt" repeat a lot; cache their
+# audio instead of synthesizing them again.
+TTS_CACHE_ENABLED = True
+TTS_CACHE_DIR = os.path.join(CACHE_DIR, "tts")
+TTS_CACHE_MEMORY_BYTES = 16 * 1024 * 1024
+TTS_CACHE_DISK_BYTES = 256 * 1024 * 1024
+# Longer replies (e.g. a file read aloud) are rarely repeated verbatim.
+TTS_CACHE_MAX_TEXT_CHARS = 300
+# Phrases synthesized in the background at startup, e.g. ["Done.", "File not found."]
+TTS_CACHE_PREWARM_PHRASES = []
+
+# --- Tracing ---
+# Every voice turn is traced stage by stage (capture, STT, each LLM and tool
+# call, TTS, playback) and each span is appended to TRACE_PATH as a JSON line.
+TRACE_ENABLED = True
+TRACE_PATH = os.path.join(CACHE_DIR, "traces.jsonl")
+# Print a one-line latency summary after every turn, and percentiles on exit.
+TRACE_SUMMARY = True
+# Also export turns as OpenTelemetry spans (needs opentelemetry-api and a
+# configured SDK/exporter, e.g. via opentelemetry-instrument).
+TRACE_OTEL = False
+# Serve Prometheus metrics on this port (needs prometheus-client); None disables it.
+TRACE_PROMETHEUS_PORT = None
 
 # --- Rich CLI Theme ---
 CLI_THEME = Theme({
@@ -47,3 +276,56 @@ CLI_THEME = Theme({
     "thinking": "magenta",
     "speaking": "green"
 })
+
+# --- Voice Activity Detection ---
+# Detector used for automatic endpointing (see core/vad.py).
+VAD_BACKEND = "energy"
+VAD_FRAME_MS = 30
+# Frames quieter than this (in dBFS) are never treated as speech.
+VAD_ENERGY_THRESHOLD_DB = -45.0
+# Speech must also be this much louder than the adaptive background level.
+VAD_NOISE_MARGIN_DB = 10.0
+# Fraction of sign changes per frame above which a frame is treated as noise.
+VAD_MAX_ZERO_CROSSING_RATE = 0.35
+# Continuous speech needed to start an utterance.
+VAD_ONSET_MS = 90
+# Silence after speech that closes the utterance.
+VAD_HANGOVER_MS = 700
+# Audio kept before the onset and after the last speech frame.
+VAD_PADDING_MS = 200
+# Utterances with less speech than this are discarded as clicks or coughs.
+VAD_MIN_SPEECH_MS = 250
+VAD_MAX_UTTERANCE_SECONDS = 30
+
+# --- Pipeline Settings ---
+# Maximum number of items buffered between two stages of the voice pipeline.
+# Small values keep latency low; a full queue applies backpressure upstream.
+PIPELINE_QUEUE_SIZE = 2
+# Speak the agent's final answer sentence by sentence while it is still being
+# generated, instead of waiting for the complete reply.
+STREAMING_RESPONSES = True
+# Segments shorter than this are merged with the next sentence; longer run-on
+# text is cut at a clause boundary so TTS never waits on a huge segment.
+TTS_SEGMENT_MIN_CHARS = 12
+TTS_SEGMENT_MAX_CHARS = 200
+
+# --- WebSocket Server Settings ---
+# `python main.py --serve` serves many voice sessions from one process (see core/server.py).
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_MAX_SESSIONS = 32
+# Requests in flight across all sessions, per shared stage. When a stage is
+# busy, waiting sessions take turns (round robin).
+SERVER_STT_CONCURRENCY = 4
+SERVER_AGENT_CONCURRENCY = 4
+SERVER_TTS_CONCURRENCY = 4
+# Audio messages buffered per connection before the server stops reading from
+# it, which pushes back on a client that sends faster than it is served.
+SERVER_MAX_QUEUED_MESSAGES = 32
+SERVER_MAX_MESSAGE_BYTES = 1024 * 1024
+# Seconds a new connection has to send its "start" message.
+SERVER_HANDSHAKE_SECONDS = 10
+# Key that signs the resume token handed to each session. A client can only
+# resume a conversation with the token it was given for it. When unset, a
+# random key is used, so tokens stop working when the server restarts.
+SERVER_RESUME_SECRET = os.getenv("VOICER_SERVER_SECRET")
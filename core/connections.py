@@ -0,0 +1,216 @@
+# core/connections.py
+
+import asyncio
+import contextvars
+import random
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from .config import (
+    eleven_api_key,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_KEEPALIVE_SECONDS,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_SECONDS,
+    HTTP_BACKOFF_MAX_SECONDS,
+    HTTP_TIMEOUTS,
+    SERVICE_URLS,
+)
+
+# Responses worth retrying: rate limits, cold starts and gateway hiccups.
+RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+_clients = {}
+_async_clients = {}
+_lock = threading.Lock()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _client_options(service: str) -> dict:
+    if service not in HTTP_TIMEOUTS:
+        raise ValueError(f"Unknown service '{service}'. Choose one of: {', '.join(HTTP_TIMEOUTS)}.")
+    return {
+        "http2": _http2_available(),
+        "timeout": httpx.Timeout(**HTTP_TIMEOUTS[service]),
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+        ),
+    }
+
+
+# --- Aborting streamed responses ---
+# Closing a response from another thread doesn't wake a thread blocked
+# reading it, so a cancelled TTS download would wait for one more chunk or
+# the read timeout. Shutting the socket down wakes it at once.
+
+# Called with each response received in the current context (see `abortable_responses`).
+_response_tracker = contextvars.ContextVar("response_tracker", default=None)
+
+
+class AbortableStream(httpx.SyncByteStream):
+    """A response body that another thread can cut off, also while it is blocked reading."""
+    def __init__(self, stream, network_stream):
+        self._stream = stream
+        self._network_stream = network_stream
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        # Marked closed before the connection goes back to the pool, so an
+        # abort never reaches a connection another request is using.
+        with self._lock:
+            self._closed = True
+        self._stream.close()
+
+    def abort(self):
+        with self._lock:
+            if self._closed:
+                return
+            sock = self._network_stream.get_extra_info("socket")
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+def _track_response(response: httpx.Response):
+    track = _response_tracker.get()
+    network_stream = response.extensions.get("network_stream")
+    # An HTTP/2 connection carries other requests too, so it is never cut.
+    if track is None or network_stream is None or response.http_version != "HTTP/1.1":
+        return
+    response.stream = AbortableStream(response.stream, network_stream)
+    track(response.stream)
+
+
+@contextmanager
+def abortable_responses(track):
+    """
+    Calls `track` with an AbortableStream for each HTTP/1.1 response the
+    pooled clients receive in this context, as soon as its headers arrive.
+    """
+    token = _response_tracker.set(track)
+    try:
+        yield
+    finally:
+        _response_tracker.reset(token)
+
+
+def get_client(service: str) -> httpx.Client:
+    """
+    Returns the long-lived, pooled HTTP client for a backend service
+    ("huggingface", "openrouter" or "elevenlabs"). Connections are kept alive
+    between turns, so TCP and TLS handshakes are paid once per process.
+    """
+    with _lock:
+        if service not in _clients:
+            _clients[service] = httpx.Client(**_client_options(service), event_hooks={"response": [_track_response]})
+        return _clients[service]
+
+
+def get_async_client(service: str) -> httpx.AsyncClient:
+    """The asyncio counterpart of `get_client`, for callers on the event loop."""
+    with _lock:
+        if service not in _async_clients:
+            _async_clients[service] = httpx.AsyncClient(**_client_options(service))
+        return _async_clients[service]
+
+
+def backoff_delay(attempt: int, retry_after: str | None = None) -> float:
+    """
+    Seconds to wait before retry number `attempt` (starting at 0): exponential
+    backoff with full jitter, or the server's Retry-After when it sends one.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), HTTP_BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(HTTP_BACKOFF_MAX_SECONDS, HTTP_BACKOFF_SECONDS * 2 ** attempt))
+
+
+def request_with_retry(service: str, method: str, url: str, max_retries: int = HTTP_MAX_RETRIES, **kwargs) -> httpx.Response:
+    """
+    Sends a request on the service's pooled client, retrying transport errors
+    and retryable status codes with jittered backoff. Any request body must be
+    re-iterable so it can be sent again.
+    """
+    client = get_client(service)
+    for attempt in range(max_retries + 1):
+        try:
+            response = client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff_delay(attempt))
+            continue
+        if response.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+            return response
+        time.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+    return response
+
+
+def get_elevenlabs_client():
+    """Returns the shared ElevenLabs client, which sends its requests over the pooled connection."""
+    from elevenlabs.client import ElevenLabs
+    from elevenlabs.environment import ElevenLabsEnvironment
+
+    if not eleven_api_key:
+        raise ValueError("ELEVEN_API_KEY not found in .env file.")
+    httpx_client = get_client("elevenlabs")
+    base = SERVICE_URLS["elevenlabs"]
+    with _lock:
+        if "elevenlabs_sdk" not in _clients:
+            # The SDK's base_url always becomes https://<host>; an environment
+            # keeps the scheme, so a plain-HTTP stand-in works too.
+            _clients["elevenlabs_sdk"] = ElevenLabs(
+                api_key=eleven_api_key,
+                environment=ElevenLabsEnvironment(base=base, wss=base.replace("http", "ws", 1)),
+                httpx_client=httpx_client,
+            )
+        return _clients["elevenlabs_sdk"]
+
+
+def warm_connection(service: str):
+    """Opens a kept-alive connection to a service (best effort, blocking)."""
+    try:
+        get_client(service).head(SERVICE_URLS[service])
+    except httpx.HTTPError:
+        # Pre-warming is best effort; the first real request will retry.
+        pass
+
+
+def prewarm(services=None):
+    """
+    Opens a kept-alive connection to each service in the background, so the
+    first turn doesn't pay for DNS, TCP and TLS setup.
+    """
+    for service in services or SERVICE_URLS:
+        threading.Thread(target=warm_connection, args=(service,), daemon=True).start()
+
+
+async def aprewarm(services=("openrouter",)):
+    """Pre-warms the asyncio clients; must be awaited on the loop that will use them."""
+    async def open_connection(service):
+        try:
+            await get_async_client(service).head(SERVICE_URLS[service])
+        except httpx.HTTPError:
+            pass
+    await asyncio.gather(*(open_connection(service) for service in services))
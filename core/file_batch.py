@@ -0,0 +1,298 @@
+# core/file_batch.py
+
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import FILE_BATCH_MAX_OPERATIONS, FILE_BATCH_MAX_WORKERS
+from .validation import resolve_path
+
+# Mode bits new files get when the umask is unknown.
+_DEFAULT_UMASK = 0o022
+
+# Arguments each operation takes, all strings.
+OPERATIONS = {
+    "write": ("file_path", "content"),
+    "create_directory": ("path",),
+    "delete": ("file_path",),
+    "move": ("source", "destination"),
+}
+
+
+def read_umask() -> int | None:
+    """The process umask as /proc/self/status reports it (Linux), or None."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+# os.umask can only be read by setting it, which would race with other
+# threads creating files. Where /proc can't tell, main.py reads it at
+# startup and passes it in with `set_umask`.
+_umask = read_umask()
+
+
+def set_umask(umask: int):
+    """Records the process umask, unless /proc/self/status already reported it."""
+    global _umask
+    if _umask is None:
+        _umask = umask
+
+
+class BatchError(Exception):
+    """A batch that was rejected during validation, or failed and was rolled back."""
+    def __init__(self, message: str, rolled_back: bool = False):
+        super().__init__(message)
+        self.rolled_back = rolled_back
+
+
+def _overlaps(a: str, b: str) -> bool:
+    """True if one path is the other or lies inside it."""
+    return a == b or a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+
+
+class FileOperation:
+    """One validated entry of a batch."""
+    def __init__(self, number: int, spec):
+        self.number = number
+        if not isinstance(spec, dict) or spec.get("op") not in OPERATIONS:
+            raise BatchError(f"Operation {number}: 'op' must be one of {', '.join(OPERATIONS)}.")
+        self.kind = spec["op"]
+        missing = [key for key in OPERATIONS[self.kind] if not isinstance(spec.get(key), str)]
+        if missing:
+            raise BatchError(f"Operation {number} ({self.kind}): missing {', '.join(repr(key) for key in missing)}.")
+        self.args = {key: spec[key] for key in OPERATIONS[self.kind]}
+        # The paths the operation touches; the first one is where it writes.
+        if self.kind == "move":
+            self.paths = (resolve_path(self.args["destination"]), resolve_path(self.args["source"]))
+        else:
+            self.paths = (resolve_path(self.args.get("file_path") or self.args["path"]),)
+
+    def label(self) -> str:
+        arguments = " to ".join(value for key, value in self.args.items() if key != "content")
+        return f"Operation {self.number} ({self.kind} {arguments})"
+
+    def describe(self) -> str:
+        if self.kind == "write":
+            return f"wrote {self.args['file_path']}"
+        if self.kind == "create_directory":
+            return f"created directory {self.args['path']}"
+        if self.kind == "delete":
+            return f"deleted {self.args['file_path']}"
+        return f"moved {self.args['source']} to {self.args['destination']}"
+
+    def overlaps(self, other: "FileOperation") -> bool:
+        return any(_overlaps(a, b) for a in self.paths for b in other.paths)
+
+
+class FileTransaction:
+    """
+    Runs a batch of file operations as one unit.
+    - Every operation is validated against the file system (as it will be
+      after the earlier operations) before anything is changed.
+    - Operations that touch unrelated paths run concurrently; ones that touch
+      the same path, or a path inside another, run in the order given.
+    - Files are written to a temporary file and renamed into place, and
+      overwritten or deleted files are kept aside until the batch succeeds, so
+      a failure rolls every completed operation back.
+    """
+    def __init__(self, specs, max_workers: int = FILE_BATCH_MAX_WORKERS):
+        if not isinstance(specs, list) or not specs:
+            raise BatchError("'operations' must be a non-empty list.")
+        if len(specs) > FILE_BATCH_MAX_OPERATIONS:
+            raise BatchError(f"A batch can hold at most {FILE_BATCH_MAX_OPERATIONS} operations.")
+        self.operations = [FileOperation(number, spec) for number, spec in enumerate(specs, start=1)]
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._undo = []
+        self._cleanup = []
+
+    # --- Validation ---
+
+    def validate(self):
+        """Raises BatchError listing every operation that cannot succeed."""
+        planned = {}  # path -> "file", "dir" or None, as left by earlier operations
+
+        def state(path):
+            if path in planned:
+                return planned[path]
+            if os.path.isdir(path):
+                return "dir"
+            return "file" if os.path.lexists(path) else None
+
+        def parent_is_file(path):
+            parent = os.path.dirname(path)
+            while parent != os.path.dirname(parent) and state(parent) is None:
+                parent = os.path.dirname(parent)
+            return state(parent) == "file"
+
+        problems = []
+        for op in self.operations:
+            label = op.label()
+            if op.kind != "delete" and parent_is_file(op.paths[0]):
+                problems.append(f"{label}: a parent of that path is a file.")
+                continue
+            if op.kind == "write":
+                if state(op.paths[0]) == "dir":
+                    problems.append(f"{label}: that path is a directory.")
+                planned[op.paths[0]] = "file"
+            elif op.kind == "create_directory":
+                if state(op.paths[0]) == "file":
+                    problems.append(f"{label}: a file with that name exists.")
+                planned[op.paths[0]] = "dir"
+            elif op.kind == "delete":
+                current = state(op.paths[0])
+                if current is None:
+                    problems.append(f"{label}: file not found.")
+                elif current == "dir":
+                    problems.append(f"{label}: that path is a directory.")
+                planned[op.paths[0]] = None
+            else:
+                destination, source = op.paths
+                if state(source) is None:
+                    problems.append(f"{label}: source not found.")
+                elif state(destination) is not None:
+                    problems.append(f"{label}: the destination already exists.")
+                elif _overlaps(destination, source):
+                    problems.append(f"{label}: cannot move a folder into itself.")
+                planned[destination], planned[source] = state(source), None
+        if problems:
+            raise BatchError(" ".join(problems))
+
+    def _waves(self):
+        """Groups the operations so each group only depends on earlier groups."""
+        waves, placed = [], []
+        for op in self.operations:
+            wave = max((level + 1 for other, level in placed if op.overlaps(other)), default=0)
+            if wave == len(waves):
+                waves.append([])
+            waves[wave].append(op)
+            placed.append((op, wave))
+        return waves
+
+    # --- Execution ---
+
+    def _record(self, undo, cleanup=None):
+        with self._lock:
+            self._undo.append(undo)
+            if cleanup is not None:
+                self._cleanup.append(cleanup)
+
+    def _make_directories(self, path: str):
+        """Creates a directory and any missing parents, recording each one for rollback."""
+        with self._lock:
+            missing = []
+            while not os.path.isdir(path):
+                missing.append(path)
+                path = os.path.dirname(path)
+            for directory in reversed(missing):
+                os.mkdir(directory)
+                self._undo.append(lambda directory=directory: os.rmdir(directory))
+
+    @staticmethod
+    def _backup_path(path: str) -> str:
+        directory, name = os.path.split(path)
+        return os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.bak")
+
+    def _set_aside(self, path: str) -> str:
+        """Keeps the current contents of `path` under a hidden name until the batch is done."""
+        backup = self._backup_path(path)
+        try:
+            # A hard link keeps the old contents without copying them and
+            # leaves `path` in place for the atomic replace.
+            os.link(path, backup)
+        except OSError:
+            shutil.copy2(path, backup)
+        return backup
+
+    def _write(self, op: FileOperation):
+        path = op.paths[0]
+        self._make_directories(os.path.dirname(path))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+        backup = None
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(op.args["content"])
+            # mkstemp creates the file as 0600; give it the mode the file
+            # had, or the one a plain open() would have given a new file.
+            try:
+                mode = os.stat(path).st_mode & 0o7777
+            except FileNotFoundError:
+                mode = 0o666 & ~(_DEFAULT_UMASK if _umask is None else _umask)
+            os.chmod(tmp_path, mode)
+            if os.path.lexists(path):
+                backup = self._set_aside(path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            for leftover in (tmp_path, backup):
+                if leftover is not None and os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+        if backup is None:
+            self._record(lambda: os.remove(path))
+        else:
+            self._record(lambda: os.replace(backup, path), lambda: os.remove(backup))
+
+    def _create_directory(self, op: FileOperation):
+        self._make_directories(op.paths[0])
+
+    def _delete(self, op: FileOperation):
+        path = op.paths[0]
+        # Deleting is a rename out of the way; the file is removed once the batch succeeds.
+        backup = self._backup_path(path)
+        os.replace(path, backup)
+        self._record(lambda: os.replace(backup, path), lambda: os.remove(backup))
+
+    def _move(self, op: FileOperation):
+        destination, source = op.paths
+        self._make_directories(os.path.dirname(destination))
+        shutil.move(source, destination)
+        self._record(lambda: shutil.move(destination, source))
+
+    def _execute(self, op: FileOperation):
+        getattr(self, "_" + op.kind)(op)
+
+    def run(self) -> str:
+        """Validates and runs the batch. Returns a summary, or raises BatchError if it was rolled back."""
+        self.validate()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for wave in self._waves():
+                futures = [(op, pool.submit(self._execute, op)) for op in wave]
+                failures = []
+                for op, future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failures.append(f"{op.label()} failed: {e}")
+                if failures:
+                    leftovers = self._rollback()
+                    outcome = (
+                        f"{leftovers} change(s) could not be undone." if leftovers
+                        else "All changes were undone."
+                    )
+                    raise BatchError(f"{'; '.join(failures)}. {outcome}", rolled_back=True)
+
+        for cleanup in self._cleanup:
+            try:
+                cleanup()
+            except OSError:
+                pass
+        return "Done: " + "; ".join(op.describe() for op in self.operations) + "."
+
+    def _rollback(self) -> int:
+        """Undoes the completed operations, newest first. Returns how many could not be undone."""
+        failed = 0
+        for undo in reversed(self._undo):
+            try:
+                undo()
+            except OSError:
+                failed += 1
+        return failed
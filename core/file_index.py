@@ -0,0 +1,378 @@
+# core/file_index.py
+
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from rich.console import Console
+
+from .config import (
+    FILE_INDEX_PATH,
+    FILE_INDEX_ROOTS,
+    FILE_INDEX_EXCLUDE,
+    FILE_INDEX_INCLUDE_HIDDEN,
+    FILE_INDEX_RESCAN_SECONDS,
+    FILE_INDEX_DEBOUNCE_SECONDS,
+    CLI_THEME,
+)
+
+console = Console(theme=CLI_THEME)
+
+_SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_parent ON files(parent);
+CREATE INDEX IF NOT EXISTS files_mtime ON files(mtime);
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+    name, path, content='files', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS files_ai AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts(rowid, name, path) VALUES (new.id, new.name, new.path);
+END;
+CREATE TRIGGER IF NOT EXISTS files_ad AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts(files_fts, rowid, name, path) VALUES ('delete', old.id, old.name, old.path);
+END;
+"""
+
+_SORTS = {
+    "name": "f.name COLLATE NOCASE",
+    "modified": "f.mtime DESC",
+    "size": "f.size DESC",
+    "relevance": "bm25(files_fts)",
+}
+
+
+# --- Filter parsing ---
+
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+_TIME_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_size(value) -> int:
+    """Reads a size such as 2048, '500kb' or '1.5 MB' as a number of bytes."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmg]?)b?\s*", str(value).lower())
+    if not match:
+        raise ValueError(f"'{value}' is not a size such as '10MB'.")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+def parse_time(value) -> float:
+    """
+    Reads a point in time as a Unix timestamp. Accepts timestamps, ISO dates
+    ('2024-05-01', '2024-05-01T09:30'), 'today', 'yesterday' and relative
+    times such as '3 days', '2w' or '12 hours ago'.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().lower()
+    midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if text == "today":
+        return midnight.timestamp()
+    if text == "yesterday":
+        return (midnight - timedelta(days=1)).timestamp()
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*(m|min|minutes?|h|hours?|d|days?|w|weeks?)(?:\s+ago)?", text)
+    if match:
+        return time.time() - float(match.group(1)) * _TIME_UNITS[match.group(2)[0]]
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise ValueError(f"'{value}' is not a date such as '2024-05-01' or a relative time such as '7 days'.")
+
+
+class FileIndex:
+    """
+    A catalog of the files under FILE_INDEX_ROOTS, stored in SQLite with a
+    full-text index on names and paths.
+    - A background worker walks the roots with os.scandir, writing only
+      entries that were added, changed or removed since the last scan.
+    - With watchdog installed (inotify on Linux), changes are applied as they
+      happen; otherwise the roots are rescanned every FILE_INDEX_RESCAN_SECONDS.
+    - Changes made by the file tools are applied right away either way (see
+      `refresh`).
+    - `ready` is set once the first scan of this run has finished; until then
+      queries answer from the index left by the previous run.
+    """
+    def __init__(self, path: str = FILE_INDEX_PATH, roots=FILE_INDEX_ROOTS):
+        self.roots = [os.path.abspath(os.path.expanduser(root)) for root in roots]
+        self.ready = threading.Event()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._changes = queue.Queue()
+        self._pending_writes = 0
+
+    def start(self):
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def covers(self, path: str) -> bool:
+        return any(path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in self.roots)
+
+    # --- Indexing ---
+
+    def _skip(self, name: str) -> bool:
+        return name in FILE_INDEX_EXCLUDE or (name.startswith(".") and not FILE_INDEX_INCLUDE_HIDDEN)
+
+    def _is_skipped(self, path: str) -> bool:
+        """True if the path lies under a hidden or excluded directory of its root."""
+        for root in self.roots:
+            if path.startswith(root.rstrip(os.sep) + os.sep):
+                return any(self._skip(part) for part in os.path.relpath(path, root).split(os.sep))
+        return True
+
+    def _write(self, sql: str, params):
+        """Runs a write, committing in batches. Call with the lock held."""
+        self._conn.execute(sql, params)
+        self._pending_writes += 1
+        if self._pending_writes >= 1000:
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def _delete_tree(self, path: str):
+        # Paths below `path` sort between "path/" and "path0" ('0' follows the separator).
+        self._write(
+            "DELETE FROM files WHERE path = ? OR (path > ? AND path < ?)",
+            (path, path + os.sep, path + chr(ord(os.sep) + 1)),
+        )
+
+    def _upsert(self, path: str, parent: str, name: str, is_dir: bool, size: int, mtime: float):
+        self._write(
+            "INSERT INTO files (path, parent, name, is_dir, size, mtime) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET is_dir = excluded.is_dir, size = excluded.size, mtime = excluded.mtime",
+            (path, parent, name, int(is_dir), size, mtime),
+        )
+
+    def _sync_directory(self, directory: str):
+        """Brings the index entries for one directory's children up to date. Returns its subdirectories."""
+        try:
+            with os.scandir(directory) as entries:
+                current = {}
+                for entry in entries:
+                    if self._skip(entry.name):
+                        continue
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    current[entry.name] = (entry.path, is_dir, 0 if is_dir else stat.st_size, stat.st_mtime)
+        except OSError:
+            current = {}
+
+        with self._lock:
+            indexed = {
+                name: (bool(is_dir), size, mtime)
+                for name, is_dir, size, mtime in self._conn.execute(
+                    "SELECT name, is_dir, size, mtime FROM files WHERE parent = ?", (directory,)
+                )
+            }
+            for name in indexed.keys() - current.keys():
+                self._delete_tree(os.path.join(directory, name))
+            for name, (path, is_dir, size, mtime) in current.items():
+                if indexed.get(name) != (is_dir, size, mtime):
+                    self._upsert(path, directory, name, is_dir, size, mtime)
+        return [path for path, is_dir, _, _ in current.values() if is_dir]
+
+    def _scan(self, root: str):
+        directories = [root]
+        while directories:
+            directories.extend(self._sync_directory(directories.pop()))
+        with self._lock:
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def _refresh(self, path: str):
+        """Re-indexes a single path reported by the file watcher or the file tools."""
+        if self._is_skipped(path):
+            return
+        try:
+            stat = os.stat(path, follow_symlinks=False)
+        except OSError:
+            with self._lock:
+                self._delete_tree(path)
+            return
+        is_dir = os.path.isdir(path) and not os.path.islink(path)
+        parent, name = os.path.split(path)
+        with self._lock:
+            known = self._conn.execute("SELECT 1 FROM files WHERE path = ?", (path,)).fetchone()
+            self._upsert(path, parent, name, is_dir, 0 if is_dir else stat.st_size, stat.st_mtime)
+        if is_dir and not known:
+            # A directory that was created or moved in arrives with its contents.
+            self._scan(path)
+
+    def refresh(self, paths):
+        """
+        Re-indexes paths that were just changed, along with their parent
+        folders, so the next search sees the change without waiting for the
+        watcher or the next rescan.
+        """
+        changed = set()
+        for path in paths:
+            while self.covers(path) and path not in self.roots:
+                changed.add(path)
+                path = os.path.dirname(path)
+        # Parents sort before their contents, so a folder created along the
+        # way is scanned once, from the top.
+        for path in sorted(changed):
+            self._refresh(path)
+        with self._lock:
+            self._conn.commit()
+            self._pending_writes = 0
+
+    # --- Watching ---
+
+    def _watch(self) -> bool:
+        """Starts watching the roots for changes. Returns False if that isn't possible."""
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return False
+
+        changes = self._changes
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type in ("opened", "closed", "closed_no_write"):
+                    return
+                changes.put(os.fsdecode(event.src_path))
+                if getattr(event, "dest_path", None):
+                    changes.put(os.fsdecode(event.dest_path))
+
+        observer = Observer()
+        observer.daemon = True
+        try:
+            for root in self.roots:
+                observer.schedule(_Handler(), root, recursive=True)
+            observer.start()
+        except OSError as e:
+            # E.g. the inotify watch limit is too low for the indexed tree.
+            console.print(f"[warning]File index: cannot watch for changes ({e}); rescanning periodically instead.[/warning]")
+            return False
+        return True
+
+    def _worker(self):
+        watching = self._watch()
+        for root in self.roots:
+            if os.path.isdir(root):
+                self._scan(root)
+        self.ready.set()
+
+        while True:
+            if not watching:
+                time.sleep(FILE_INDEX_RESCAN_SECONDS)
+                for root in self.roots:
+                    self._scan(root)
+                continue
+            # Collect a burst of events (e.g. a file being written) and apply them once.
+            paths = {self._changes.get()}
+            deadline = time.monotonic() + FILE_INDEX_DEBOUNCE_SECONDS
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    paths.add(self._changes.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            for path in sorted(paths):
+                self._refresh(path)
+            with self._lock:
+                self._conn.commit()
+                self._pending_writes = 0
+
+    # --- Queries ---
+
+    def query(
+        self,
+        text: str | None = None,
+        under: str | None = None,
+        recursive: bool = True,
+        glob: str | None = None,
+        kind: str | None = None,
+        modified_after: float | None = None,
+        modified_before: float | None = None,
+        min_size: int | None = None,
+        max_size: int | None = None,
+        sort: str = "name",
+        limit: int = 20,
+        offset: int = 0,
+    ):
+        """
+        Returns (rows, total) for the entries matching every given filter.
+        Rows are (path, is_dir, size, mtime) tuples; `total` counts all
+        matches, not just the returned page.
+        """
+        tables, clauses, params = "files f", [], []
+        terms = re.findall(r"\w+", text or "")
+        if terms:
+            # Every word must appear in the name or path, as a word prefix.
+            tables += " JOIN files_fts ON files_fts.rowid = f.id"
+            clauses.append("files_fts MATCH ?")
+            params.append(" ".join(f'"{term}"*' for term in terms))
+        elif sort == "relevance":
+            sort = "modified"
+        if under:
+            if recursive:
+                clauses.append("f.path > ? AND f.path < ?")
+                params += [under.rstrip(os.sep) + os.sep, under.rstrip(os.sep) + chr(ord(os.sep) + 1)]
+            else:
+                clauses.append("f.parent = ?")
+                params.append(under)
+        if glob:
+            column = "f.path" if "/" in glob or os.sep in glob else "f.name"
+            clauses.append(f"lower({column}) GLOB ?")
+            params.append(glob.lower())
+        if kind:
+            clauses.append("f.is_dir = ?")
+            params.append(int(kind == "directory"))
+        for clause, value in (
+            ("f.mtime >= ?", modified_after),
+            ("f.mtime <= ?", modified_before),
+            ("f.size >= ?", min_size),
+            ("f.size <= ?", max_size),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        with self._lock:
+            total = self._conn.execute(f"SELECT count(*) FROM {tables}{where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT f.path, f.is_dir, f.size, f.mtime FROM {tables}{where} "
+                f"ORDER BY {_SORTS[sort]} LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return rows, total
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_file_index() -> FileIndex:
+    """Returns the shared file index, starting its background worker on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FileIndex()
+            _index.start()
+        return _index
+
+
+def refresh_file_index(paths):
+    """Applies changes the file tools made, if the file index is in use."""
+    if _index is not None:
+        _index.refresh(paths)
@@ -0,0 +1,124 @@
+# core/memory.py
+
+from langchain_core.messages import HumanMessage, RemoveMessage, ToolMessage, get_buffer_string
+from langchain_core.messages.utils import count_tokens_approximately
+from rich.console import Console
+
+from .prompts import SUMMARY_PROMPT
+from .config import AGENT_HISTORY_TOKEN_BUDGET, AGENT_HISTORY_KEEP_TOKENS, AGENT_TOOL_OUTPUT_MAX_CHARS, CLI_THEME
+
+console = Console(theme=CLI_THEME)
+
+
+def compact_tool_output(message: ToolMessage) -> ToolMessage:
+    """Replaces a tool result with a short reference; the tool call's arguments stay in the history."""
+    content = message.content
+    reference = (
+        f"[{message.name} output elided after use: {len(content)} characters, "
+        f"{content.count(chr(10)) + 1} lines. Call {message.name} again if the contents are needed.]"
+    )
+    # The same id makes the checkpointer replace the message in place.
+    return ToolMessage(
+        content=reference,
+        tool_call_id=message.tool_call_id,
+        name=message.name,
+        id=message.id,
+        additional_kwargs={"compacted": True},
+    )
+
+
+class ConversationMemory:
+    """
+    Keeps a checkpointed conversation within a token budget. It runs at the
+    end of every turn, after the reply has been produced:
+    - Tool outputs longer than `tool_output_max_chars` have been consumed by
+      then, so they are replaced by short references.
+    - If the history still exceeds `token_budget`, the oldest whole turns are
+      folded into a running summary and removed, leaving about `keep_tokens`
+      of recent turns verbatim. The last turn is always kept.
+    """
+    def __init__(
+        self,
+        llm,
+        token_budget: int = AGENT_HISTORY_TOKEN_BUDGET,
+        keep_tokens: int = AGENT_HISTORY_KEEP_TOKENS,
+        tool_output_max_chars: int = AGENT_TOOL_OUTPUT_MAX_CHARS,
+    ):
+        self.llm = llm
+        self.token_budget = token_budget
+        self.keep_tokens = keep_tokens
+        self.tool_output_max_chars = tool_output_max_chars
+
+    def _plan(self, messages):
+        """Returns (compacted tool messages, the history as it will be after compaction)."""
+        compacted = []
+        history = []
+        for message in messages:
+            if (
+                isinstance(message, ToolMessage)
+                and isinstance(message.content, str)
+                and len(message.content) > self.tool_output_max_chars
+                and not message.additional_kwargs.get("compacted")
+            ):
+                message = compact_tool_output(message)
+                compacted.append(message)
+            history.append(message)
+        return compacted, history
+
+    def _split(self, history):
+        """Returns the index of the first message to keep verbatim (0 keeps everything)."""
+        if count_tokens_approximately(history) <= self.token_budget:
+            return 0
+        # Cut only before a user message, so a tool call is never separated
+        # from its result.
+        turn_starts = [i for i, message in enumerate(history) if isinstance(message, HumanMessage)]
+        if len(turn_starts) < 2:
+            return 0
+        cut = turn_starts[-1]
+        for start in reversed(turn_starts[:-1]):
+            if count_tokens_approximately(history[start:]) > self.keep_tokens:
+                break
+            cut = start
+        return cut
+
+    def _prepare(self, state):
+        """Returns (compacted tool messages, the old turns to fold into the summary)."""
+        compacted, history = self._plan(state["messages"])
+        return compacted, history[:self._split(history)]
+
+    def _result(self, compacted, dropped, summary=None) -> dict:
+        dropped_ids = {message.id for message in dropped}
+        messages = [message for message in compacted if message.id not in dropped_ids]
+        messages += [RemoveMessage(id=message.id) for message in dropped]
+        if summary is None:
+            return {"messages": messages}
+        return {"messages": messages, "summary": summary}
+
+    def _summary_prompt(self, state, dropped) -> str:
+        return SUMMARY_PROMPT.format(
+            summary=state.get("summary") or "(none yet)", transcript=get_buffer_string(dropped)
+        )
+
+    def update(self, state) -> dict:
+        """Graph node: compacts consumed tool outputs and summarizes old turns."""
+        compacted, dropped = self._prepare(state)
+        if not dropped:
+            return self._result(compacted, [])
+        try:
+            response = self.llm.invoke(self._summary_prompt(state, dropped))
+        except Exception as e:
+            # Keep the full history and try again after the next turn.
+            console.print(f"[warning]Could not summarize the conversation: {e}[/warning]")
+            return self._result(compacted, [])
+        return self._result(compacted, dropped, response.content.strip())
+
+    async def aupdate(self, state) -> dict:
+        compacted, dropped = self._prepare(state)
+        if not dropped:
+            return self._result(compacted, [])
+        try:
+            response = await self.llm.ainvoke(self._summary_prompt(state, dropped))
+        except Exception as e:
+            console.print(f"[warning]Could not summarize the conversation: {e}[/warning]")
+            return self._result(compacted, [])
+        return self._result(compacted, dropped, response.content.strip())
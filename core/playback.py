@@ -0,0 +1,95 @@
+# core/playback.py
+
+import sounddevice as sd
+
+from .config import SPEAKER_DEVICE_ID, PLAYBACK_JITTER_MS, PLAYBACK_SLICE_MS
+
+
+class PcmPlayer:
+    """
+    Plays streamed 16-bit mono PCM through a sounddevice output stream.
+    - Starts once a small jitter buffer has filled, then writes each chunk as
+      soon as it arrives.
+    - Keeps the output stream open between clips, so consecutive sentences
+      play back to back without reopening the device.
+    - Writes in short slices and checks between them whether playback was
+      interrupted; an interruption also drops the audio already queued in
+      the device. Each slice is recorded in `reference` for echo suppression.
+    """
+    def __init__(
+        self,
+        device=SPEAKER_DEVICE_ID,
+        jitter_ms: int = PLAYBACK_JITTER_MS,
+        slice_ms: int = PLAYBACK_SLICE_MS,
+        reference=None,
+    ):
+        self.device = device
+        self.jitter_ms = jitter_ms
+        self.slice_ms = slice_ms
+        self.reference = reference
+        self._stream = None
+
+    def _output_stream(self, sample_rate: int):
+        if self._stream is not None and self._stream.samplerate != sample_rate:
+            self.close()
+        if self._stream is None:
+            self._stream = sd.RawOutputStream(
+                samplerate=sample_rate, channels=1, dtype='int16', device=self.device, latency='low'
+            )
+            self._stream.start()
+        elif not self._stream.active:
+            # Restart after an interruption aborted the stream.
+            self._stream.start()
+        return self._stream
+
+    def _write(self, stream, pcm: bytes, slice_bytes: int, interrupted) -> bool:
+        """Writes whole frames slice by slice. Returns False if playback was interrupted."""
+        for offset in range(0, len(pcm), slice_bytes):
+            if interrupted is not None and interrupted():
+                stream.abort()
+                return False
+            block = pcm[offset:offset + slice_bytes]
+            stream.write(block)
+            if self.reference is not None:
+                self.reference.add(block)
+        return True
+
+    def play(self, clip, sample_rate: int, interrupted=None) -> bool:
+        """
+        Plays an iterable of PCM byte chunks, blocking until it has been
+        written out or `interrupted()` returns True. Returns False if it was
+        interrupted.
+        """
+        chunks = iter(clip)
+        jitter_bytes = int(sample_rate * self.jitter_ms / 1000) * 2
+        pending = bytearray()
+        for chunk in chunks:
+            pending += chunk
+            if len(pending) >= jitter_bytes:
+                break
+        if not pending:
+            return True
+
+        stream = self._output_stream(sample_rate)
+        slice_bytes = max(1, int(sample_rate * self.slice_ms / 1000)) * 2
+        while True:
+            # The output stream takes whole int16 frames; an odd trailing byte
+            # waits for the next chunk.
+            whole = len(pending) & ~1
+            if whole:
+                if not self._write(stream, bytes(pending[:whole]), slice_bytes, interrupted):
+                    return False
+                del pending[:whole]
+            chunk = next(chunks, None)
+            if chunk is None:
+                # A cancelled clip ends early; drop what the device still holds.
+                if interrupted is not None and interrupted():
+                    stream.abort()
+                    return False
+                return True
+            pending += chunk
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
@@ -0,0 +1,226 @@
+# core/prefetch.py
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import (
+    PREFETCH_CACHE_MAX_BYTES,
+    PREFETCH_MAX_FILE_BYTES,
+    PREFETCH_MAX_TARGETS,
+    PREFETCH_MAX_WORKERS,
+)
+from .validation import ToolError, resolve_path
+
+# Words of a transcript, keeping the characters paths are made of.
+_TOKENS = re.compile(r"[\w~./\\-]+")
+# A file name with an extension, such as "notes.txt".
+_FILE_NAME = re.compile(r"\w\.[A-Za-z0-9]{1,8}$")
+# Bare words shorter than this are never matched against folder contents.
+_MIN_WORD_LENGTH = 3
+
+
+def _stamp(stat) -> tuple:
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def mentioned_paths(text: str, names: dict) -> list:
+    """
+    The paths a transcript is likely to be about, most explicit first:
+    - tokens that look like paths or file names ("~/notes", "report.pdf",
+      also spoken as "report dot pdf"), tried relative to the working
+      directory and to the home folder;
+    - bare words that match an entry of an already listed folder, such as
+      "documents" for ~/Documents or "notes" for notes.txt. `names` maps
+      each lowercased name and stem to its full path.
+    """
+    text = re.sub(r"\s+dot\s+(?=\w)", ".", text)
+    paths = []
+    for token in _TOKENS.findall(text):
+        token = token.rstrip(".,")
+        if not token:
+            continue
+        if "/" in token or "\\" in token or token.startswith("~") or _FILE_NAME.search(token):
+            paths.append(token)
+            if not os.path.isabs(token) and not token.startswith("~"):
+                paths.append(os.path.join("~", token))
+        elif len(token) >= _MIN_WORD_LENGTH and token.lower() in names:
+            paths.append(names[token.lower()])
+    return list(dict.fromkeys(paths))
+
+
+class SpeculativePrefetcher:
+    """
+    Reads ahead for the read-only file tools while the user is still
+    talking and the agent is thinking.
+    - `observe(text)` takes a partial or final transcript and, on a small
+      pool of its own, stats the paths it mentions: folders are listed and
+      files up to `max_file_bytes` are read into a bounded LRU cache.
+    - `read(path)` and `listing(path)` serve read_file and list_directory.
+      A prefetch still in flight is waited for rather than repeated, and an
+      entry is used only while the path's modification time and size are
+      what they were when it was read.
+    - Nothing here raises; a failed prefetch just leaves the tool to do the
+      work itself.
+    """
+    def __init__(
+        self,
+        max_bytes: int = PREFETCH_CACHE_MAX_BYTES,
+        max_file_bytes: int = PREFETCH_MAX_FILE_BYTES,
+        max_targets: int = PREFETCH_MAX_TARGETS,
+        max_workers: int = PREFETCH_MAX_WORKERS,
+    ):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.max_targets = max_targets
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (kind, path) -> (stamp, value, bytes)
+        self._bytes = 0
+        self._inflight = {}
+        self._names = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+
+    # --- Speculation ---
+
+    def observe(self, text: str):
+        """Starts prefetching what `text` mentions, plus the working and home folders."""
+        if not text:
+            return
+        with self._lock:
+            names = dict(self._names)
+        targets = [".", "~"] + mentioned_paths(text, names)
+        cwd = os.getcwd()
+        for path in targets[:self.max_targets + 2]:
+            # The same absolute path the tools resolve to; the sandbox check
+            # follows symlinks, so it runs on the worker.
+            full_path = os.path.normpath(os.path.join(cwd, os.path.expanduser(path)))
+            with self._lock:
+                if full_path in self._inflight:
+                    continue
+                self._inflight[full_path] = self._executor.submit(self._prefetch, full_path)
+
+    def _prefetch(self, path: str):
+        try:
+            resolve_path(path)
+            # Stamped before reading: a change made while reading leaves the
+            # entry with the old stamp, so it is never served.
+            stat = os.stat(path)
+            if os.path.isdir(path):
+                names = os.listdir(path)
+                self._store_unchanged(("list", path), _stamp(stat), names, sum(len(name) for name in names))
+                self._learn(path, names)
+            elif os.path.isfile(path) and stat.st_size <= self.max_file_bytes:
+                if self._current(("read", path), _stamp(stat)):
+                    return
+                with open(path, "rb") as f:
+                    data = f.read()
+                self._store_unchanged(("read", path), _stamp(stat), data, len(data))
+        except (OSError, ToolError):
+            pass
+        finally:
+            with self._lock:
+                self._inflight.pop(path, None)
+
+    def _learn(self, directory: str, names: list):
+        """Remembers a folder's entries so later transcripts can name them without a path."""
+        with self._lock:
+            for name in names:
+                if name.startswith("."):
+                    continue
+                full_path = os.path.join(directory, name)
+                self._names.setdefault(name.lower(), full_path)
+                stem = os.path.splitext(name)[0].lower()
+                if stem:
+                    self._names.setdefault(stem, full_path)
+
+    # --- Cache ---
+
+    def _current(self, key: tuple, stamp: tuple) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] == stamp
+
+    def _store(self, key: tuple, stamp: tuple, value, size: int):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (stamp, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def _store_unchanged(self, key: tuple, stamp: tuple, value, size: int):
+        """Stores what was read under `stamp` if the path still has it, else drops the entry."""
+        if _stamp(os.stat(key[1])) == stamp:
+            self._store(key, stamp, value, size)
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+
+    def _lookup(self, kind: str, path: str):
+        with self._lock:
+            pending = self._inflight.get(path)
+        if pending is not None:
+            pending.result()
+        with self._lock:
+            entry = self._entries.get((kind, path))
+        if entry is not None:
+            try:
+                fresh = _stamp(os.stat(path)) == entry[0]
+            except OSError:
+                fresh = False
+            if not fresh:
+                with self._lock:
+                    if self._entries.get((kind, path)) is entry:
+                        del self._entries[(kind, path)]
+                        self._bytes -= entry[2]
+                entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((kind, path))
+            self.hits += 1
+            return entry[1]
+
+    def read(self, path: str) -> bytes | None:
+        """The contents of the file at the absolute `path`, if prefetched and unchanged."""
+        return self._lookup("read", path)
+
+    def listing(self, path: str) -> list | None:
+        """The entries of the folder at the absolute `path`, if prefetched and unchanged."""
+        return self._lookup("list", path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> SpeculativePrefetcher:
+    """Returns the prefetcher shared by the transcription side and the file tools."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = SpeculativePrefetcher()
+        return _prefetcher
@@ -0,0 +1,205 @@
+# core/preprocess.py
+
+import functools
+import io
+import math
+
+import numpy as np
+from rich.console import Console
+from scipy.signal import firwin, lfilter, upfirdn
+
+from .ringbuffer import WavBody
+from .config import (
+    AUDIO_DC_CUTOFF_HZ,
+    AUDIO_TARGET_DBFS,
+    AUDIO_MAX_GAIN_DB,
+    STT_UPLOAD_CODEC,
+    CLI_THEME,
+)
+
+console = Console(theme=CLI_THEME)
+
+# Frame length used to measure an utterance's loudness.
+_LOUDNESS_FRAME_SECONDS = 0.02
+# Gain changes smaller than this aren't worth copying the audio for.
+_MIN_GAIN_DB = 1.0
+# Room left below full scale after normalizing.
+_PEAK_HEADROOM_DB = 1.0
+
+
+# --- CAPTURE ---
+
+@functools.lru_cache(maxsize=8)
+def _lowpass(up: int, down: int) -> np.ndarray:
+    """The anti-aliasing filter scipy.signal.resample_poly uses for these factors."""
+    max_rate = max(up, down)
+    half_length = 10 * max_rate
+    return (firwin(2 * half_length + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * up).astype(np.float32)
+
+
+class StreamingResampler:
+    """
+    Polyphase resampling of a stream, one block at a time.
+    - Uses the same Kaiser-windowed low-pass as scipy.signal.resample_poly,
+      but keeps the tail of the previous input so consecutive blocks join
+      without edge effects.
+    - The filter is causal, which delays the output by half its length
+      (under a millisecond for 44.1 or 48 kHz to 16 kHz).
+    - Blocks of any size work; the output is as long as the input allows.
+    """
+    def __init__(self, input_rate: int, output_rate: int):
+        divisor = math.gcd(input_rate, output_rate)
+        self.up, self.down = output_rate // divisor, input_rate // divisor
+        self._taps = _lowpass(self.up, self.down)
+        self.reset()
+
+    def reset(self):
+        self._history = np.zeros(0, dtype=np.float32)
+        # Input index of the first held sample, kept a multiple of `down` so
+        # the held input lines up with whole output samples.
+        self._start = 0
+        self._next = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        pending = np.concatenate((self._history, samples))
+        last = ((self._start + len(pending) - 1) * self.up) // self.down
+        if last < self._next:
+            self._history = pending
+            return np.zeros(0, dtype=np.float32)
+        base = self._start * self.up // self.down
+        output = upfirdn(self._taps, pending, self.up, self.down)[self._next - base:last - base + 1]
+        self._next = last + 1
+        # Keep the input the next output sample's filter window reaches back to.
+        keep = max(self._start, (self._next * self.down - len(self._taps) + 1) // self.up)
+        keep -= (keep - self._start) % self.down
+        self._history = pending[keep - self._start:]
+        self._start = keep
+        return output.astype(np.float32, copy=False)
+
+
+class DcBlocker:
+    """A one-pole high-pass filter that removes a microphone's DC offset, with state across blocks."""
+    def __init__(self, sample_rate: int, cutoff_hz: float):
+        pole = math.exp(-2 * math.pi * cutoff_hz / sample_rate)
+        self._b = np.array([1.0, -1.0], dtype=np.float32)
+        self._a = np.array([1.0, -pole], dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        self._state = np.zeros(1, dtype=np.float32)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        output, self._state = lfilter(self._b, self._a, samples, zi=self._state)
+        return output.astype(np.float32, copy=False)
+
+
+class AudioPreprocessor:
+    """
+    Turns the blocks a microphone delivers at its native rate and channel
+    count into int16 mono at the pipeline's rate.
+    - Channels are averaged (downmix), then resampled with a streaming
+      polyphase filter, then the DC offset is removed.
+    - When the device already delivers mono at the pipeline's rate and DC
+      removal is off, blocks pass through untouched.
+    - Call `reset()` before each new stream.
+    """
+    def __init__(self, input_rate: int, output_rate: int, channels: int = 1, dc_cutoff_hz: float | None = AUDIO_DC_CUTOFF_HZ):
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.channels = channels
+        self._resampler = StreamingResampler(input_rate, output_rate) if input_rate != output_rate else None
+        self._dc = DcBlocker(output_rate, dc_cutoff_hz) if dc_cutoff_hz else None
+        self.passthrough = self._resampler is None and self._dc is None and channels == 1
+
+    def reset(self):
+        if self._resampler is not None:
+            self._resampler.reset()
+        if self._dc is not None:
+            self._dc.reset()
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Takes int16 samples shaped (frames, channels) and returns 1-D int16 mono."""
+        if self.passthrough:
+            return block.reshape(-1)
+        samples = block.reshape(-1, self.channels).astype(np.float32)
+        samples = samples.mean(axis=1) if self.channels > 1 else samples.reshape(-1)
+        if self._resampler is not None:
+            samples = self._resampler.process(samples)
+        if self._dc is not None:
+            samples = self._dc.process(samples)
+        return np.clip(np.rint(samples), -32768, 32767).astype(np.int16)
+
+
+# --- UPLOAD ---
+
+def normalize_loudness(
+    segments: list,
+    sample_rate: int,
+    target_dbfs: float | None = AUDIO_TARGET_DBFS,
+    max_gain_db: float = AUDIO_MAX_GAIN_DB,
+) -> list:
+    """
+    Scales an utterance so its speech sits at `target_dbfs` RMS.
+    Loudness is measured on the louder half of its 20 ms frames, so pauses
+    don't count. Quiet audio is boosted by at most `max_gain_db`, and never
+    so far that the peak clips. Returns the segments untouched (no copy)
+    when the change would be under a decibel.
+    """
+    if target_dbfs is None or not segments:
+        return segments
+    samples = np.concatenate(segments).astype(np.float32) / 32768.0
+    frame = max(1, int(sample_rate * _LOUDNESS_FRAME_SECONDS))
+    count = len(samples) // frame
+    if count == 0:
+        return segments
+    energy = np.sort(np.mean(samples[:count * frame].reshape(count, frame) ** 2, axis=1))[count // 2:]
+    level = 10 * math.log10(max(float(np.mean(energy)), 1e-10))
+    peak = 20 * math.log10(max(float(np.max(np.abs(samples))), 1e-10))
+    gain = min(target_dbfs - level, max_gain_db, -_PEAK_HEADROOM_DB - peak)
+    if abs(gain) < _MIN_GAIN_DB:
+        return segments
+    scaled = samples * (32768.0 * 10 ** (gain / 20))
+    return [np.clip(np.rint(scaled), -32768, 32767).astype(np.int16)]
+
+
+# (libsndfile format, subtype, content type) per upload codec.
+_CODECS = {
+    "flac": ("FLAC", "PCM_16", "audio/flac"),
+    "opus": ("OGG", "OPUS", "audio/ogg"),
+}
+_codec_warning_shown = False
+
+
+def _compress(segments: list, sample_rate: int, codec: str):
+    """The utterance encoded with `codec`, or None if it can't be (the caller falls back to WAV)."""
+    global _codec_warning_shown
+    try:
+        import soundfile
+    except ImportError:
+        problem = f"The {codec} upload codec needs soundfile (`pip install soundfile`)"
+    else:
+        file_format, subtype, _ = _CODECS[codec]
+        data = io.BytesIO()
+        try:
+            soundfile.write(data, np.concatenate(segments), sample_rate, format=file_format, subtype=subtype)
+            return data.getvalue()
+        except (RuntimeError, ValueError, TypeError) as e:
+            problem = f"Could not encode the upload as {codec} ({e})"
+    if not _codec_warning_shown:
+        _codec_warning_shown = True
+        console.print(f"[warning]{problem}; uploading WAV instead.[/warning]")
+    return None
+
+
+def encode_upload(segments: list, sample_rate: int, codec: str = STT_UPLOAD_CODEC):
+    """
+    Returns (body, content type) for an utterance upload: a zero-copy WAV
+    body, or FLAC or Opus bytes when STT_UPLOAD_CODEC asks for them.
+    """
+    if codec not in ("wav", *_CODECS):
+        raise ValueError(f"Unknown STT_UPLOAD_CODEC '{codec}'. Choose one of: wav, {', '.join(_CODECS)}.")
+    if codec != "wav" and segments:
+        body = _compress(segments, sample_rate, codec)
+        if body is not None:
+            return body, _CODECS[codec][2]
+    return WavBody(segments, sample_rate), "audio/wav"
@@ -0,0 +1,191 @@
+# core/response_cache.py
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from .config import (
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_SIMILARITY,
+    RESPONSE_CACHE_TOOLS,
+)
+
+# Words that change how a command is phrased but not what it asks for.
+_FILLERS = re.compile(
+    r"\b(please|hey|hi|okay|ok|um+|uh+|so|just|now|quickly|"
+    r"can you|could you|would you|will you|i want you to|i'd like you to|for me)\b"
+)
+
+
+def normalize_command(text: str) -> str:
+    """Lowercases a transcribed command and strips fillers and punctuation."""
+    text = text.lower()
+    # Spoken file names: "notes dot txt" -> "notes.txt"
+    text = re.sub(r"\s+dot\s+(?=\w)", ".", text)
+    text = _FILLERS.sub(" ", text)
+    tokens = [token.strip(".,!?;:'\"") for token in text.split()]
+    return " ".join(token for token in tokens if token)
+
+
+def _trigrams(text: str) -> Counter:
+    padded = f"  {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    dot = sum(count * b[gram] for gram, count in a.items())
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+
+# Words that only change the phrasing of a command that remains after the
+# fillers are stripped, and words that ask for the same thing.
+_SOFT_WORDS = {"the", "a", "an", "me", "my", "of", "contents", "content", "what's", "whats", "what", "is"}
+_PARAPHRASES = {"show": "read", "open": "read", "display": "read", "print": "read", "ls": "list"}
+
+
+def content_key(tokens) -> tuple:
+    """
+    The words of a normalized command that carry its meaning, in order and
+    with paraphrases unified. Two commands can share a reply only if these
+    are identical: "first" vs "last" or "budget" vs "bucket" never match.
+    """
+    return tuple(_PARAPHRASES.get(token, token) for token in tokens if token not in _SOFT_WORDS)
+
+
+def tool_call_path(call) -> str | None:
+    """Reads the file or directory path from a tool call's arguments."""
+    data = call["args"].get("tool_input", call["args"])
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except json.JSONDecodeError:
+            return None
+    if not isinstance(data, dict):
+        return None
+    path = data.get("file_path", data.get("path", "." if call["name"] == "list_directory" else None))
+    return path if isinstance(path, str) else None
+
+
+def fingerprint(path: str):
+    """(mtime, size) of a file or directory, or None if it doesn't exist."""
+    try:
+        stat = os.stat(os.path.expanduser(path))
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class CachedResponse:
+    """A resolved turn: the read-only tool calls it made and the reply it produced."""
+    def __init__(self, command: str, tool_calls, reply: str, fingerprints: dict):
+        self.command = command
+        self.tokens = set(command.split())
+        self.key = content_key(command.split())
+        self.vector = _trigrams(command)
+        self.tool_calls = tool_calls
+        self.reply = reply
+        self.fingerprints = fingerprints
+
+    def is_fresh(self) -> bool:
+        return all(fingerprint(path) == stamp for path, stamp in self.fingerprints.items())
+
+
+class ResponseCache:
+    """
+    Remembers replies to read-only commands so repeats skip the LLM.
+    - A turn is recorded only if every tool call it made is read-only
+      (RESPONSE_CACHE_TOOLS) and the command names each path it touched, so
+      context-dependent commands ("read it again") are never cached.
+    - Lookups match the normalized command exactly, or a near-duplicate whose
+      every meaningful word is the same (only articles, fillers and
+      paraphrases like "show"/"read" may differ) and whose character
+      trigrams are similar enough.
+    - An entry is served only while the files and directories it read have
+      the same modification time and size as when it was recorded.
+    """
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+        tools=RESPONSE_CACHE_TOOLS,
+    ):
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.tools = set(tools)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _match(self, command: str):
+        """Returns the best matching entry for a normalized command. Call with the lock held."""
+        if command in self._entries:
+            return self._entries[command]
+        key = content_key(command.split())
+        vector = _trigrams(command)
+        best, best_score = None, self.similarity
+        for entry in self._entries.values():
+            if entry.key != key:
+                continue
+            score = _cosine(vector, entry.vector)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def lookup(self, text: str) -> CachedResponse | None:
+        """Returns a still-valid cached response for a command, or None."""
+        command = normalize_command(text)
+        with self._lock:
+            entry = self._match(command) if command else None
+        if entry is not None and not entry.is_fresh():
+            with self._lock:
+                self._entries.pop(entry.command, None)
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry.command)
+            self.hits += 1
+            return entry
+
+    def record(self, text: str, tool_calls, reply: str):
+        """Stores a completed turn if it can be safely replayed."""
+        command = normalize_command(text)
+        if not command or not tool_calls or not reply:
+            return
+        # Split like the paths below, so "notes/todo.txt" names both parts.
+        tokens = {part for token in command.split() for part in re.split(r"[\\/]", token)}
+        fingerprints = {}
+        for call in tool_calls:
+            if call["name"] not in self.tools:
+                return
+            path = tool_call_path(call)
+            if path is None:
+                return
+            # The command has to name the path (the working directory needs no
+            # name), otherwise the call was resolved from earlier context.
+            parts = {part for part in re.split(r"[\\/]", path.lower()) if part not in ("", ".", "~")}
+            if parts and not parts & tokens:
+                return
+            fingerprints[os.path.abspath(os.path.expanduser(path))] = fingerprint(path)
+        calls = [{"name": call["name"], "args": call["args"]} for call in tool_calls]
+        with self._lock:
+            self._entries[command] = CachedResponse(command, calls, reply, fingerprints)
+            self._entries.move_to_end(command)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+            }
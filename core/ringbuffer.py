@@ -0,0 +1,151 @@
+# core/ringbuffer.py
+
+import queue
+import struct
+import threading
+
+import numpy as np
+
+
+def wav_header(num_samples: int, sample_rate: int, channels: int = 1) -> bytes:
+    """Builds the 44-byte header of a 16-bit PCM WAV file."""
+    data_size = num_samples * channels * 2
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * channels * 2, channels * 2, 16,
+        b"data", data_size,
+    )
+
+
+class AudioRingBuffer:
+    """
+    A fixed-capacity int16 buffer that the audio callback writes into.
+    - Samples are addressed by their absolute index since the last `clear()`.
+    - Once full, new samples overwrite the oldest ones.
+    - Reads return views into the buffer instead of copies where possible.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.int16)
+        self._lock = threading.Lock()
+        self.total_written = 0
+
+    def clear(self):
+        with self._lock:
+            self.total_written = 0
+
+    @property
+    def oldest(self) -> int:
+        """Absolute index of the oldest sample still held in the buffer."""
+        return max(0, self.total_written - self.capacity)
+
+    def write(self, samples: np.ndarray):
+        """Appends samples, wrapping around at the end of the buffer."""
+        samples = samples.reshape(-1)
+        if len(samples) > self.capacity:
+            skipped = len(samples) - self.capacity
+            samples = samples[skipped:]
+        else:
+            skipped = 0
+        with self._lock:
+            start = (self.total_written + skipped) % self.capacity
+            first = min(len(samples), self.capacity - start)
+            self._data[start:start + first] = samples[:first]
+            self._data[:len(samples) - first] = samples[first:]
+            self.total_written += skipped + len(samples)
+
+    def segments(self, start: int, stop: int) -> list:
+        """
+        Returns the samples in [start, stop) as one or two int16 array views
+        (two when the range wraps around the end of the buffer).
+        """
+        with self._lock:
+            start = max(start, self.oldest)
+            stop = min(stop, self.total_written)
+        if stop <= start:
+            return []
+        begin, end = start % self.capacity, stop % self.capacity
+        if begin < end or end == 0:
+            return [self._data[begin:end or self.capacity]]
+        return [self._data[begin:], self._data[:end]]
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """Returns [start, stop) as one array; only a wrapped range is copied."""
+        parts = self.segments(start, stop)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int16)
+
+
+class WavBody:
+    """
+    An upload body that streams a WAV header followed by PCM views straight
+    out of a ring buffer, so the audio is never copied into a bytes object.
+    Defines `__len__` so HTTP clients send a Content-Length instead of chunking.
+    """
+    def __init__(self, segments: list, sample_rate: int):
+        self._chunks = [memoryview(np.ascontiguousarray(s)).cast("B") for s in segments]
+        num_samples = sum(len(c) for c in self._chunks) // 2
+        self._chunks.insert(0, memoryview(wav_header(num_samples, sample_rate)))
+
+    def __len__(self):
+        return sum(len(c) for c in self._chunks)
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+
+class RecordedAudio:
+    """
+    One captured utterance: a [start, stop) range of a pooled ring buffer.
+    Call `release()` once the audio has been consumed so the buffer can be
+    reused for a later capture.
+    """
+    def __init__(self, pool, buffer: AudioRingBuffer, start: int, stop: int, sample_rate: int):
+        self._pool = pool
+        self.buffer = buffer
+        self.start = start
+        self.stop = stop
+        self.sample_rate = sample_rate
+        # Set by the capture side when the utterance was transcribed while it
+        # was still being recorded (see core/transcription.py).
+        self.incremental = None
+
+    def __len__(self):
+        return self.stop - self.start
+
+    @property
+    def duration(self) -> float:
+        return len(self) / self.sample_rate
+
+    def samples(self) -> np.ndarray:
+        return self.buffer.read(self.start, self.stop)
+
+    def wav_body(self) -> WavBody:
+        return WavBody(self.buffer.segments(self.start, self.stop), self.sample_rate)
+
+    def release(self):
+        if self._pool is not None:
+            self._pool.release(self.buffer)
+            self._pool = None
+
+
+class RingBufferPool:
+    """
+    A fixed set of preallocated ring buffers. While one utterance is being
+    transcribed the next capture records into a different buffer; `acquire`
+    blocks when every buffer is still in use, which throttles capture.
+    """
+    def __init__(self, count: int, capacity: int):
+        self._free = queue.Queue()
+        for _ in range(count):
+            self._free.put(AudioRingBuffer(capacity))
+
+    def acquire(self) -> AudioRingBuffer:
+        buffer = self._free.get()
+        buffer.clear()
+        return buffer
+
+    def release(self, buffer: AudioRingBuffer):
+        self._free.put(buffer)
@@ -0,0 +1,474 @@
+# core/server.py
+
+import asyncio
+import hashlib
+import hmac
+import json
+import secrets
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+import numpy as np
+from langchain_core.messages import HumanMessage
+from rich.console import Console
+
+from .vad import Endpointer, create_vad
+from .bargein import BargeIn
+from .ringbuffer import RecordedAudio, RingBufferPool
+from .preprocess import AudioPreprocessor
+from .synthesis import SpeechSynthesizer, StreamedClip, pcm_sample_rate
+from .transcription import get_transcriber
+from .streaming import run_ahead
+from .tracing import get_tracer
+from .config import (
+    DEFAULT_SAMPLE_RATE,
+    PIPELINE_QUEUE_SIZE,
+    VAD_MAX_UTTERANCE_SECONDS,
+    BARGE_IN_MIN_SPEECH_MS,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_MAX_SESSIONS,
+    SERVER_STT_CONCURRENCY,
+    SERVER_AGENT_CONCURRENCY,
+    SERVER_TTS_CONCURRENCY,
+    SERVER_MAX_QUEUED_MESSAGES,
+    SERVER_MAX_MESSAGE_BYTES,
+    SERVER_HANDSHAKE_SECONDS,
+    SERVER_RESUME_SECRET,
+    CLI_THEME,
+)
+
+console = Console(theme=CLI_THEME)
+
+# --- PROTOCOL ---
+# The client opens a WebSocket and sends {"type": "start"}, optionally with
+# the "session_id" and "resume_token" of an earlier session to resume its
+# conversation, and with the "sample_rate" (default 16000) and "channels"
+# (1 or 2) it captures at. The server answers {"type": "ready",
+# "session_id", "resume_token", "sample_rate", "channels", "output_format"}.
+# From then on:
+# - client -> server: binary messages of interleaved 16-bit PCM at
+#   `sample_rate`, which the server downmixes and resamples, and
+#   {"type": "stop"} to end the session;
+# - server -> client: {"type": "transcript"}, {"type": "reply"} (one per
+#   spoken segment), {"type": "audio_start"}, binary audio in
+#   `output_format`, {"type": "audio_end"}, {"type": "interrupt"} (stop
+#   playing: the user talked over the reply) and {"type": "error"}.
+# The client should cancel its own echo (browsers do with echoCancellation),
+# since the server can't hear what the client's speaker plays.
+
+# Signs resume tokens (see SERVER_RESUME_SECRET).
+_RESUME_KEY = SERVER_RESUME_SECRET.encode() if SERVER_RESUME_SECRET else secrets.token_bytes(32)
+
+# Capture rates a client may send.
+_MIN_INPUT_RATE = 8000
+_MAX_INPUT_RATE = 96000
+
+
+class FairScheduler:
+    """
+    Shares a fixed number of slots of one stage (STT, agent or TTS) among all
+    sessions.
+    - A free slot is taken at once.
+    - When every slot is busy, the sessions waiting for one are served round
+      robin, so a session with a backlog can't starve the others.
+    """
+    def __init__(self, name: str, slots: int):
+        self.name = name
+        self.slots = slots
+        self._busy = 0
+        self._waiting = OrderedDict()  # session_id -> deque of futures
+
+    async def acquire(self, session_id: str):
+        if self._busy < self.slots and not self._waiting:
+            self._busy += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(session_id, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled.
+                self.release()
+            else:
+                self._forget(session_id, waiter)
+            raise
+
+    def release(self):
+        """Hands the slot to the next waiting session, or frees it."""
+        while self._waiting:
+            session_id, waiters = next(iter(self._waiting.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                # The session's other requests wait behind everyone else's.
+                self._waiting.move_to_end(session_id)
+            else:
+                del self._waiting[session_id]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._busy -= 1
+
+    def _forget(self, session_id: str, waiter):
+        waiters = self._waiting.get(session_id)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._waiting[session_id]
+
+    @asynccontextmanager
+    async def slot(self, session_id: str):
+        await self.acquire(session_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {"busy": self._busy, "waiting": sum(len(waiters) for waiters in self._waiting.values())}
+
+
+class VoiceSession:
+    """
+    One connected client and its conversation (the agent's thread_id).
+    - Incoming PCM is split into utterances by voice activity detection.
+    - Utterances are transcribed, answered and spoken in order while the
+      client keeps streaming; replies go back as text events and audio.
+    - Talking over a reply interrupts it, like barge-in on the terminal.
+    - Only a few utterances and reply segments may wait per session. When
+      they pile up, the session stops reading from its socket (and waits for
+      the client to take its audio), so a fast or slow client is held back
+      instead of growing the server's memory.
+    """
+    def __init__(
+        self, server, websocket, session_id: str, sample_rate: int = DEFAULT_SAMPLE_RATE,
+        input_rate: int = DEFAULT_SAMPLE_RATE, channels: int = 1,
+    ):
+        self.server = server
+        self.websocket = websocket
+        self.id = session_id
+        self.sample_rate = sample_rate
+        # The client's audio, converted to `sample_rate` mono as it arrives.
+        self.preprocessor = AudioPreprocessor(input_rate, sample_rate, channels)
+        self.barge_in = BargeIn()
+        self._endpointer = Endpointer(create_vad(sample_rate))
+        # A buffer holds one utterance; spares let the next one be recorded
+        # while earlier ones wait for transcription.
+        self._pool = RingBufferPool(PIPELINE_QUEUE_SIZE + 2, int((VAD_MAX_UTTERANCE_SECONDS + 1) * sample_rate))
+        self._utterances = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self._replies = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self._interrupted = False
+        self._clip = None
+        self._audible_until = 0.0
+
+    async def send_event(self, type: str, **fields):
+        await self.websocket.send(json.dumps({"type": type, **fields}))
+
+    async def run(self):
+        """Serves the session until the client disconnects or sends "stop"."""
+        tracer = get_tracer()
+        workers = [asyncio.create_task(self._respond(tracer)), asyncio.create_task(self._speak(tracer))]
+        buffer = await asyncio.to_thread(self._pool.acquire)
+        self._endpointer.reset()
+        try:
+            async for message in self.websocket:
+                if isinstance(message, str):
+                    if self._control(message):
+                        break
+                    continue
+                buffer = await self._receive(buffer, message, tracer)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if self._clip is not None:
+                self._clip.cancel()
+            self._pool.release(buffer)
+
+    def _control(self, message: str) -> bool:
+        """Handles a text message from the client. Returns True to end the session."""
+        try:
+            return json.loads(message).get("type") == "stop"
+        except (ValueError, AttributeError):
+            return False
+
+    # --- Capture ---
+
+    async def _receive(self, buffer, message: bytes, tracer):
+        """Feeds a block of PCM to the endpointer; returns the buffer to record into next."""
+        channels = self.preprocessor.channels
+        samples = self.preprocessor.process(
+            np.frombuffer(message, dtype=np.int16, count=len(message) // (2 * channels) * channels)
+        )
+        buffer.write(samples)
+        done = self._endpointer.process(samples)
+        if not self._interrupted and self._endpointer.speech_seconds * 1000 >= BARGE_IN_MIN_SPEECH_MS:
+            await self._interrupt()
+        if not done:
+            return buffer
+
+        span = self._endpointer.span()
+        self._interrupted = False
+        if span is None:
+            self._endpointer.reset()
+            buffer.clear()
+            return buffer
+        turn = tracer.new_turn()
+        end = time.perf_counter()
+        recording = RecordedAudio(self._pool, buffer, *span, self.sample_rate)
+        with tracer.activate(turn):
+            tracer.record(
+                "capture", end - (buffer.total_written - span[0]) / self.sample_rate, end,
+                mode="websocket", session=self.id, audio_seconds=round(recording.duration, 2),
+            )
+        # Both waits hold up reading from the socket while this session is behind.
+        await self._utterances.put((turn, recording))
+        buffer = await asyncio.to_thread(self._pool.acquire)
+        self._endpointer.reset()
+        return buffer
+
+    async def _interrupt(self):
+        """Stops the reply being sent because the user started talking over it."""
+        if not self.barge_in.interrupt():
+            return
+        self._interrupted = True
+        if self._clip is not None:
+            self._clip.cancel()
+        await self.send_event("interrupt")
+
+    # --- Reply ---
+
+    async def _respond(self, tracer):
+        """Transcribes each utterance and streams the agent's reply to the speaking task."""
+        server = self.server
+        while True:
+            turn, recording = await self._utterances.get()
+            try:
+                with tracer.activate(turn):
+                    text = await self._transcribe(recording)
+                    if not text:
+                        tracer.finish(turn)
+                        continue
+                    await self.send_event("transcript", text=text)
+                    generation = self.barge_in.generation
+
+                    async def run_agent(emit):
+                        await server.agent.awarm_up()
+                        with tracer.span("agent", session=self.id):
+                            async with server.agent_slots.slot(self.id):
+                                async for segment in server.agent.stream_agent_response(HumanMessage(content=text), thread_id=self.id):
+                                    emit(segment)
+
+                    # The agent (and its slot) runs ahead of this session's
+                    # speaking task; only the handover waits for it to catch up.
+                    async for segment in run_ahead(run_agent):
+                        if not self.barge_in.is_stale(generation):
+                            await self._replies.put((turn, generation, segment))
+            except Exception as e:
+                console.print(f"[error]Session {self.id}: the reply failed: {e}[/error]")
+                await self.send_event("error", message="The agent could not answer.")
+            await self._replies.put((turn, None, None))  # End of the reply.
+
+    async def _transcribe(self, recording) -> str:
+        server = self.server
+        try:
+            async with server.stt_slots.slot(self.id):
+                with get_tracer().span("stt", backend=server.transcriber.name, session=self.id):
+                    segments = recording.buffer.segments(recording.start, recording.stop)
+                    return (await asyncio.to_thread(server.transcriber.transcribe, segments, recording.sample_rate)).strip()
+        except Exception as e:
+            console.print(f"[error]Session {self.id}: transcription failed: {e}[/error]")
+            await self.send_event("error", message="Transcription failed.")
+            return ""
+        finally:
+            recording.release()
+
+    async def _speak(self, tracer):
+        """Synthesizes each reply segment and sends its audio to the client."""
+        while True:
+            turn, generation, text = await self._replies.get()
+            if text is None:
+                tracer.finish(turn)
+                continue
+            if self.barge_in.is_stale(generation):
+                continue
+            try:
+                with tracer.activate(turn):
+                    await self.send_event("reply", text=text)
+                    audio = await self._synthesize(text.replace("**", ""))
+                    if audio is not None and not self.barge_in.is_stale(generation):
+                        await self._send_audio(audio, generation)
+                    elif isinstance(audio, StreamedClip):
+                        audio.cancel()
+            except Exception as e:
+                console.print(f"[error]Session {self.id}: speaking the reply failed: {e}[/error]")
+
+    async def _synthesize(self, text: str):
+        slots = self.server.tts_slots
+        await slots.acquire(self.id)
+        try:
+            audio = await asyncio.to_thread(self.server.synthesizer.synthesize, text)
+        except BaseException:
+            slots.release()
+            raise
+        if isinstance(audio, StreamedClip):
+            # The slot covers the whole download, which runs ahead of sending.
+            task = asyncio.create_task(asyncio.to_thread(audio.wait))
+            task.add_done_callback(lambda _: slots.release())
+        else:
+            slots.release()
+        return audio
+
+    async def _send_audio(self, audio, generation: int):
+        loop = asyncio.get_running_loop()
+        output_format = self.server.synthesizer.output_format
+        await self.send_event("audio_start", format=output_format)
+        self.barge_in.playback_started()
+        sent = 0
+        try:
+            with get_tracer().span("playback", transport="websocket", session=self.id) as span:
+                if not isinstance(audio, StreamedClip):
+                    await self.websocket.send(audio)
+                    sent = len(audio)
+                else:
+                    self._clip = audio
+                    chunks = iter(audio)
+                    while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                        if self.barge_in.is_stale(generation):
+                            break
+                        # Waits while the client isn't reading (backpressure).
+                        await self.websocket.send(chunk)
+                        sent += len(chunk)
+                    if self.barge_in.is_stale(generation):
+                        span.attributes["interrupted"] = True
+                        audio.cancel()
+        finally:
+            self._clip = None
+            # The client plays the audio after receiving it, so the reply
+            # counts as playing until the audio sent so far has been heard.
+            seconds = sent / 2 / pcm_sample_rate(output_format) if isinstance(audio, StreamedClip) else 0.0
+            self._audible_until = max(self._audible_until, loop.time()) + seconds
+            loop.call_at(self._audible_until, self.barge_in.playback_finished)
+        await self.send_event("audio_end")
+
+
+async def _reject(websocket, message: str, code: int = 1008):
+    """Tells a client why it is turned away and closes the connection."""
+    await websocket.send(json.dumps({"type": "error", "message": message}))
+    await websocket.close(code, message)
+
+
+class VoiceServer:
+    """
+    Serves voice sessions over WebSocket from one process.
+    - One agent, transcriber and synthesizer, with their pooled connections
+      and caches, are shared by every session; each session's conversation
+      is checkpointed under its own thread_id.
+    - Each shared stage has a fixed number of slots, handed out fairly
+      across sessions (see FairScheduler).
+    - At most `max_sessions` clients are connected at once, counting those
+      still in the handshake.
+    - A conversation can only be resumed with the resume token the server
+      gave out for it.
+    """
+    def __init__(self, agent=None, transcriber=None, synthesizer=None, max_sessions: int = SERVER_MAX_SESSIONS):
+        if agent is None:
+            from .agent import ReactAgent
+            agent = ReactAgent()
+        self.agent = agent
+        self.transcriber = transcriber or get_transcriber()
+        # Audio is streamed to the client as PCM.
+        self.synthesizer = synthesizer or SpeechSynthesizer(streaming=True)
+        self.max_sessions = max_sessions
+        self.stt_slots = FairScheduler("stt", SERVER_STT_CONCURRENCY)
+        self.agent_slots = FairScheduler("agent", SERVER_AGENT_CONCURRENCY)
+        self.tts_slots = FairScheduler("tts", SERVER_TTS_CONCURRENCY)
+        self.sessions = {}
+        # Connections holding a place, from accept until they disconnect.
+        self._connections = 0
+
+    @staticmethod
+    def resume_token(session_id: str) -> str:
+        return hmac.new(_RESUME_KEY, session_id.encode(), hashlib.sha256).hexdigest()
+
+    async def handle(self, websocket):
+        """Runs one connection: the start handshake, then the session."""
+        from websockets.exceptions import ConnectionClosed
+
+        try:
+            # Counted before the first await, so a burst of clients can't all
+            # pass the check while the handshakes are still in progress.
+            if self._connections >= self.max_sessions:
+                await _reject(websocket, "The server is full. Try again later.", code=1013)
+                return
+            self._connections += 1
+            try:
+                await self._serve_connection(websocket)
+            finally:
+                self._connections -= 1
+        except ConnectionClosed:
+            pass
+
+    async def _serve_connection(self, websocket):
+        accepted = await self._handshake(websocket)
+        if accepted is None:
+            return
+        session_id, input_rate, channels = accepted
+        session = VoiceSession(self, websocket, session_id, input_rate=input_rate, channels=channels)
+        self.sessions[session_id] = session
+        console.print(f"[system]Session {session_id} connected ({len(self.sessions)} active).[/system]")
+        try:
+            await session.send_event(
+                "ready", session_id=session_id, resume_token=self.resume_token(session_id),
+                sample_rate=input_rate, channels=channels, output_format=self.synthesizer.output_format,
+            )
+            await session.run()
+        finally:
+            del self.sessions[session_id]
+            console.print(f"[system]Session {session_id} disconnected ({len(self.sessions)} active).[/system]")
+
+    async def _handshake(self, websocket):
+        """
+        Reads the "start" message. Returns (session ID, sample rate, channels),
+        or None after rejecting the client.
+        """
+        try:
+            start = json.loads(await asyncio.wait_for(websocket.recv(), SERVER_HANDSHAKE_SECONDS))
+        except (asyncio.TimeoutError, ValueError, TypeError):
+            await _reject(websocket, 'Expected a {"type": "start"} message.')
+            return None
+        if not isinstance(start, dict) or start.get("type") != "start":
+            await _reject(websocket, 'Expected a {"type": "start"} message.')
+            return None
+        input_rate, channels = start.get("sample_rate", DEFAULT_SAMPLE_RATE), start.get("channels", 1)
+        if not isinstance(input_rate, int) or not _MIN_INPUT_RATE <= input_rate <= _MAX_INPUT_RATE or channels not in (1, 2):
+            await _reject(websocket, f"Audio must be 16-bit PCM with 1 or 2 channels at {_MIN_INPUT_RATE}-{_MAX_INPUT_RATE} Hz.")
+            return None
+        session_id = start.get("session_id")
+        if session_id is None:
+            session_id = str(uuid.uuid4())
+        elif not isinstance(session_id, str) or not hmac.compare_digest(
+            str(start.get("resume_token", "")).encode(), self.resume_token(session_id).encode(),
+        ):
+            await _reject(websocket, "A session can only be resumed with its resume_token.")
+            return None
+        if session_id in self.sessions:
+            await _reject(websocket, f"Session {session_id} is already connected.")
+            return None
+        return session_id, input_rate, channels
+
+    async def serve(self, host: str = SERVER_HOST, port: int = SERVER_PORT):
+        """Accepts connections until cancelled."""
+        try:
+            from websockets.asyncio.server import serve
+        except ImportError:
+            console.print("[error]The server needs the websockets package: pip install websockets[/error]")
+            return
+        async with serve(
+            self.handle, host, port, max_size=SERVER_MAX_MESSAGE_BYTES, max_queue=SERVER_MAX_QUEUED_MESSAGES,
+        ):
+            console.print(f"[system]Serving voice sessions on ws://{host}:{port}[/system]")
+            await asyncio.Future()
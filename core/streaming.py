@@ -0,0 +1,82 @@
+# core/streaming.py
+
+import asyncio
+import re
+
+from .config import TTS_SEGMENT_MIN_CHARS, TTS_SEGMENT_MAX_CHARS
+
+# A sentence ends with terminal punctuation followed by whitespace. Requiring
+# the whitespace keeps decimals ("3.5") and file names ("notes.txt") intact.
+_SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s+|\n+")
+# Clause boundaries are only used once a segment is getting long.
+_CLAUSE_END = re.compile(r"[,;:]\s+")
+
+
+class SentenceChunker:
+    """
+    Cuts a stream of LLM tokens into speakable segments.
+    - Emits a segment at every sentence end once it has enough text.
+    - Falls back to clause boundaries, then whitespace, for long run-ons.
+    """
+    def __init__(self, min_chars: int = TTS_SEGMENT_MIN_CHARS, max_chars: int = TTS_SEGMENT_MAX_CHARS):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def feed(self, token: str) -> list[str]:
+        """Adds a token and returns any segments that are now complete."""
+        self._buffer += token
+        segments = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            segment, self._buffer = self._buffer[:cut].strip(), self._buffer[cut:]
+            if segment:
+                segments.append(segment)
+        return segments
+
+    def flush(self) -> list[str]:
+        """Returns whatever text is left once the stream has finished."""
+        segment, self._buffer = self._buffer.strip(), ""
+        return [segment] if segment else []
+
+    def _find_cut(self):
+        for match in _SENTENCE_END.finditer(self._buffer):
+            if match.end() >= self.min_chars:
+                return match.end()
+        if len(self._buffer) < self.max_chars:
+            return None
+        window = self._buffer[:self.max_chars]
+        clauses = list(_CLAUSE_END.finditer(window))
+        if clauses:
+            return clauses[-1].end()
+        space = window.rfind(" ")
+        return space + 1 if space > 0 else self.max_chars
+
+
+async def run_ahead(produce):
+    """
+    Runs `produce(emit)` in its own task and yields everything it emits.
+    - The producer never waits for the consumer: items are buffered, so a
+      span opened inside `produce` times the producer alone, not the time
+      the consumer spends on backpressure downstream.
+    - The producer's exception is raised here once its items are consumed,
+      and the producer is cancelled if the consumer stops early.
+    """
+    items = asyncio.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            await produce(items.put_nowait)
+        finally:
+            items.put_nowait(done)
+
+    task = asyncio.create_task(pump())
+    try:
+        while (item := await items.get()) is not done:
+            yield item
+        await task
+    finally:
+        task.cancel()
@@ -0,0 +1,220 @@
+# core/synthesis.py
+
+import contextvars
+import threading
+import time
+from collections import deque
+
+from rich.console import Console
+
+from .connections import abortable_responses, get_elevenlabs_client
+from .tts_cache import TTSCache
+from .tracing import get_tracer
+from .config import (
+    DEFAULT_VOICE_ID,
+    DEFAULT_MODEL_ID,
+    TTS_STREAMING,
+    TTS_OUTPUT_FORMAT,
+    TTS_ENCODED_FORMAT,
+    TTS_CACHE_ENABLED,
+    TTS_CACHE_MAX_TEXT_CHARS,
+    TTS_CACHE_PREWARM_PHRASES,
+    CLI_THEME,
+)
+
+console = Console(theme=CLI_THEME)
+
+
+def pcm_sample_rate(output_format: str) -> int:
+    """Reads the sample rate from an ElevenLabs PCM format name such as 'pcm_22050'."""
+    codec, _, rate = output_format.partition("_")
+    if codec != "pcm" or not rate.isdigit():
+        raise ValueError(f"'{output_format}' is not a raw PCM output format.")
+    return int(rate)
+
+
+class StreamedClip:
+    """
+    Synthesized 16-bit mono PCM that is downloaded in a background thread.
+    The download starts as soon as the clip is created, so the next segment
+    can be fetched while the current one is still playing. Iterating yields
+    chunks as they arrive; `cancel()` stops the download and ends iteration
+    at once.
+    """
+    def __init__(self, chunks, sample_rate: int):
+        self.sample_rate = sample_rate
+        self._chunks = deque()
+        self._condition = threading.Condition()
+        self._finished = False
+        self._cancelled = False
+        self._error = None
+        self._response = None
+        # The caller's context carries the current trace turn into the download.
+        threading.Thread(target=contextvars.copy_context().run, args=(self._download, chunks), daemon=True).start()
+
+    def _download(self, chunks):
+        try:
+            with abortable_responses(self._attach):
+                for chunk in chunks:
+                    if self._cancelled:
+                        # Closing the source ends the HTTP response, and a
+                        # partial clip never reaches the TTS cache.
+                        close = getattr(chunks, "close", None)
+                        if close is not None:
+                            close()
+                        break
+                    if chunk:
+                        with self._condition:
+                            self._chunks.append(chunk)
+                            self._condition.notify()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify()
+
+    def _attach(self, response):
+        """Keeps the HTTP response being downloaded, so `cancel()` can abort it."""
+        with self._condition:
+            self._response = response
+            cancelled = self._cancelled
+        if cancelled:
+            response.abort()
+
+    def wait(self):
+        """Blocks until the download has finished, failed or been cancelled."""
+        with self._condition:
+            while not self._finished and not self._cancelled:
+                self._condition.wait()
+
+    def cancel(self):
+        """Stops the download and drops the audio that hasn't been played."""
+        with self._condition:
+            self._cancelled = True
+            self._chunks.clear()
+            self._condition.notify_all()
+            response = self._response
+        if response is not None:
+            # Wakes the download if it is blocked waiting for the network.
+            response.abort()
+
+    def __iter__(self):
+        while True:
+            with self._condition:
+                while not self._chunks and not self._finished and not self._cancelled:
+                    self._condition.wait()
+                if self._cancelled:
+                    return
+                if self._chunks:
+                    chunk = self._chunks.popleft()
+                elif self._error is not None:
+                    raise self._error
+                else:
+                    return
+            yield chunk
+
+
+class SpeechSynthesizer:
+    """
+    Speaks text with ElevenLabs, independent of any audio device.
+    - With TTS streaming, returns raw PCM as a StreamedClip that downloads in
+      the background; otherwise the encoded audio bytes.
+    - Short phrases are served from, and stored in, the TTS cache.
+    Used by the local AudioProcessor and shared by all sessions of the
+    WebSocket server (see core/server.py).
+    """
+    def __init__(self, streaming: bool = TTS_STREAMING):
+        self.streaming = streaming
+        self.cache = TTSCache() if TTS_CACHE_ENABLED else None
+
+    @property
+    def output_format(self) -> str:
+        return TTS_OUTPUT_FORMAT if self.streaming else TTS_ENCODED_FORMAT
+
+    def synthesize(self, text: str):
+        """
+        Returns a StreamedClip whose PCM downloads in the background when TTS
+        streaming is enabled, otherwise the encoded audio bytes (None if empty).
+        """
+        output_format = self.output_format
+        key = TTSCache.key(DEFAULT_VOICE_ID, DEFAULT_MODEL_ID, output_format, text)
+        cacheable = self.cache is not None and len(text) <= TTS_CACHE_MAX_TEXT_CHARS
+        if cacheable:
+            start = time.perf_counter()
+            audio = self.cache.get(key)
+            if audio is not None:
+                get_tracer().record("tts", start, time.perf_counter(), characters=len(text), cached=True)
+                return StreamedClip([audio], pcm_sample_rate(output_format)) if self.streaming else audio
+
+        tts = get_elevenlabs_client().text_to_speech
+        if self.streaming:
+            # Raw PCM from the streaming endpoint can be played chunk by
+            # chunk, without decoding or a player subprocess.
+            audio_stream = tts.convert_as_stream(
+                voice_id=DEFAULT_VOICE_ID,
+                model_id=DEFAULT_MODEL_ID,
+                text=text,
+                output_format=output_format,
+            )
+            audio_stream = self._traced(audio_stream, len(text))
+            if cacheable:
+                audio_stream = self._cache_when_complete(audio_stream, key)
+            return StreamedClip(audio_stream, pcm_sample_rate(output_format))
+
+        audio_stream = tts.convert(
+            voice_id=DEFAULT_VOICE_ID,
+            model_id=DEFAULT_MODEL_ID,
+            text=text,
+            output_format=output_format,
+        )
+        # The client returns a lazy iterator; drain it here so the network
+        # round-trip happens in the synthesis stage, not during playback.
+        audio = b"".join(self._traced(audio_stream, len(text))) if audio_stream else b""
+        if cacheable:
+            self.cache.put(key, audio)
+        return audio or None
+
+    def _traced(self, chunks, characters: int):
+        """Passes synthesized chunks through, recording the TTS span and its time to first byte."""
+        start = time.perf_counter()
+        first = None
+        received = 0
+        try:
+            for chunk in chunks:
+                if first is None:
+                    first = time.perf_counter()
+                received += len(chunk)
+                yield chunk
+        finally:
+            get_tracer().record(
+                "tts", start, time.perf_counter(), characters=characters, cached=False, bytes=received,
+                ttfb_ms=round((first - start) * 1000, 1) if first is not None else None,
+            )
+
+    def _cache_when_complete(self, chunks, key: str):
+        """Passes streamed chunks through and caches the clip once it has fully arrived."""
+        received = []
+        for chunk in chunks:
+            received.append(chunk)
+            yield chunk
+        try:
+            self.cache.put(key, b"".join(received))
+        except OSError as e:
+            console.print(f"[warning]Could not cache synthesized audio: {e}[/warning]")
+
+    def prewarm(self, phrases=TTS_CACHE_PREWARM_PHRASES):
+        """Synthesizes frequently spoken phrases ahead of time so they play from the cache."""
+        if self.cache is None:
+            return
+        for phrase in phrases:
+            if TTSCache.key(DEFAULT_VOICE_ID, DEFAULT_MODEL_ID, self.output_format, phrase) in self.cache:
+                continue
+            try:
+                audio = self.synthesize(phrase)
+                if isinstance(audio, StreamedClip):
+                    # Draining the clip stores it in the cache.
+                    for _ in audio:
+                        pass
+            except Exception as e:
+                console.print(f"[warning]Could not pre-synthesize '{phrase}': {e}[/warning]")
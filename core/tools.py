@@ -1,131 +1,480 @@
 # core/tools.py
 
 import os
-import json # Import the JSON library
+import re
+import mmap
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from langchain.tools import BaseTool
-from typing import Type, Dict
+from langchain_core.runnables.config import run_in_executor
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
+from typing import Callable, Literal, Optional, Type, Union
 
-# --- THIS IS THE FINAL FIX ---
-# Each tool's `_run` method will now check if the input is a string.
-# If it is, it will parse it from a JSON string into a Python dictionary.
-# This makes our tools robust against the AgentExecutor's bug.
+from .config import READ_FILE_MAX_TOKENS, READ_FILE_MAX_MATCHES, READ_FILE_MATCH_LINE_CHARS, READ_FILE_COUNT_LINES_MAX_BYTES, FILE_INDEX_PAGE_SIZE
+from .config import TOOL_MAX_WORKERS, TOOL_TIMEOUT_SECONDS, TOOL_TIMEOUTS, FILE_BATCH_MAX_OPERATIONS, PREFETCH_ENABLED
+from .file_index import get_file_index, parse_size, parse_time, refresh_file_index
+from .file_batch import FileTransaction, BatchError
+from .prefetch import get_prefetcher
+from .validation import ErrorCode, ToolError, ToolInput, normalize_input, os_error, resolve_path, validation_error_result
 
-class WriteFileTool(BaseTool):
-    name: str = "write_file"
-    description: str = "Use this tool to write specified content to a file. The input must be a single JSON object with 'file_path' and 'content' keys."
+# --- Async execution ---
+# File operations block, so the async path runs `_run` on a shared, bounded
+# pool of worker threads. A slow disk or network mount then only occupies a
+# worker; the event loop keeps serving audio, and parallel tool calls overlap.
+
+_tool_executor = None
+_tool_executor_lock = threading.Lock()
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    """Returns the thread pool shared by all tools."""
+    global _tool_executor
+    with _tool_executor_lock:
+        if _tool_executor is None:
+            _tool_executor = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="tool")
+        return _tool_executor
+
+class FileTool(BaseTool):
+    """
+    Base class for the file tools.
+    - Arguments are checked against the tool's `args_schema` before the tool
+      runs; subclasses implement `_execute(args)` on the validated model.
+    - Failures come back as JSON with a machine-readable error code (see
+      core/validation.py) instead of free text.
+    - `_arun` runs the tool on the shared tool pool with a per-tool timeout
+      (TOOL_TIMEOUTS). A call that is cancelled before a worker picks it up
+      never runs; a worker thread cannot be interrupted, so on timeout the
+      agent is told the operation may still finish in the background.
+    """
+    handle_validation_error: Optional[Union[bool, str, Callable[[ValidationError], str]]] = validation_error_result
 
-    def _run(self, tool_input: str | Dict):
-        """Writes content to a file, safely handling string or dictionary input."""
+    @property
+    def timeout(self) -> float:
+        return TOOL_TIMEOUTS.get(self.name, TOOL_TIMEOUT_SECONDS)
+
+    def _parse_input(self, tool_input, tool_call_id=None):
+        return super()._parse_input(normalize_input(tool_input, self.args_schema), tool_call_id)
+
+    def _execute(self, args):
+        raise NotImplementedError
+
+    def _run(self, **kwargs):
         try:
-            # Check if the input is a string and parse it if necessary
-            if isinstance(tool_input, str):
-                data = json.loads(tool_input)
-            else:
-                data = tool_input
-
-            # Manual validation inside the tool
-            if 'file_path' not in data or 'content' not in data:
-                return "Error: Your instruction was missing 'file_path' or 'content'."
-            
-            file_path = data['file_path']
-            content = data['content']
-            
-            full_path = os.path.expanduser(file_path)
-            parent_dir = os.path.dirname(full_path)
-            if parent_dir:
-                os.makedirs(parent_dir, exist_ok=True)
-            with open(full_path, "w", encoding="utf-8") as f:
-                f.write(content)
-            return f"Successfully wrote to {file_path}"
-        except json.JSONDecodeError:
-            return "Error: The input was not valid JSON."
+            # _parse_input only passes the arguments that were given, so the
+            # model is built again here to fill in the defaults.
+            return self._execute(self.args_schema.model_validate(kwargs))
+        except ToolError as e:
+            return e.result()
+        except ValidationError as e:
+            return validation_error_result(e)
+        except OSError as e:
+            return os_error(e).result()
         except Exception as e:
-            return f"Error during file write operation: {e}"
+            return ToolError(ErrorCode.INTERNAL, f"{self.name} failed: {e}").result()
+
+    async def _arun(self, **kwargs):
+        try:
+            return await asyncio.wait_for(
+                run_in_executor(get_tool_executor(), functools.partial(self._run, **kwargs)), self.timeout
+            )
+        except asyncio.TimeoutError:
+            return ToolError(
+                ErrorCode.TIMEOUT,
+                f"{self.name} did not finish within {self.timeout:g} seconds and may still complete "
+                "in the background. Check the result before trying again.",
+            ).result()
+
+# --- Basic file operations ---
+# Each tool declares its arguments as a pydantic model, so the LLM sees the
+# exact parameters and types, and a bad call is answered with the offending
+# fields instead of failing halfway through the tool.
+
+class WriteFileInput(ToolInput):
+    file_path: str = Field(description="Path of the file to write. Missing folders are created.")
+    content: str = Field(description="The full new contents of the file.")
+
+class WriteFileTool(FileTool):
+    name: str = "write_file"
+    description: str = "Use this tool to write specified content to a file, replacing anything already in it."
+    args_schema: Type[BaseModel] = WriteFileInput
+
+    def _execute(self, args: WriteFileInput):
+        full_path = resolve_path(args.file_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w", encoding="utf-8") as f:
+            f.write(args.content)
+        refresh_file_index([full_path])
+        return f"Successfully wrote to {args.file_path}"
+
+# --- Ranged reads ---
+# read_file works on a memory map, so a request only loads the pages it
+# touches, and its output is capped so a large file can't flood the prompt.
+# A file prefetched while the user was talking (core/prefetch.py) is read
+# from memory instead; bytes support the same slicing and searching.
 
-class ReadFileTool(BaseTool):
+def _format_size(size: int) -> str:
+    for unit in ("bytes", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:,} {unit}" if unit == "bytes" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def _count_newlines(mm, start: int, end: int) -> int:
+    """Counts newlines in mm[start:end] a megabyte at a time."""
+    count = 0
+    for offset in range(start, end, 1 << 20):
+        count += mm[offset:min(offset + (1 << 20), end)].count(b"\n")
+    return count
+
+def _line_offset(mm, line: int) -> int:
+    """Byte offset where a 1-based line starts (the file size if there are fewer lines)."""
+    position = 0
+    for _ in range(line - 1):
+        position = mm.find(b"\n", position) + 1
+        if position == 0:
+            return len(mm)
+    return position
+
+def _tail_offset(mm, lines: int) -> int:
+    """Byte offset where the last `lines` lines start."""
+    position = len(mm)
+    if mm[position - 1:position] == b"\n":
+        position -= 1
+    for _ in range(lines):
+        position = mm.rfind(b"\n", 0, position)
+        if position == -1:
+            return 0
+    return position + 1
+
+class ReadFileInput(ToolInput):
+    file_path: str = Field(description="Path of the file to read.")
+    start_line: Optional[int] = Field(None, ge=1, description="First line to read (1-based).")
+    end_line: Optional[int] = Field(None, ge=1, description="Last line to read (inclusive).")
+    head: Optional[int] = Field(None, ge=1, description="Read this many lines from the start.")
+    tail: Optional[int] = Field(None, ge=1, description="Read this many lines from the end.")
+    byte_start: Optional[int] = Field(None, ge=0, description="First byte to read.")
+    byte_end: Optional[int] = Field(None, ge=0, description="Byte to stop at (exclusive).")
+    pattern: Optional[str] = Field(
+        None, description="A regular expression. Returns only the matching lines, with their line numbers."
+    )
+    ignore_case: bool = Field(False, description="Match the pattern case-insensitively.")
+    max_matches: int = Field(READ_FILE_MAX_MATCHES, ge=1, le=500, description="Most matching lines to return.")
+
+    @field_validator("pattern")
+    @classmethod
+    def _compiles(cls, pattern):
+        if pattern is not None:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"not a valid regular expression ({e})")
+        return pattern
+
+    @model_validator(mode="after")
+    def _one_range(self):
+        ranges = (
+            self.start_line is not None or self.end_line is not None,
+            self.head is not None,
+            self.tail is not None,
+            self.byte_start is not None or self.byte_end is not None,
+        )
+        if sum(ranges) > 1:
+            raise ValueError("give only one of a line range, head, tail or a byte range")
+        if self.start_line and self.end_line and self.end_line < self.start_line:
+            raise ValueError("end_line is before start_line")
+        return self
+
+class ReadFileTool(FileTool):
     name: str = "read_file"
-    description: str = "Use this tool to read the content of a file at a specified path."
+    description: str = (
+        "Use this tool to read the content of a file at a specified path: all of it, a line or byte range, "
+        "the first or last lines, or only the lines matching a pattern. Long results are truncated with a "
+        "note giving the file's size and line count."
+    )
+    args_schema: Type[BaseModel] = ReadFileInput
 
-    def _run(self, tool_input: str | Dict):
-        try:
-            if isinstance(tool_input, str):
-                data = json.loads(tool_input)
-            else:
-                data = tool_input
-
-            if 'file_path' not in data:
-                return "Error: Your instruction was missing 'file_path'."
-            
-            file_path = data['file_path']
-            full_path = os.path.expanduser(file_path)
-            with open(full_path, "r", encoding="utf-8") as f:
-                return f.read()
-        except FileNotFoundError:
-            return f"Error: File not found at {data.get('file_path')}"
-        except Exception as e:
-            return f"Error reading from file: {e}"
+    def _execute(self, args: ReadFileInput):
+        full_path = resolve_path(args.file_path)
+        data = get_prefetcher().read(full_path) if PREFETCH_ENABLED else None
+        if data is not None:
+            return self._answer(data, args) if data else ""
+        with open(full_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return ""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return self._answer(mm, args)
+
+    def _answer(self, mm, args: ReadFileInput):
+        """Reads the requested part of a non-empty file's contents (a memory map or bytes)."""
+        if b"\0" in mm[:8192]:
+            raise ToolError(
+                ErrorCode.BINARY_FILE,
+                f"{args.file_path} looks like a binary file ({_format_size(len(mm))}).",
+                path=args.file_path,
+            )
+        if args.pattern is not None:
+            return self._search(mm, args)
+        return self._read_span(mm, args)
+
+    def _span(self, mm, args: ReadFileInput):
+        """Returns (start, end, first line number or None) for the requested part of the file."""
+        size = len(mm)
+        if args.byte_start is not None or args.byte_end is not None:
+            start = args.byte_start or 0
+            end = size if args.byte_end is None else min(args.byte_end, size)
+            return start, max(start, end), None
+        if args.tail is not None:
+            return _tail_offset(mm, args.tail), size, None
+        first = args.start_line or 1
+        last = args.head if args.head is not None else args.end_line
+        start = _line_offset(mm, first)
+        end = size if last is None else max(start, _line_offset(mm, last + 1))
+        return start, end, first
+
+    def _read_span(self, mm, args: ReadFileInput):
+        start, end, first = self._span(mm, args)
+        max_chars = READ_FILE_MAX_TOKENS * 4
+        if end - start <= max_chars:
+            return mm[start:end].decode("utf-8", errors="replace")
+
+        # Cut at the last whole line that fits the budget.
+        cut = mm.rfind(b"\n", start, start + max_chars)
+        cut = start + max_chars if cut == -1 else cut + 1
+        text = mm[start:cut].decode("utf-8", errors="replace")
+
+        size = len(mm)
+        shown = text.count("\n") or 1
+        if size <= READ_FILE_COUNT_LINES_MAX_BYTES:
+            # A last line without a trailing newline still counts.
+            lines = _count_newlines(mm, 0, size) + (mm[size - 1:size] != b"\n")
+            total = f"{lines:,} lines"
+            if first is None:
+                first = _count_newlines(mm, 0, start) + 1
+        else:
+            # Estimate from the lines shown rather than scanning the whole file.
+            total = f"about {size * shown // (cut - start):,} lines"
+        span = f"lines {first:,}-{first + shown - 1:,}" if first is not None else f"bytes {start:,}-{cut:,}"
+        return (
+            f"{text}\n[Truncated: showing {span}; the file has {total} ({_format_size(size)}). "
+            "Ask for a line range, the head or tail, or a search pattern to read more.]"
+        )
+
+    def _search(self, mm, args: ReadFileInput):
+        """Returns the lines matching args.pattern, with line numbers."""
+        flags = re.MULTILINE | (re.IGNORECASE if args.ignore_case else 0)
+        regex = re.compile(args.pattern.encode("utf-8"), flags)
+        start, end, first = self._span(mm, args)
+        line_number = first or _count_newlines(mm, 0, start) + 1
+        max_chars = READ_FILE_MAX_TOKENS * 4
 
-# Apply the same robust pattern to all other tools...
+        results, used, counted_to, previous_line = [], 0, start, -1
+        stopped = False
+        for match in regex.finditer(mm, start, end):
+            line_start = mm.rfind(b"\n", 0, match.start()) + 1
+            if line_start == previous_line:
+                continue  # One entry per matching line.
+            line_end = mm.find(b"\n", match.start())
+            line_end = len(mm) if line_end == -1 else line_end
+            line_number += _count_newlines(mm, counted_to, line_start)
+            counted_to = previous_line = line_start
+            line = mm[line_start:min(line_end, line_start + READ_FILE_MATCH_LINE_CHARS)].decode("utf-8", errors="replace")
+            entry = f"{line_number}: {line.rstrip()}"
+            if len(results) == args.max_matches or used + len(entry) > max_chars:
+                stopped = True
+                break
+            results.append(entry)
+            used += len(entry) + 1
 
-class ListDirectoryTool(BaseTool):
+        if not results:
+            return f"No lines in {args.file_path} match '{args.pattern}'."
+        if stopped:
+            results.append(
+                f"[Stopped after {len(results)} matching lines; narrow the pattern or give a line range to see more.]"
+            )
+        return "\n".join(results)
+
+class ListDirectoryInput(ToolInput):
+    path: str = Field(".", description="The directory to list. Defaults to the current one.")
+
+class ListDirectoryTool(FileTool):
     name: str = "list_directory"
     description: str = "Use this to list the contents of a specified directory."
+    args_schema: Type[BaseModel] = ListDirectoryInput
 
-    def _run(self, tool_input: str | Dict):
-        try:
-            if isinstance(tool_input, str):
-                data = json.loads(tool_input)
-            else:
-                data = tool_input
-
-            path = data.get('path', '.')
-            full_path = os.path.expanduser(path)
-            return "\n".join(os.listdir(full_path)) or f"The directory '{path}' is empty."
-        except FileNotFoundError:
-            return "Error: Directory not found."
-        except Exception as e:
-            return f"Error listing directory: {e}"
+    def _execute(self, args: ListDirectoryInput):
+        full_path = resolve_path(args.path)
+        files = get_prefetcher().listing(full_path) if PREFETCH_ENABLED else None
+        if files is None:
+            files = os.listdir(full_path)
+        return "\n".join(files) if files else f"The directory '{args.path}' is empty."
 
-class DeleteFileTool(BaseTool):
+class DeleteFileInput(ToolInput):
+    file_path: str = Field(description="Path of the file to delete.")
+
+class DeleteFileTool(FileTool):
     name: str = "delete_file"
     description: str = "Use this tool to delete a file at a specified path."
+    args_schema: Type[BaseModel] = DeleteFileInput
 
-    def _run(self, tool_input: str | Dict):
-        try:
-            if isinstance(tool_input, str):
-                data = json.loads(tool_input)
-            else:
-                data = tool_input
-
-            if 'file_path' not in data:
-                return "Error: Your instruction was missing 'file_path'."
-
-            file_path = data['file_path']
-            full_path = os.path.expanduser(file_path)
-            os.remove(full_path)
-            return f"Successfully deleted file: {file_path}"
-        except FileNotFoundError:
-            return f"Error: File not found at {data.get('file_path')}"
-        except Exception as e:
-            return f"Error deleting file: {e}"
+    def _execute(self, args: DeleteFileInput):
+        full_path = resolve_path(args.file_path)
+        os.remove(full_path)
+        refresh_file_index([full_path])
+        return f"Successfully deleted file: {args.file_path}"
+
+class CreateDirectoryInput(ToolInput):
+    path: str = Field(description="Path of the directory to create. Missing parent folders are created too.")
 
-class CreateDirectoryTool(BaseTool):
+class CreateDirectoryTool(FileTool):
     name: str = "create_directory"
     description: str = "Use this tool to create a new directory at a specified path."
+    args_schema: Type[BaseModel] = CreateDirectoryInput
 
-    def _run(self, tool_input: str | Dict):
+    def _execute(self, args: CreateDirectoryInput):
+        full_path = resolve_path(args.path)
+        os.makedirs(full_path, exist_ok=True)
+        refresh_file_index([full_path])
+        return f"Successfully created directory: {args.path}"
+
+
+# --- Batch operations ---
+
+class BatchOperation(ToolInput):
+    op: Literal["write", "create_directory", "delete", "move"]
+    file_path: Optional[str] = Field(None, description="For write and delete.")
+    content: Optional[str] = Field(None, description="For write.")
+    path: Optional[str] = Field(None, description="For create_directory.")
+    source: Optional[str] = Field(None, description="For move.")
+    destination: Optional[str] = Field(None, description="For move.")
+
+class BatchFileOperationsInput(ToolInput):
+    operations: list[BatchOperation] = Field(
+        min_length=1, max_length=FILE_BATCH_MAX_OPERATIONS, description="The operations, in order."
+    )
+
+class BatchFileOperationsTool(FileTool):
+    name: str = "batch_file_operations"
+    description: str = (
+        "Use this tool to make several file changes in one step, for example creating a folder with "
+        "several files in it. Each operation is 'write' (file_path, content), 'create_directory' (path), "
+        "'delete' (file_path) or 'move' (source, destination). All operations are checked before any is "
+        "run, and if one fails, the others are undone."
+    )
+    args_schema: Type[BaseModel] = BatchFileOperationsInput
+
+    def _execute(self, args: BatchFileOperationsInput):
         try:
-            if isinstance(tool_input, str):
-                data = json.loads(tool_input)
-            else:
-                data = tool_input
-
-            if 'path' not in data:
-                return "Error: Your instruction was missing 'path'."
-
-            path = data['path']
-            full_path = os.path.expanduser(path)
-            os.makedirs(full_path, exist_ok=True)
-            return f"Successfully created directory: {path}"
-        except Exception as e:
-            return f"Error creating directory: {e}"
+            transaction = FileTransaction([op.model_dump(exclude_none=True) for op in args.operations])
+        except BatchError as e:
+            raise ToolError(ErrorCode.BATCH_REJECTED, str(e))
+        try:
+            return transaction.run()
+        except BatchError as e:
+            raise ToolError(ErrorCode.BATCH_FAILED if e.rolled_back else ErrorCode.BATCH_REJECTED, str(e))
+        finally:
+            # Also after a rollback, which may have left some changes behind.
+            refresh_file_index([path for op in transaction.operations for path in op.paths])
+
+# --- Indexed search ---
+# search_files and list_files answer from the file index (core/file_index.py),
+# so a single call can replace walking a folder tree one listing at a time.
+
+class _FileFilters(ToolInput):
+    glob: Optional[str] = Field(None, description="A name pattern such as '*.pdf'.")
+    type: Optional[Literal["file", "directory"]] = None
+    modified_after: Optional[Union[float, str]] = Field(
+        None, description="A date such as '2024-05-01', 'today' or 'yesterday', or a relative time such as '7 days'."
+    )
+    modified_before: Optional[Union[float, str]] = Field(None, description="Same formats as modified_after.")
+    min_size: Optional[Union[int, str]] = Field(None, description="A size such as '10MB'.")
+    max_size: Optional[Union[int, str]] = Field(None, description="A size such as '10MB'.")
+    limit: int = Field(FILE_INDEX_PAGE_SIZE, ge=1, le=100, description="Results per page.")
+    offset: int = Field(0, ge=0, description="Results to skip, for the next page.")
+
+    @field_validator("modified_after", "modified_before")
+    @classmethod
+    def _time(cls, value):
+        return None if value is None else parse_time(value)
+
+    @field_validator("min_size", "max_size")
+    @classmethod
+    def _size(cls, value):
+        return None if value is None else parse_size(value)
+
+class SearchFilesInput(_FileFilters):
+    query: Optional[str] = Field(None, description="Words from the file name or path.")
+    path: Optional[str] = Field(None, description="Only search inside this folder.")
+    sort: Literal["relevance", "modified", "name", "size"] = "relevance"
+
+class ListFilesInput(_FileFilters):
+    path: str = Field(".", description="The folder to list. Defaults to the current one.")
+    recursive: bool = Field(False, description="Include the contents of subfolders.")
+    sort: Literal["name", "modified", "size"] = "name"
+
+class _IndexedFileTool(FileTool):
+    """Shared querying and output formatting for the file index tools."""
+
+    def _query(self, args, query: str | None = None, recursive: bool = True):
+        index = get_file_index()
+        under = None
+        if args.path is not None:
+            under = resolve_path(args.path)
+            if not index.covers(under):
+                raise ToolError(
+                    ErrorCode.NOT_INDEXED,
+                    f"{args.path} is outside the indexed folders; use list_directory instead.",
+                    path=args.path,
+                )
+        rows, total = index.query(
+            text=query,
+            under=under,
+            recursive=recursive,
+            glob=args.glob,
+            kind=args.type,
+            modified_after=args.modified_after,
+            modified_before=args.modified_before,
+            min_size=args.min_size,
+            max_size=args.max_size,
+            sort=args.sort,
+            limit=args.limit,
+            offset=args.offset,
+        )
+        note = "" if index.ready.is_set() else "\n(The file index is still being refreshed, so very recent changes may be missing.)"
+        if not rows:
+            return ("No matching files." if args.offset == 0 or total == 0 else f"There are only {total} matches.") + note
+
+        home = os.path.expanduser("~")
+        lines = []
+        for path, is_dir, size, mtime in rows:
+            if path.startswith(home + os.sep):
+                path = "~" + path[len(home):]
+            modified = datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M")
+            lines.append(f"{path}/  folder  {modified}" if is_dir else f"{path}  {_format_size(size)}  {modified}")
+        end = args.offset + len(rows)
+        if end < total:
+            lines.append(f"[Showing {args.offset + 1}-{end} of {total}. Use offset {end} for more.]")
+        return "\n".join(lines) + note
+
+class SearchFilesTool(_IndexedFileTool):
+    name: str = "search_files"
+    description: str = (
+        "Use this tool to find files and folders anywhere in the user's folders in one step, instead of "
+        "listing directories one by one. Filter by words in the name or path, a name pattern, type, "
+        "modification date and size; results come in pages."
+    )
+    args_schema: Type[BaseModel] = SearchFilesInput
+
+    def _execute(self, args: SearchFilesInput):
+        return self._query(args, query=args.query)
+
+class ListFilesTool(_IndexedFileTool):
+    name: str = "list_files"
+    description: str = (
+        "Use this tool to list a folder's contents with sizes and modification times, optionally including "
+        "subfolders and filtered by name pattern, type, modification date and size; results come in pages."
+    )
+    args_schema: Type[BaseModel] = ListFilesInput
+
+    def _execute(self, args: ListFilesInput):
+        return self._query(args, recursive=args.recursive)
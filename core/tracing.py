@@ -0,0 +1,342 @@
+# core/tracing.py
+
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from rich.console import Console
+from rich.table import Table
+
+from .config import (
+    TRACE_ENABLED,
+    TRACE_PATH,
+    TRACE_SUMMARY,
+    TRACE_OTEL,
+    TRACE_PROMETHEUS_PORT,
+    CLI_THEME,
+)
+
+console = Console(theme=CLI_THEME)
+
+# Spans are timed with perf_counter; this converts them to wall-clock time for export.
+_WALL_CLOCK_OFFSET = time.time() - time.perf_counter()
+
+# The turn and span the current code runs in. asyncio tasks and
+# asyncio.to_thread copy these; plain threads must be started with
+# contextvars.copy_context().run to inherit them.
+_current_turn = ContextVar("voicer_turn", default=None)
+_current_span = ContextVar("voicer_span", default=None)
+
+# Stages shown in the per-turn summary, in pipeline order.
+SUMMARY_STAGES = ("capture", "stt", "agent", "llm", "tool", "tts", "playback")
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class Span:
+    """A timed step of a turn, such as one STT request, LLM call or tool call."""
+    def __init__(self, name: str, turn, parent_id: str | None, start: float, attributes: dict):
+        self.name = name
+        self.turn = turn
+        self.id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start = start
+        self.end = None
+        self.status = "ok"
+        self.attributes = attributes
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def to_json(self) -> dict:
+        return {
+            "type": "span",
+            "turn_id": self.turn.id if self.turn is not None else None,
+            "span_id": self.id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": datetime.fromtimestamp(self.start + _WALL_CLOCK_OFFSET).isoformat(timespec="milliseconds"),
+            "duration_ms": round(self.duration * 1000, 1),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class Turn:
+    """One voice turn, from capturing the utterance to the end of the spoken reply."""
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def stages(self) -> dict:
+        """Per span name: (count, total seconds), over the finished spans."""
+        totals = {}
+        with self._lock:
+            for span in self.spans:
+                count, seconds = totals.get(span.name, (0, 0.0))
+                totals[span.name] = (count + 1, seconds + span.duration)
+        return totals
+
+    def response_latency(self):
+        """Seconds from the end of the utterance to the first audio of the reply, if both were traced."""
+        with self._lock:
+            captured = [span.end for span in self.spans if span.name == "capture"]
+            played = [span.start for span in self.spans if span.name == "playback"]
+        if not captured or not played:
+            return None
+        return min(played) - max(captured)
+
+
+class Tracer:
+    """
+    Records per-turn spans for every stage of the voice pipeline.
+    - Each finished span is appended to TRACE_PATH as a JSON line, so a slow
+      turn can be traced to Hugging Face, OpenRouter, a tool or ElevenLabs.
+    - A finished turn prints a one-line latency summary and, when enabled,
+      is exported to OpenTelemetry (as a root span with the stages as
+      children) and to Prometheus histograms.
+    - `session_report()` prints percentiles per stage across all turns.
+    """
+    def __init__(
+        self,
+        enabled: bool = TRACE_ENABLED,
+        path: str | None = TRACE_PATH,
+        summary: bool = TRACE_SUMMARY,
+        otel: bool = TRACE_OTEL,
+        prometheus_port: int | None = TRACE_PROMETHEUS_PORT,
+    ):
+        self.enabled = enabled
+        self.summary = summary
+        self._lock = threading.Lock()
+        self._file = None
+        self._otel = None
+        self._metrics = None
+        self._finished = []
+        if not enabled:
+            return
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8", buffering=1)
+        if otel:
+            self._otel = self._open_otel()
+        if prometheus_port is not None:
+            self._metrics = self._open_prometheus(prometheus_port)
+
+    # --- Exporters ---
+
+    def _open_otel(self):
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            console.print("[warning]Tracing: opentelemetry-api is not installed; OpenTelemetry export is off.[/warning]")
+            return None
+        return trace
+
+    def _open_prometheus(self, port: int):
+        try:
+            from prometheus_client import Counter, Histogram, start_http_server
+        except ImportError:
+            console.print("[warning]Tracing: prometheus-client is not installed; Prometheus export is off.[/warning]")
+            return None
+        start_http_server(port)
+        return {
+            "stage": Histogram("voicer_stage_seconds", "Duration of each pipeline stage.", ["stage"]),
+            "response": Histogram("voicer_response_seconds", "From the end of the utterance to the first reply audio."),
+            "tokens": Counter("voicer_llm_tokens_total", "Tokens sent to and received from the LLM.", ["direction"]),
+        }
+
+    def _write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+
+    def _export_otel(self, turn: Turn, start: float, end: float):
+        trace = self._otel
+        otel_tracer = trace.get_tracer("voicer")
+        nanoseconds = lambda t: int((t + _WALL_CLOCK_OFFSET) * 1e9)
+        root = otel_tracer.start_span("voice_turn", start_time=nanoseconds(start), attributes={"voicer.turn_id": turn.id})
+        created = {}
+        for span in sorted(turn.spans, key=lambda span: span.start):
+            parent = created.get(span.parent_id, root)
+            attributes = {
+                f"voicer.{key}": value for key, value in span.attributes.items()
+                if isinstance(value, (str, bool, int, float))
+            }
+            otel_span = otel_tracer.start_span(
+                span.name, context=trace.set_span_in_context(parent), start_time=nanoseconds(span.start), attributes=attributes,
+            )
+            if span.status != "ok":
+                otel_span.set_status(trace.Status(trace.StatusCode.ERROR, span.status))
+            otel_span.end(end_time=nanoseconds(span.end))
+            created[span.id] = otel_span
+        root.end(end_time=nanoseconds(end))
+
+    # --- Spans ---
+
+    def new_turn(self) -> Turn:
+        return Turn()
+
+    @contextmanager
+    def activate(self, turn: Turn | None):
+        """Runs the enclosed code, and anything it starts, as part of `turn`."""
+        token = _current_turn.set(turn)
+        try:
+            yield turn
+        finally:
+            _current_turn.reset(token)
+
+    def _finish_span(self, span: Span):
+        if span.turn is not None:
+            span.turn.add(span)
+        self._write(span.to_json())
+        if self._metrics is not None:
+            self._metrics["stage"].labels(span.name).observe(span.duration)
+            for direction in ("input", "output"):
+                if span.name == "llm" and span.attributes.get(f"{direction}_tokens"):
+                    self._metrics["tokens"].labels(direction).inc(span.attributes[f"{direction}_tokens"])
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Times the enclosed block as a span of the current turn. Attributes can
+        be added to the yielded span before the block ends.
+        """
+        if not self.enabled:
+            yield Span(name, None, None, 0.0, attributes)
+            return
+        parent = _current_span.get()
+        span = Span(name, _current_turn.get(), parent.id if parent else None, time.perf_counter(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end = time.perf_counter()
+            self._finish_span(span)
+
+    def start_span(self, name: str, **attributes) -> Span:
+        """Starts a span that is ended later with `end_span`, e.g. from a callback."""
+        parent = _current_span.get()
+        return Span(name, _current_turn.get(), parent.id if parent else None, time.perf_counter(), attributes)
+
+    def end_span(self, span: Span, status: str = "ok"):
+        if not self.enabled:
+            return
+        span.end = time.perf_counter()
+        span.status = status
+        self._finish_span(span)
+
+    def record(self, name: str, start: float, end: float, **attributes):
+        """Records a span of the current turn that was timed elsewhere (perf_counter values)."""
+        span = self.start_span(name, **attributes)
+        span.start = start
+        if self.enabled:
+            span.end = end
+            self._finish_span(span)
+
+    # --- Turns ---
+
+    def finish(self, turn: Turn):
+        """Closes a turn once its reply has been played (or dropped)."""
+        if not self.enabled or not turn.spans:
+            return
+        start = min(span.start for span in turn.spans)
+        end = max(span.end for span in turn.spans)
+        stages = turn.stages()
+        latency = turn.response_latency()
+        self._write({
+            "type": "turn",
+            "turn_id": turn.id,
+            "start": datetime.fromtimestamp(start + _WALL_CLOCK_OFFSET).isoformat(timespec="milliseconds"),
+            "duration_ms": round((end - start) * 1000, 1),
+            "response_ms": round(latency * 1000, 1) if latency is not None else None,
+            "stages": {name: {"count": count, "ms": round(seconds * 1000, 1)} for name, (count, seconds) in stages.items()},
+        })
+        with self._lock:
+            self._finished.append((stages, latency))
+        if self._otel is not None:
+            self._export_otel(turn, start, end)
+        if self._metrics is not None and latency is not None:
+            self._metrics["response"].observe(latency)
+        if self.summary:
+            console.print(f"[system]{self._summary_line(turn, stages, latency)}[/system]")
+
+    def _summary_line(self, turn: Turn, stages: dict, latency) -> str:
+        parts = []
+        for name in SUMMARY_STAGES:
+            if name not in stages:
+                continue
+            count, seconds = stages[name]
+            parts.append(f"{name} {seconds * 1000:.0f} ms" + (f" ({count}x)" if count > 1 else ""))
+        llm_spans = [span for span in turn.spans if span.name == "llm"]
+        tokens_in = sum(span.attributes.get("input_tokens") or 0 for span in llm_spans)
+        tokens_out = sum(span.attributes.get("output_tokens") or 0 for span in llm_spans)
+        if tokens_in or tokens_out:
+            parts.append(f"{tokens_in} in / {tokens_out} out tokens")
+        ttfb = [span.attributes["ttfb_ms"] for span in turn.spans if span.name == "tts" and span.attributes.get("ttfb_ms") is not None]
+        if ttfb:
+            parts.append(f"TTS first byte {ttfb[0]:.0f} ms")
+        if latency is not None:
+            parts.append(f"response {latency * 1000:.0f} ms")
+        return f"Turn {turn.id}: " + " | ".join(parts)
+
+    def session_report(self):
+        """Prints latency percentiles per stage over the turns of this session."""
+        with self._lock:
+            finished = list(self._finished)
+        if not finished:
+            return
+        table = Table(title=f"Latency over {len(finished)} turns")
+        for column in ("Stage", "p50 (ms)", "p95 (ms)", "max (ms)"):
+            table.add_column(column, justify="left" if column == "Stage" else "right")
+        rows = [(name, [stages[name][1] for stages, _ in finished if name in stages]) for name in SUMMARY_STAGES]
+        rows.append(("response", [latency for _, latency in finished if latency is not None]))
+        for name, values in rows:
+            if values:
+                table.add_row(name, *(f"{v * 1000:.0f}" for v in (percentile(values, 50), percentile(values, 95), max(values))))
+        console.print(table)
+
+    @property
+    def finished_turns(self) -> int:
+        """Number of turns closed with `finish` so far."""
+        with self._lock:
+            return len(self._finished)
+
+    def close(self):
+        if self._file is not None:
+            with self._lock:
+                self._file.close()
+                self._file = None
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Returns the shared tracer configured in core/config.py."""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
@@ -0,0 +1,488 @@
+# core/transcription.py
+
+import contextvars
+import heapq
+import itertools
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from .connections import request_with_retry, warm_connection
+from .preprocess import encode_upload, normalize_loudness
+from .tracing import get_tracer
+from .config import (
+    TRANSCRIPTION_BACKEND,
+    huggingface_api_key,
+    HF_TRANSCRIPTION_URL,
+    LOCAL_WHISPER_MODEL,
+    LOCAL_WHISPER_DEVICE,
+    LOCAL_WHISPER_COMPUTE_TYPE,
+    LOCAL_WHISPER_CPU_THREADS,
+    LOCAL_WHISPER_BEAM_SIZE,
+    LOCAL_WHISPER_LANGUAGE,
+    STT_WINDOW_SECONDS,
+    STT_OVERLAP_SECONDS,
+    STT_SCHEDULER_ENABLED,
+    STT_BATCH_WINDOW_MS,
+    STT_BATCH_MAX_SIZE,
+    STT_BATCH_BUCKET_SECONDS,
+    STT_HTTP_CONCURRENCY,
+    STT_UPLOAD_CODEC,
+)
+
+# How often the window worker checks whether a new window is ready.
+_POLL_SECONDS = 0.1
+# Boundary words of the previous window that may be replaced by the next one.
+_MAX_BOUNDARY_WORDS = 2
+
+
+# --- TRANSCRIPTION BACKENDS ---
+
+class Transcriber:
+    """
+    Base class for speech-to-text backends.
+    `transcribe` takes a list of int16 sample arrays (one utterance, possibly
+    split where it wraps around a ring buffer) and returns the text.
+    `final` is False for a window of an utterance that is still being spoken,
+    which a scheduler may serve after the finals someone is waiting for.
+    """
+    name = "transcriber"
+    # Whether `transcribe_batch` does better than one request per clip.
+    batched = False
+
+    def transcribe(self, segments: list, sample_rate: int, final: bool = True) -> str:
+        raise NotImplementedError
+
+    def transcribe_batch(self, clips: list) -> list:
+        """Transcribes a list of (segments, sample_rate) clips; returns one text per clip."""
+        return [self.transcribe(segments, sample_rate) for segments, sample_rate in clips]
+
+    def warm_up(self):
+        """Prepares the backend so the first real request is not a cold start."""
+
+
+class HuggingFaceTranscriber(Transcriber):
+    """
+    Transcribes with a Whisper model on the Hugging Face Inference API.
+    Utterances are loudness-normalized and uploaded as WAV, FLAC or Opus
+    (STT_UPLOAD_CODEC).
+    """
+    name = "Hugging Face"
+
+    def __init__(self, api_key: str = huggingface_api_key, url: str = HF_TRANSCRIPTION_URL, codec: str = STT_UPLOAD_CODEC):
+        if not api_key:
+            raise ValueError("HUGGINGFACE_API_KEY not found in .env file.")
+        self.api_key = api_key
+        self.url = url
+        self.codec = codec
+
+    def transcribe(self, segments: list, sample_rate: int, final: bool = True) -> str:
+        tracer = get_tracer()
+        with tracer.span("stt.encode", format=self.codec):
+            body, content_type = encode_upload(normalize_loudness(segments, sample_rate), sample_rate, self.codec)
+        headers = {
+           "Authorization": f"Bearer {self.api_key}",
+           "Content-Type": content_type,
+           # Set explicitly so the streamed body isn't sent chunked.
+           "Content-Length": str(len(body)),
+        }
+        # A WAV body streams the header and PCM views straight from the ring
+        # buffer over the pooled, kept-alive connection.
+        with tracer.span("stt.request", backend="huggingface", bytes=len(body)) as span:
+            response = request_with_retry("huggingface", "POST", self.url, headers=headers, content=body)
+            span.attributes["status_code"] = response.status_code
+        if response.status_code != 200:
+            raise RuntimeError(f"Hugging Face API Error {response.status_code}: {response.text}")
+        return response.json().get('text', '').strip()
+
+    def warm_up(self):
+        warm_connection("huggingface")
+
+
+class LocalWhisperTranscriber(Transcriber):
+    """
+    Transcribes in-process with faster-whisper (CTranslate2).
+    The model is loaded once and stays in memory; int8 quantization keeps it
+    fast on a CPU. Requires `pip install faster-whisper`.
+    - `transcribe_batch` encodes and decodes several clips in one call.
+    """
+    name = "local Whisper"
+    batched = True
+
+    def __init__(
+        self,
+        model_size: str = LOCAL_WHISPER_MODEL,
+        device: str = LOCAL_WHISPER_DEVICE,
+        compute_type: str = LOCAL_WHISPER_COMPUTE_TYPE,
+        cpu_threads: int = LOCAL_WHISPER_CPU_THREADS,
+        beam_size: int = LOCAL_WHISPER_BEAM_SIZE,
+        language: str = LOCAL_WHISPER_LANGUAGE,
+    ):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise ImportError("The local transcription backend needs faster-whisper. Install it with `pip install faster-whisper`.")
+        self.model = WhisperModel(model_size, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+        self.beam_size = beam_size
+        self.language = language
+
+    def transcribe(self, segments: list, sample_rate: int, final: bool = True) -> str:
+        if sample_rate != 16000:
+            raise ValueError("The local Whisper model expects 16 kHz audio.")
+        if not segments:
+            return ""
+        tracer = get_tracer()
+        with tracer.span("stt.encode", format="float32"):
+            audio = np.concatenate(segments).astype(np.float32) / 32768.0
+        with tracer.span("stt.request", backend="local", audio_seconds=round(len(audio) / sample_rate, 2)):
+            results, _ = self.model.transcribe(
+                audio,
+                beam_size=self.beam_size,
+                language=self.language,
+                condition_on_previous_text=False,
+            )
+            # Segments are decoded lazily, so join them inside the span.
+            return " ".join(segment.text.strip() for segment in results).strip()
+
+    def transcribe_batch(self, clips: list) -> list:
+        """
+        Whisper pads every input to a 30-second window, so clips that fit one
+        are stacked into a single encoder and decoder call. Longer clips need
+        the sliding-window decoding of `transcribe` and go one at a time.
+        """
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+
+        extractor = self.model.feature_extractor
+        texts, batch = [""] * len(clips), []
+        for i, (segments, sample_rate) in enumerate(clips):
+            if sample_rate != 16000:
+                raise ValueError("The local Whisper model expects 16 kHz audio.")
+            samples = sum(len(segment) for segment in segments)
+            if samples > extractor.n_samples:
+                texts[i] = self.transcribe(segments, sample_rate)
+            elif samples:
+                batch.append(i)
+        if not batch:
+            return texts
+
+        tracer = get_tracer()
+        with tracer.span("stt.encode", format="log-mel", clips=len(batch)):
+            features = np.stack([
+                pad_or_trim(extractor(np.concatenate(clips[i][0]).astype(np.float32) / 32768.0)[..., :-1])
+                for i in batch
+            ])
+        with tracer.span("stt.request", backend="local", batch_size=len(batch)):
+            tokenizer = Tokenizer(self.model.hf_tokenizer, self.model.model.is_multilingual, task="transcribe", language=self.language)
+            prompt = self.model.get_prompt(tokenizer, [], without_timestamps=True)
+            results = self.model.model.generate(
+                self.model.encode(features),
+                [list(prompt) for _ in batch],
+                beam_size=self.beam_size,
+                max_length=self.model.max_length,
+                suppress_blank=True,
+                suppress_tokens=[-1],
+            )
+        for i, result in zip(batch, results):
+            texts[i] = tokenizer.decode(result.sequences_ids[0]).strip()
+        return texts
+
+    def warm_up(self):
+        # The first call allocates the decoder's buffers; do it off the critical path.
+        self.transcribe([np.zeros(16000, dtype=np.int16)], 16000)
+
+
+# --- SCHEDULING ---
+
+class _Request:
+    """One pending transcription, with the caller's context for tracing."""
+    def __init__(self, segments: list, sample_rate: int, final: bool):
+        self.segments = segments
+        self.sample_rate = sample_rate
+        self.final = final
+        self.seconds = sum(len(segment) for segment in segments) / sample_rate
+        self.context = contextvars.copy_context()
+        self.future = Future()
+        self.queued = time.perf_counter()
+
+
+class TranscriptionScheduler(Transcriber):
+    """
+    Funnels every transcription of the process through one queue, so
+    concurrent utterances (several server sessions, or the windows and tail
+    of one) share the backend instead of racing for it.
+    - Finals come before partial windows, oldest first within each.
+    - A batched backend (local Whisper) gets the requests that arrive within
+      `window_ms` in one call, grouped by length so short clips don't wait on
+      long ones.
+    - Any other backend (the Hugging Face API) gets at most `concurrency`
+      requests in flight at once.
+    """
+    def __init__(
+        self,
+        backend: Transcriber,
+        window_ms: float = STT_BATCH_WINDOW_MS,
+        max_batch: int = STT_BATCH_MAX_SIZE,
+        bucket_seconds: float = STT_BATCH_BUCKET_SECONDS,
+        concurrency: int = STT_HTTP_CONCURRENCY,
+    ):
+        self.backend = backend
+        self.name = backend.name
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.bucket_seconds = bucket_seconds
+        self._pending = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        if not backend.batched:
+            self._slots = threading.Semaphore(max(1, concurrency))
+            self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="stt")
+        threading.Thread(target=self._dispatch, daemon=True).start()
+
+    def transcribe(self, segments: list, sample_rate: int, final: bool = True) -> str:
+        request = _Request(segments, sample_rate, final)
+        with self._condition:
+            heapq.heappush(self._pending, (0 if final else 1, next(self._sequence), request))
+            self._condition.notify()
+        return request.future.result()
+
+    def warm_up(self):
+        self.backend.warm_up()
+
+    def _take(self, count: int) -> list:
+        """The `count` most urgent requests. Call with the condition held."""
+        return [heapq.heappop(self._pending)[2] for _ in range(min(count, len(self._pending)))]
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+            if self.backend.batched:
+                self._run_batches()
+            else:
+                self._run_next()
+
+    # --- Concurrent requests ---
+
+    def _run_next(self):
+        # Pick the request only once a slot is free, so a final that arrives
+        # meanwhile still goes ahead of queued partials.
+        self._slots.acquire()
+        with self._condition:
+            request = self._take(1)[0]
+        self._executor.submit(self._run, request)
+
+    def _run(self, request: _Request):
+        try:
+            request.context.run(self._transcribe_one, request)
+        finally:
+            self._slots.release()
+
+    def _transcribe_one(self, request: _Request):
+        get_tracer().record("stt.queue", request.queued, time.perf_counter(), final=request.final)
+        try:
+            request.future.set_result(self.backend.transcribe(request.segments, request.sample_rate, request.final))
+        except Exception as e:
+            request.future.set_exception(e)
+
+    # --- Batches ---
+
+    def _run_batches(self):
+        deadline = time.monotonic() + self.window
+        with self._condition:
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            requests = self._take(self.max_batch)
+        buckets = {}
+        for request in requests:
+            buckets.setdefault(int(request.seconds // self.bucket_seconds), []).append(request)
+        # Buckets holding a final first, then shortest first.
+        for _, bucket in sorted(buckets.items(), key=lambda item: (min(not r.final for r in item[1]), item[0])):
+            self._run_batch(bucket)
+
+    def _run_batch(self, requests: list):
+        started = time.perf_counter()
+        try:
+            texts, error = self.backend.transcribe_batch([(r.segments, r.sample_rate) for r in requests]), None
+        except Exception as e:
+            texts, error = None, e
+        finished = time.perf_counter()
+        for i, request in enumerate(requests):
+            tracer = get_tracer()
+            request.context.run(tracer.record, "stt.queue", request.queued, started, final=request.final)
+            request.context.run(tracer.record, "stt.batch", started, finished, batch_size=len(requests))
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(texts[i])
+
+
+_TRANSCRIBERS = {
+    "huggingface": HuggingFaceTranscriber,
+    "local": LocalWhisperTranscriber,
+}
+_transcriber = None
+_transcriber_lock = threading.Lock()
+
+
+def get_transcriber() -> Transcriber:
+    """Returns the shared transcriber selected by TRANSCRIPTION_BACKEND in the config."""
+    global _transcriber
+    with _transcriber_lock:
+        if _transcriber is None:
+            try:
+                backend = _TRANSCRIBERS[TRANSCRIPTION_BACKEND]
+            except KeyError:
+                raise ValueError(f"Unknown TRANSCRIPTION_BACKEND '{TRANSCRIPTION_BACKEND}'. Choose one of: {', '.join(_TRANSCRIBERS)}.")
+            _transcriber = backend()
+            if STT_SCHEDULER_ENABLED:
+                _transcriber = TranscriptionScheduler(_transcriber)
+        return _transcriber
+
+
+# --- INCREMENTAL TRANSCRIPTION ---
+
+def _normalize_word(word: str) -> str:
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def merge_transcripts(committed: str, new: str, max_overlap_words: int = 12) -> str:
+    """
+    Appends the transcript of an overlapping window to the text so far.
+    The words spoken in the overlap appear at the end of `committed` and the
+    start of `new`; the longest such run is kept only once. Up to two words at
+    the end of `committed` may be dropped, since a window that ends mid-word
+    tends to produce a garbled last word.
+    """
+    old_words, new_words = committed.split(), new.split()
+    if not old_words:
+        return new.strip()
+    if not new_words:
+        return committed.strip()
+    old_norm = [_normalize_word(w) for w in old_words]
+    new_norm = [_normalize_word(w) for w in new_words]
+
+    for size in range(min(max_overlap_words, len(old_norm), len(new_norm)), 0, -1):
+        for dropped in range(0, _MAX_BOUNDARY_WORDS + 1):
+            end = len(old_norm) - dropped
+            if end - size < 0:
+                break
+            # Away from the boundary, a single matching short word ("the",
+            # "a") is too likely to be a coincidence.
+            if size == 1 and dropped and len(new_norm[0]) < 4:
+                continue
+            if old_norm[end - size:end] == new_norm[:size]:
+                return " ".join(old_words[:end] + new_words[size:])
+    return " ".join(old_words + new_words)
+
+
+class IncrementalTranscriber:
+    """
+    Transcribes an utterance in overlapping windows while it is still being
+    recorded, so only the final few seconds are left to transcribe once the
+    speaker stops.
+    - `transcribe_fn` takes a list of int16 sample arrays and `final`, which
+      is False for windows taken while the speaker is still talking.
+    - `origin` returns the sample index where the utterance starts, or None
+      while no speech has been detected yet.
+    """
+    def __init__(
+        self,
+        transcribe_fn,
+        buffer,
+        sample_rate: int,
+        origin,
+        window_seconds: float = STT_WINDOW_SECONDS,
+        overlap_seconds: float = STT_OVERLAP_SECONDS,
+        on_partial=None,
+    ):
+        self._transcribe = transcribe_fn
+        self._buffer = buffer
+        self._origin = origin
+        self._on_partial = on_partial
+        self._window = int(window_seconds * sample_rate)
+        self._step = self._window - int(overlap_seconds * sample_rate)
+        if self._step <= 0:
+            raise ValueError("STT_OVERLAP_SECONDS must be shorter than STT_WINDOW_SECONDS.")
+        self._lock = threading.Lock()
+        self._start = None
+        self._window_start = None
+        self._span = None
+        self._text = ""
+        self._error = None
+        self._finishing = threading.Event()
+        # Run in a copy of the caller's context so window requests are traced as part of its turn.
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,), daemon=True)
+        self._thread.start()
+
+    def close_capture(self, start: int, stop: int):
+        """Freezes the utterance range once recording has ended."""
+        with self._lock:
+            self._span = (start, stop)
+
+    def _next_window(self):
+        """Returns the next complete window to transcribe, or None."""
+        with self._lock:
+            if self._span is not None:
+                start, limit = self._span
+            else:
+                start, limit = self._origin(), self._buffer.total_written
+            if start is None:
+                return None
+            if start != self._start:
+                # First window, or the endpointer restarted on a new onset.
+                self._start, self._window_start, self._text = start, start, ""
+            if self._window_start + self._window > limit:
+                return None
+            return self._start, self._window_start
+
+    def _run(self):
+        while not self._finishing.is_set():
+            window = self._next_window()
+            if window is None:
+                if self._span is not None:
+                    return
+                self._finishing.wait(_POLL_SECONDS)
+                continue
+            start, window_start = window
+            try:
+                text = self._transcribe(
+                    self._buffer.segments(window_start, window_start + self._window),
+                    final=self._span is not None,
+                )
+            except Exception as e:
+                # Give up on windows; `finish` falls back to a single request.
+                self._error = e
+                return
+            with self._lock:
+                if start != self._start:
+                    continue
+                self._text = merge_transcripts(self._text, text)
+                self._window_start = window_start + self._step
+                partial = self._text
+            if self._on_partial and partial:
+                self._on_partial(partial)
+
+    def finish(self) -> str:
+        """
+        Waits for the in-flight window, transcribes the remaining tail and
+        returns the stitched transcript. Call after `close_capture`.
+        """
+        self._finishing.set()
+        self._thread.join()
+        start, stop = self._span
+        if stop <= start:
+            return ""
+        if self._error is not None or self._start != start:
+            return self._transcribe(self._buffer.segments(start, stop), final=True).strip()
+        if self._window_start < stop:
+            tail = self._transcribe(self._buffer.segments(self._window_start, stop), final=True)
+            self._text = merge_transcripts(self._text, tail)
+        return self._text
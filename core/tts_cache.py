@@ -0,0 +1,138 @@
+# core/tts_cache.py
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from .config import TTS_CACHE_DIR, TTS_CACHE_MEMORY_BYTES, TTS_CACHE_DISK_BYTES
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace so trivially different replies share a cache entry."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class TTSCache:
+    """
+    A two-level cache of synthesized audio, keyed by a hash of
+    (voice, model, output format, normalized text).
+    - The in-memory level holds the most recently used clips.
+    - The on-disk level survives restarts; files are evicted least recently
+      used first (by modification time) once the size budget is exceeded.
+    """
+    def __init__(
+        self,
+        directory: str = TTS_CACHE_DIR,
+        memory_bytes: int = TTS_CACHE_MEMORY_BYTES,
+        disk_bytes: int = TTS_CACHE_DISK_BYTES,
+    ):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._disk_size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".audio"))
+
+    @staticmethod
+    def key(voice_id: str, model_id: str, output_format: str, text: str) -> str:
+        material = "\0".join((voice_id, model_id, output_format, normalize_text(text)))
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".audio")
+
+    def __contains__(self, key: str) -> bool:
+        """Checks for an entry without touching the hit/miss counters."""
+        with self._lock:
+            if key in self._memory:
+                return True
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str):
+        """Returns the cached audio bytes, or None on a miss."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = f.read()
+            # Mark the file as recently used for disk eviction.
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        """Stores audio in memory and on disk, evicting old entries as needed."""
+        if not audio:
+            return
+        with self._lock:
+            self._remember(key, audio)
+        path = self._path(key)
+        existed = os.path.exists(path)
+        # Write to a temporary file first so readers never see partial audio.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if not existed:
+                self._disk_size += len(audio)
+            over_budget = self._disk_size > self.disk_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _remember(self, key: str, audio: bytes):
+        """Adds an entry to the in-memory LRU. Call with the lock held."""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        if len(audio) > self.memory_bytes:
+            return
+        self._memory[key] = audio
+        self._memory_size += len(audio)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _evict_disk(self):
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".audio")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        with self._lock:
+            for entry in entries:
+                if self._disk_size <= self.disk_bytes:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                self._disk_size -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_bytes": self._disk_size,
+            }
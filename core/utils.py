@@ -1,20 +1,98 @@
-import operator
+import json
+import time
 from typing import Annotated, Sequence, TypedDict
 
-from langchain_core.messages import BaseMessage
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
+from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode # This is the correct import needed
 
+from .prompts import SUMMARY_CONTEXT
+from .tracing import get_tracer
+
 # Define the state for our graph
+# add_messages appends new messages, replaces ones with a matching id and
+# applies RemoveMessage, which lets the memory node rewrite the history.
 class AgentState(TypedDict):
-    messages: Annotated[Sequence[BaseMessage], operator.add]
+    messages: Annotated[Sequence[BaseMessage], add_messages]
+    summary: str
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Traces the agent's work as spans of the current voice turn (see core/tracing.py).
+    - "llm": one per model call, with token counts and time to first token.
+    - "tool": one per tool call, with the error code if the tool failed.
+    """
+    # Recording a span is cheap, so run in the caller's context instead of an executor.
+    run_inline = True
+
+    def __init__(self, tracer=None):
+        self.tracer = tracer or get_tracer()
+        self._spans = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._spans[run_id] = self.tracer.start_span("llm", model=(metadata or {}).get("ls_model_name"))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        span = self._spans.get(run_id)
+        if span is not None and "ttft_ms" not in span.attributes:
+            span.attributes["ttft_ms"] = round((time.perf_counter() - span.start) * 1000, 1)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        message = getattr(response.generations[0][0], "message", None) if response.generations and response.generations[0] else None
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            span.attributes["input_tokens"] = usage.get("input_tokens")
+            span.attributes["output_tokens"] = usage.get("output_tokens")
+        else:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            span.attributes["input_tokens"] = token_usage.get("prompt_tokens")
+            span.attributes["output_tokens"] = token_usage.get("completion_tokens")
+        span.attributes["tool_calls"] = len(getattr(message, "tool_calls", None) or [])
+        self.tracer.end_span(span)
 
-def create_react_agent(llm, tools, checkpointer):
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            self.tracer.end_span(span, status=type(error).__name__)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._spans[run_id] = self.tracer.start_span("tool", tool=(serialized or {}).get("name") or kwargs.get("name"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        content = getattr(output, "content", output)
+        # Failed file tools return {"error": code, ...} (see core/validation.py).
+        if isinstance(content, str) and content.startswith('{"error"'):
+            try:
+                span.attributes["error"] = json.loads(content)["error"]
+            except (ValueError, KeyError):
+                pass
+        self.tracer.end_span(span)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            self.tracer.end_span(span, status=type(error).__name__)
+
+def create_react_agent(llm, tools, checkpointer, system_prompt: str | None = None, memory=None):
     """
     Creates a LangGraph ReAct agent with the correct structure.
+    The model uses native (structured) tool calling and may request several
+    tool calls in one turn; the tool node runs them concurrently.
+    If a `memory` (core.memory.ConversationMemory) is given, it runs after
+    each final reply to keep the stored history within its token budget.
     """
     # ToolNode is the correct way to create a node that executes tools
     tool_node = ToolNode(tools)
+    model = llm.bind_tools(tools, parallel_tool_calls=True)
 
     # Define the function that determines whether to continue or end the workflow
     def should_continue(state):
@@ -27,19 +105,35 @@ def create_react_agent(llm, tools, checkpointer):
         else:
             return "continue"
 
+    def _prompt(state):
+        messages = list(state['messages'])
+        # The system prompt (and the summary of older turns) is added per
+        # call rather than stored in the checkpointed history.
+        instructions = system_prompt or ""
+        if state.get('summary'):
+            instructions += SUMMARY_CONTEXT.format(summary=state['summary'])
+        if instructions:
+            messages.insert(0, SystemMessage(content=instructions.strip()))
+        return messages
+
     # Define the function that calls the model
     def call_model(state):
-        messages = state['messages']
-        response = llm.invoke(messages)
+        response = model.invoke(_prompt(state))
         # We return a list, because this will get added to the existing list
         return {"messages": [response]}
 
+    async def acall_model(state):
+        response = await model.ainvoke(_prompt(state))
+        return {"messages": [response]}
+
     # Define the graph workflow
     workflow = StateGraph(AgentState)
 
     # Define the two nodes we will cycle between
-    workflow.add_node("agent", call_model)
+    workflow.add_node("agent", RunnableLambda(call_model, afunc=acall_model))
     workflow.add_node("action", tool_node)
+    if memory is not None:
+        workflow.add_node("memory", RunnableLambda(memory.update, afunc=memory.aupdate))
 
     # Set the entrypoint as `agent`
     workflow.set_entry_point("agent")
@@ -50,14 +144,16 @@ def create_react_agent(llm, tools, checkpointer):
         should_continue,
         {
             "continue": "action",
-            "end": END,
+            "end": "memory" if memory is not None else END,
         },
     )
+    if memory is not None:
+        workflow.add_edge("memory", END)
 
     # Add a normal edge from the action (tool) node back to the agent
     workflow.add_edge("action", "agent")
 
     # Compile the graph and add the checkpointer
     graph = workflow.compile(checkpointer=checkpointer)
-    
+
     return graph
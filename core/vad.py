@@ -0,0 +1,195 @@
+# core/vad.py
+
+import numpy as np
+
+from .config import (
+    VAD_BACKEND,
+    VAD_FRAME_MS,
+    VAD_ENERGY_THRESHOLD_DB,
+    VAD_NOISE_MARGIN_DB,
+    VAD_MAX_ZERO_CROSSING_RATE,
+    VAD_ONSET_MS,
+    VAD_HANGOVER_MS,
+    VAD_PADDING_MS,
+    VAD_MIN_SPEECH_MS,
+    VAD_MAX_UTTERANCE_SECONDS,
+)
+
+
+class VoiceActivityDetector:
+    """
+    Base class for voice activity detectors.
+    Subclasses classify fixed-size int16 frames as speech or non-speech, which
+    lets a model-based detector replace the energy detector without touching
+    the endpointing logic.
+    """
+    def __init__(self, sample_rate: int, frame_ms: int = VAD_FRAME_MS):
+        self.sample_rate = sample_rate
+        self.frame_size = int(sample_rate * frame_ms / 1000)
+
+    def is_speech(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Takes an int16 array of shape (n_frames, frame_size) and returns a
+        boolean array of shape (n_frames,).
+        """
+        raise NotImplementedError
+
+
+class EnergyVAD(VoiceActivityDetector):
+    """
+    A lightweight detector based on short-term energy and zero-crossing rate.
+    - Energy must exceed both an absolute threshold and the adaptive noise floor.
+    - A high zero-crossing rate marks broadband noise (fans, hiss) as non-speech.
+    """
+    def __init__(
+        self,
+        sample_rate: int,
+        frame_ms: int = VAD_FRAME_MS,
+        threshold_db: float = VAD_ENERGY_THRESHOLD_DB,
+        noise_margin_db: float = VAD_NOISE_MARGIN_DB,
+        max_zero_crossing_rate: float = VAD_MAX_ZERO_CROSSING_RATE,
+    ):
+        super().__init__(sample_rate, frame_ms)
+        self.threshold_db = threshold_db
+        self.noise_margin_db = noise_margin_db
+        self.max_zero_crossing_rate = max_zero_crossing_rate
+        self.noise_floor_db = threshold_db - noise_margin_db
+
+    def is_speech(self, frames: np.ndarray) -> np.ndarray:
+        samples = frames.astype(np.float32) / 32768.0
+        rms = np.sqrt(np.mean(samples * samples, axis=1))
+        energy_db = 20.0 * np.log10(np.maximum(rms, 1e-10))
+        signs = np.signbit(frames)
+        zero_crossing_rate = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+        threshold = max(self.threshold_db, self.noise_floor_db + self.noise_margin_db)
+        speech = (energy_db > threshold) & (zero_crossing_rate < self.max_zero_crossing_rate)
+
+        # Track the background level on non-speech frames so the detector
+        # adapts to noisy rooms instead of triggering on them.
+        quiet = energy_db[~speech]
+        if quiet.size:
+            self.noise_floor_db = 0.95 * self.noise_floor_db + 0.05 * float(np.mean(quiet))
+        return speech
+
+
+_VAD_BACKENDS = {
+    "energy": EnergyVAD,
+}
+
+
+def create_vad(sample_rate: int) -> VoiceActivityDetector:
+    """Creates the detector selected by VAD_BACKEND in the config."""
+    try:
+        return _VAD_BACKENDS[VAD_BACKEND](sample_rate)
+    except KeyError:
+        raise ValueError(f"Unknown VAD_BACKEND '{VAD_BACKEND}'. Choose one of: {', '.join(_VAD_BACKENDS)}.")
+
+
+class Endpointer:
+    """
+    Finds the boundaries of a single utterance in a stream of audio chunks.
+    - Waits for a short run of speech frames before the utterance starts.
+    - Keeps a little audio before the onset so the first syllable isn't clipped.
+    - Ends the utterance once silence has lasted for the hangover period.
+    The endpointer only tracks sample positions; the audio itself lives in
+    the capture ring buffer, addressed by the same indices.
+    """
+    def __init__(
+        self,
+        vad: VoiceActivityDetector,
+        onset_ms: int = VAD_ONSET_MS,
+        hangover_ms: int = VAD_HANGOVER_MS,
+        padding_ms: int = VAD_PADDING_MS,
+        min_speech_ms: int = VAD_MIN_SPEECH_MS,
+        max_utterance_seconds: float = VAD_MAX_UTTERANCE_SECONDS,
+    ):
+        self.vad = vad
+        frame_ms = 1000 * vad.frame_size / vad.sample_rate
+        self._onset_frames = max(1, round(onset_ms / frame_ms))
+        self._hangover_frames = max(1, round(hangover_ms / frame_ms))
+        self._padding_frames = round(padding_ms / frame_ms)
+        self._min_speech_frames = max(1, round(min_speech_ms / frame_ms))
+        self._max_frames = int(max_utterance_seconds * 1000 / frame_ms)
+        self.reset()
+
+    def reset(self):
+        """Prepares the endpointer for a new stream; positions restart at zero."""
+        self._remainder = np.zeros(0, dtype=np.int16)
+        self._frame_index = 0
+        self._restart()
+
+    def _restart(self):
+        """Forgets the current utterance but keeps the stream position."""
+        self._speech_run = 0
+        self._silence_run = 0
+        self._speech_frames = 0
+        self._start_frame = 0
+        self._last_speech = 0
+        self.triggered = False
+        self.done = False
+
+    def process(self, chunk: np.ndarray) -> bool:
+        """
+        Feeds a chunk of int16 samples. Returns True once the utterance is complete.
+        """
+        if self.done:
+            return True
+        if len(self._remainder):
+            samples = np.concatenate((self._remainder, chunk.reshape(-1)))
+        else:
+            samples = chunk.reshape(-1)
+        frame_size = self.vad.frame_size
+        n_frames = len(samples) // frame_size
+        self._remainder = samples[n_frames * frame_size:].copy()
+        if n_frames == 0:
+            return False
+
+        frames = samples[:n_frames * frame_size].reshape(n_frames, frame_size)
+        for speech in self.vad.is_speech(frames):
+            index = self._frame_index
+            self._frame_index += 1
+            if not self.triggered:
+                self._speech_run = self._speech_run + 1 if speech else 0
+                if self._speech_run >= self._onset_frames:
+                    self.triggered = True
+                    self._start_frame = max(0, index + 1 - self._onset_frames - self._padding_frames)
+                    self._speech_frames = self._speech_run
+                    self._last_speech = index + 1
+                continue
+
+            if speech:
+                self._speech_frames += 1
+                self._silence_run = 0
+                self._last_speech = index + 1
+            else:
+                self._silence_run += 1
+
+            if self._silence_run >= self._hangover_frames or index + 1 - self._start_frame >= self._max_frames:
+                if self._speech_frames < self._min_speech_frames:
+                    # Too short to be a command (a click or a cough); keep listening.
+                    self._restart()
+                    continue
+                self.done = True
+                break
+        return self.done
+
+    @property
+    def speech_seconds(self) -> float:
+        """Seconds of speech heard in the current utterance (0 before the onset)."""
+        return self._speech_frames * self.vad.frame_size / self.vad.sample_rate if self.triggered else 0.0
+
+    @property
+    def start(self):
+        """Sample index where the current utterance starts, or None before the onset."""
+        return self._start_frame * self.vad.frame_size if self.triggered else None
+
+    def span(self):
+        """
+        Returns the (start, stop) sample range of the utterance with trailing
+        silence trimmed, or None if no speech was heard.
+        """
+        if not self.triggered or self._speech_frames < self._min_speech_frames:
+            return None
+        stop = min(self._frame_index, self._last_speech + self._padding_frames)
+        return self._start_frame * self.vad.frame_size, stop * self.vad.frame_size
@@ -0,0 +1,152 @@
+# core/validation.py
+
+import functools
+import json
+import os
+from enum import StrEnum
+
+from pydantic import BaseModel, ConfigDict, ValidationError
+from pydantic_core import InitErrorDetails
+
+from .config import FILE_SANDBOX_ROOTS
+
+try:
+    # orjson parses and serializes several times faster than the json module.
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# --- JSON ---
+
+def loads(text: str):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def dumps(value) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+# --- Errors ---
+
+class ErrorCode(StrEnum):
+    """Machine-readable reasons a tool call failed."""
+    INVALID_INPUT = "invalid_input"
+    NOT_FOUND = "not_found"
+    ALREADY_EXISTS = "already_exists"
+    IS_A_DIRECTORY = "is_a_directory"
+    NOT_A_DIRECTORY = "not_a_directory"
+    PERMISSION_DENIED = "permission_denied"
+    OUTSIDE_SANDBOX = "outside_sandbox"
+    NOT_INDEXED = "not_indexed"
+    BINARY_FILE = "binary_file"
+    BATCH_REJECTED = "batch_rejected"
+    BATCH_FAILED = "batch_failed"
+    TIMEOUT = "timeout"
+    IO_ERROR = "io_error"
+    INTERNAL = "internal_error"
+
+
+class ToolError(Exception):
+    """
+    A failed tool call. The agent receives it as a JSON object with an
+    `error` code, a human-readable `message` and any extra details, so the
+    model can tell a missing file from a bad argument without parsing prose.
+    """
+    def __init__(self, code: ErrorCode, message: str, **details):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.details = details
+
+    def result(self) -> str:
+        return dumps({"error": str(self.code), "message": self.message, **self.details})
+
+
+_OS_ERROR_CODES = (
+    (FileNotFoundError, ErrorCode.NOT_FOUND),
+    (FileExistsError, ErrorCode.ALREADY_EXISTS),
+    (IsADirectoryError, ErrorCode.IS_A_DIRECTORY),
+    (NotADirectoryError, ErrorCode.NOT_A_DIRECTORY),
+    (PermissionError, ErrorCode.PERMISSION_DENIED),
+)
+
+
+def os_error(error: OSError) -> ToolError:
+    """Translates an OSError raised by a file operation into a ToolError."""
+    code = next((code for kind, code in _OS_ERROR_CODES if isinstance(error, kind)), ErrorCode.IO_ERROR)
+    message = f"{error.strerror or error}: {error.filename}" if error.filename else str(error)
+    return ToolError(code, message)
+
+
+def validation_error_result(error: ValidationError) -> str:
+    """Formats invalid tool arguments, one entry per offending field."""
+    fields = [
+        {"field": ".".join(str(part) for part in detail["loc"]) or "input", "problem": detail["msg"]}
+        for detail in error.errors(include_url=False)
+    ]
+    return ToolError(ErrorCode.INVALID_INPUT, "The tool arguments are invalid.", fields=fields).result()
+
+
+# --- Input ---
+
+class ToolInput(BaseModel):
+    """Base class of the tools' argument schemas. Unknown arguments are rejected, not ignored."""
+    model_config = ConfigDict(extra="forbid")
+
+
+def normalize_input(tool_input, schema):
+    """
+    Accepts the shapes models actually send besides plain arguments: a JSON
+    string, a bare string for the first argument, and the older
+    {"tool_input": ...} wrapper.
+    """
+    fields = schema.model_fields
+    if isinstance(tool_input, dict) and set(tool_input) == {"tool_input"} and "tool_input" not in fields:
+        tool_input = tool_input["tool_input"]
+    if isinstance(tool_input, str):
+        text = tool_input.strip()
+        if not text.startswith("{"):
+            return {next(iter(fields)): tool_input}
+        try:
+            tool_input = loads(text)
+        except ValueError as e:
+            raise ValidationError.from_exception_data(
+                schema.__name__,
+                [InitErrorDetails(type="json_invalid", loc=(), input=text, ctx={"error": str(e)})],
+            )
+    return tool_input
+
+
+# --- Paths ---
+
+@functools.lru_cache(maxsize=1024)
+def _absolute(path: str, cwd: str) -> str:
+    return os.path.normpath(os.path.join(cwd, os.path.expanduser(path)))
+
+
+@functools.lru_cache(maxsize=1)
+def _sandbox_roots():
+    if FILE_SANDBOX_ROOTS is None:
+        return None
+    return tuple(os.path.realpath(os.path.expanduser(root)) for root in FILE_SANDBOX_ROOTS)
+
+
+def resolve_path(path: str) -> str:
+    """
+    Returns the absolute path for a tool argument. Raises ToolError if it
+    lies outside FILE_SANDBOX_ROOTS. The string normalization is cached;
+    symlinks are resolved on every call, so the check follows the file
+    system as it is now.
+    """
+    full_path = _absolute(path, os.getcwd())
+    roots = _sandbox_roots()
+    if roots is not None:
+        real_path = os.path.realpath(full_path)
+        if not any(real_path == root or real_path.startswith(root.rstrip(os.sep) + os.sep) for root in roots):
+            raise ToolError(
+                ErrorCode.OUTSIDE_SANDBOX, f"{path} is outside the folders the agent may access.", path=path
+            )
+    return full_path
@@ -1,11 +1,20 @@
+import argparse
 import asyncio
+import importlib
+import os
+import threading
+import time
 import uuid  # <-- ADDED IMPORT
 from rich.console import Console
 from rich.panel import Panel
+from rich.table import Table
 
-# Correctly import ReactAgent
-from core.agent import ReactAgent
-from core.audio import AudioProcessor
+# Only the lightweight config is imported up front; the agent and audio
+# modules (LangChain, NumPy, sounddevice, ...) are imported in
+# run_voice_agent so --profile-startup can time them.
+_config_import_start = time.perf_counter()
+from core.config import PIPELINE_QUEUE_SIZE, STREAMING_RESPONSES, SERVER_HOST, SERVER_PORT
+_config_import_seconds = time.perf_counter() - _config_import_start
 
 # Set up the console (assuming a theme might be in your config)
 try:
@@ -15,53 +24,288 @@ except (ImportError, KeyError):
     console = Console()
 
 
-async def run_voice_agent():
+class StartupProfile:
+    """Records how long each import and initialization step takes at startup."""
+    def __init__(self):
+        self.timings = [("import core.config", _config_import_seconds)]
+
+    def measure(self, label, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.timings.append((label, time.perf_counter() - start))
+        return result
+
+    def report(self):
+        table = Table(title="Startup profile")
+        table.add_column("Step")
+        table.add_column("Time (ms)", justify="right")
+        for label, seconds in self.timings:
+            table.add_row(label, f"{seconds * 1000:.1f}")
+        table.add_row("[bold]Total[/bold]", f"[bold]{sum(s for _, s in self.timings) * 1000:.1f}[/bold]")
+        console.print(table)
+
+
+# --- PIPELINE STAGES ---
+# The voice turn is split into capture -> STT -> agent -> TTS -> playback.
+# Each stage runs as its own task and hands its output to the next one through
+# a bounded asyncio.Queue, so the next utterance can be captured and
+# transcribed while the previous reply is still being synthesized or played.
+# Every item carries the trace turn it belongs to (see core/tracing.py); the
+# agent stage ends each reply with a None segment that closes the turn once
+# it reaches playback.
+
+def _capture_worker(loop, audio_processor, tracer, utterances, stop_event):
+    """
+    Captures utterances in a daemon thread. Recording blocks on the microphone
+    and on `input()`, so it must not tie up the event loop or its executor.
+    """
+    while not stop_event.is_set():
+        turn = tracer.new_turn()
+        try:
+            with tracer.activate(turn):
+                recording = audio_processor.capture_audio()
+        except Exception as e:
+            console.print(f"[error]Audio capture failed: {e}[/error]")
+            continue
+        if recording is None:
+            continue
+        try:
+            # Block until the transcription stage has room (backpressure).
+            asyncio.run_coroutine_threadsafe(utterances.put((turn, recording)), loop).result()
+        except RuntimeError:
+            # The event loop has shut down.
+            recording.release()
+            return
+
+
+async def _run_stage(name, inbox, outbox, handler):
+    """
+    Generic stage loop: takes items from `inbox`, processes them with
+    `handler` and forwards non-empty results to `outbox`. A handler may also be
+    an async generator, in which case every item it yields is forwarded as
+    soon as it is produced.
+    """
+    while True:
+        item = await inbox.get()
+        try:
+            result = handler(item)
+            if hasattr(result, "__aiter__"):
+                async for output in result:
+                    if outbox is not None:
+                        await outbox.put(output)
+                continue
+            result = await result
+        except Exception as e:
+            console.print(f"[error]The {name} stage failed: {e}[/error]")
+            continue
+        if result is not None and outbox is not None:
+            await outbox.put(result)
+
+
+async def run_voice_agent(profile_startup: bool = False, session_id: str | None = None, umask: int | None = None):
     """
     The main asynchronous loop for the voice agent.
     """
-    # 1. Initialize the agent and audio processor
-    agent = ReactAgent()
-    audio_processor = AudioProcessor()
+    profile = StartupProfile()
+    connections = profile.measure("import core.connections", importlib.import_module, "core.connections")
+    ReactAgent = profile.measure("import core.agent", importlib.import_module, "core.agent").ReactAgent
+    AudioProcessor = profile.measure("import core.audio", importlib.import_module, "core.audio").AudioProcessor
+    from core.tracing import get_tracer
+    from core.streaming import run_ahead
+    if umask is not None:
+        importlib.import_module("core.file_batch").set_umask(umask)
+
+    # 1. Open connections to the remote services while everything else starts up
+    # (the transcriber warms its own connection or model in the background)
+    connections.prewarm(["openrouter", "elevenlabs"])
+    openrouter_warmup = asyncio.create_task(connections.aprewarm())  # keep a reference until it finishes
+
+    # Initialize the agent and audio processor
+    agent = profile.measure("ReactAgent()", ReactAgent)
+    audio_processor = profile.measure("AudioProcessor()", AudioProcessor)
+    if profile_startup:
+        # Build the lazily created parts now so they show up in the report.
+        profile.measure("ReactAgent.warm_up() (LangChain, LLM client, graph)", agent.warm_up)
+        profile.measure("ElevenLabs client", connections.get_elevenlabs_client)
+        profile.report()
+    else:
+        # Build the LLM client and agent graph while the user starts talking.
+        threading.Thread(target=agent.warm_up, daemon=True).start()
+
+    # 2. Create a unique thread ID for this conversation session, or resume a
+    # stored one
+    thread_id = session_id or str(uuid.uuid4())
 
-    # 2. Create a unique thread ID for this conversation session
-    thread_id = str(uuid.uuid4())
-    
     # 3. Print the welcome message with the session ID
     welcome_message = "🎙️ Voice Agent is ready! Press Ctrl+C to exit."
     console.print(Panel(welcome_message, title="Welcome", subtitle=f"Session ID: {thread_id}"))
 
+    utterances = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    user_messages = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    replies = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    clips = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    # With barge-in, talking over a reply interrupts it. Replies and clips are
+    # tagged with the barge-in generation they belong to, so the rest of an
+    # interrupted reply is dropped instead of synthesized and played.
+    barge_in = audio_processor.barge_in
+    tracer = get_tracer()
+
+    def current_generation():
+        return barge_in.generation if barge_in is not None else 0
+
+    def is_stale(generation):
+        return barge_in is not None and barge_in.is_stale(generation)
+
+    async def transcribe(item):
+        turn, recording = item
+        with tracer.activate(turn):
+            user_message = await asyncio.to_thread(audio_processor.transcribe, recording)
+        if not user_message.content or "try again" in user_message.content.lower():
+            console.print("[warning]Skipping empty or unclear audio.[/warning]")
+            tracer.finish(turn)
+            return None
+        return turn, user_message
+
+    async def respond(item):
+        turn, user_message = item
+        console.print("[thinking]Processing your request...[/thinking]")
+        generation = current_generation()
+
+        async def run_agent(emit):
+            with tracer.activate(turn):
+                # Traced on its own if the agent is still starting up.
+                await agent.awarm_up()
+            with tracer.activate(turn), tracer.span("agent", streaming=STREAMING_RESPONSES) as span:
+                if STREAMING_RESPONSES:
+                    # Each sentence goes to TTS as soon as the agent has
+                    # produced it. An interrupted turn still runs to the end,
+                    # so its history stays whole.
+                    async for segment in agent.stream_agent_response(user_message, thread_id=thread_id):
+                        span.attributes.setdefault("first_segment_ms", round((time.perf_counter() - span.start) * 1000, 1))
+                        emit(segment)
+                else:
+                    # 4. Pass the thread_id to the agent with each call
+                    emit((await agent.aget_agent_response(user_message, thread_id)).content)
+
+        # The agent runs ahead of synthesis and playback, so waiting for them
+        # doesn't count as agent time.
+        async for segment in run_ahead(run_agent):
+            if not is_stale(generation):
+                yield turn, generation, segment
+        yield turn, generation, None  # End of the reply.
+
+    async def synthesize(reply):
+        turn, generation, text = reply
+        if text is None:
+            return reply
+        if is_stale(generation):
+            return None
+        with tracer.activate(turn):
+            audio = await asyncio.to_thread(audio_processor.synthesize, text)
+        if audio is None:
+            return None
+        if is_stale(generation):
+            audio_processor.discard(audio)
+            return None
+        return turn, generation, audio
+
+    async def play(clip):
+        turn, generation, audio = clip
+        if audio is None:
+            tracer.finish(turn)
+            return
+        if is_stale(generation):
+            audio_processor.discard(audio)
+            return
+        with tracer.activate(turn):
+            await asyncio.to_thread(audio_processor.play_audio, audio, generation)
+
+    stop_event = threading.Event()
+    capture_thread = threading.Thread(
+        target=_capture_worker,
+        args=(asyncio.get_running_loop(), audio_processor, tracer, utterances, stop_event),
+        daemon=True,
+    )
+    capture_thread.start()
+    threading.Thread(target=audio_processor.prewarm_tts_cache, daemon=True).start()
+
     try:
-        while True:
-            try:
-                # Record and transcribe user input
-                user_message = audio_processor.record_audio()
-
-                if not user_message.content or "try again" in user_message.content.lower():
-                    console.print("[warning]Skipping empty or unclear audio.[/warning]")
-                    continue
-                
-                console.print("[thinking]Processing your request...[/thinking]")
-                
-                # 4. Pass the thread_id to the agent with each call
-                agent_response = agent.get_agent_response(user_message, thread_id=thread_id)
-                
-                # Speak the agent's response
-                audio_processor.speak_response(agent_response.content)
-
-            except KeyboardInterrupt:
-                # This allows gracefully exiting the loop with Ctrl+C
-                console.print("\n[bold cyan]Voice agent shutting down.[/bold cyan]")
-                break
-            except Exception as e:
-                console.print(f"[error]An unexpected error occurred: {e}[/error]")
-                continue
+        async with asyncio.TaskGroup() as stages:
+            stages.create_task(_run_stage("transcription", utterances, user_messages, transcribe))
+            stages.create_task(_run_stage("agent", user_messages, replies, respond))
+            stages.create_task(_run_stage("synthesis", replies, clips, synthesize))
+            stages.create_task(_run_stage("playback", clips, None, play))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        # This allows gracefully exiting the pipeline with Ctrl+C
+        console.print("\n[bold cyan]Voice agent shutting down.[/bold cyan]")
+        if audio_processor.tts_cache is not None:
+            stats = audio_processor.tts_cache.stats()
+            console.print(f"[system]TTS cache: {stats['hits']} hits, {stats['misses']} misses.[/system]")
+        if agent.response_cache is not None:
+            stats = agent.response_cache.stats()
+            console.print(f"[system]Response cache: {stats['hits']} hits, {stats['misses']} misses.[/system]")
+        if audio_processor.prefetcher is not None:
+            stats = audio_processor.prefetcher.stats()
+            console.print(f"[system]Prefetch: {stats['hits']} hits, {stats['misses']} misses.[/system]")
+        tracer.session_report()
+    finally:
+        stop_event.set()
+        tracer.close()
 
-    except KeyboardInterrupt:
-        # This handles a Ctrl+C pressed outside the recording input
-        console.print("\n[bold cyan]Voice agent shut down by user.[/bold cyan]")
+async def run_server(address: str, umask: int | None = None):
+    """Serves voice sessions over WebSocket instead of the local microphone."""
+    host, _, port = address.rpartition(":")
+    connections = importlib.import_module("core.connections")
+    VoiceServer = importlib.import_module("core.server").VoiceServer
+    from core.tracing import get_tracer
+    if umask is not None:
+        importlib.import_module("core.file_batch").set_umask(umask)
+
+    # Every session shares these connections, so open them all up front.
+    connections.prewarm()
+    openrouter_warmup = asyncio.create_task(connections.aprewarm())  # keep a reference until it finishes
+    server = VoiceServer()
+    threading.Thread(target=server.agent.warm_up, daemon=True).start()
+    threading.Thread(target=server.transcriber.warm_up, daemon=True).start()
+    threading.Thread(target=server.synthesizer.prewarm, daemon=True).start()
+    tracer = get_tracer()
+    try:
+        await server.serve(host or SERVER_HOST, int(port or SERVER_PORT))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        console.print("\n[bold cyan]Voice server shutting down.[/bold cyan]")
+        tracer.session_report()
+    finally:
+        tracer.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Voice-controlled file management agent.")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print how long each import and initialization step takes before starting",
+    )
+    parser.add_argument(
+        "--session",
+        metavar="ID",
+        help="resume a previous conversation by its session ID",
+    )
+    parser.add_argument(
+        "--serve",
+        nargs="?",
+        const=f"{SERVER_HOST}:{SERVER_PORT}",
+        metavar="HOST:PORT",
+        help="serve many voice sessions over WebSocket instead of using the local microphone",
+    )
+    args = parser.parse_args()
+    # os.umask can only be read by changing it, which is safe here, before
+    # any thread creates files (core/file_batch.py needs it without /proc).
+    umask = os.umask(0)
+    os.umask(umask)
     try:
-        asyncio.run(run_voice_agent())
+        if args.serve:
+            asyncio.run(run_server(args.serve, umask=umask))
+        else:
+            asyncio.run(run_voice_agent(profile_startup=args.profile_startup, session_id=args.session, umask=umask))
     except KeyboardInterrupt:
         pass